@@ -1,38 +1,31 @@
 import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 import asyncio
 import re
-import json
-from openai import OpenAI
-from dotenv import load_dotenv
 from config.logging_config import logger
 from agents.base_agent import BaseAgent
+from agents.llm_client import LLMClient, CircuitOpenError
 from data_processing.document_parser import extract_text_from_pdf
-from data_processing.ocr_helper import ocr_process_image
+from data_processing.ocr_helper import ocr_process_image, ocr_process_pdf
 from data_processing.confidence_scoring import compute_confidence_score
 from data_processing.rag_helper import InvoiceRAGIndex
+from data_processing.prompt_preparation import compact_invoice_text
+from data_processing.extraction_cache import ExtractionCache
 from models.invoice import InvoiceData
+from config.monitoring import Deadline, DeadlineExceeded
+from config.settings import (
+    PDF_FIRST_PAGES, PDF_LAST_PAGES, LLM_TIMEOUT_SECONDS, EXTRACTION_CACHE_ENABLED, EXTRACTION_CACHE_NEAR_PENALTY
+)
 from decimal import Decimal
 from datetime import datetime
 
-# Add requirements for OpenAI
-try:
-    import openai
-except ImportError:
-    logger.error("Required packages not found. Please run: pip install openai python-dotenv")
-    raise
-
-load_dotenv()  # Load environment variables from .env
-
-# Check for required environment variables
-api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    logger.error("OPENAI_API_KEY not found in environment variables. Please ensure it is set in .env file")
-    raise ValueError("OPENAI_API_KEY environment variable is required")
-
-client = OpenAI(api_key=api_key)
+INVOICE_INDICATORS = ["invoice", "bill", "total", "amount", "date", "payment"]
+# The document's own total, for stopping PDF parsing early. Stricter than the regex tool's pattern:
+# subtotals ("Subtotal:", "Sub Total:") and line-item "Amount:" columns do not count.
+INVOICE_TOTAL = re.compile(r"(?i)(?<!sub )(?<!sub-)\b(?:total(?:\s+(?:amount|due|payable))?|amount\s+due|balance\s+due)"
+                           r"\s*:\s*[£$€]?\s*\d")
 
 class InvoiceExtractionTool:
     """A simple tool to extract structured invoice data as a fallback."""
@@ -56,11 +49,11 @@ class InvoiceExtractionTool:
         """Extracts fields with individual confidence scores."""
         # Define regex patterns for key fields
         patterns = {
-            "vendor_name": r"(?i)(?:vendor|supplier|from):\s*([A-Za-z0-9\s.,&-]+)",
+            "vendor_name": r"(?i)(?:vendor|supplier|from):[ \t]*([A-Za-z0-9 \t.,&-]+)",
             "invoice_number": r"(?i)(?:invoice\s*(?:#|no|number)):\s*([A-Za-z0-9-]+)",
             "invoice_date": r"(?i)(?:date|issued):\s*(\d{4}-\d{2}-\d{2}|\d{2}/\d{2}/\d{4})",
             "total_amount": r"(?i)(?:total|amount|sum):\s*[£$]?\s*(\d+(?:,\d{3})*(?:\.\d{2})?)",
-            "po_number": r"(?i)(?:po|purchase\s*order)\s*(?:#|no|number)?:\s*([A-Za-z0-9-]+)"
+            "po_number": r"(?i)(?:po|purchase\s*order)\s*(?:#|no|number)?:\s*([A-Za-z0-9_-]+)"
         }
 
         results = {}
@@ -100,15 +93,57 @@ class InvoiceExtractionAgent(BaseAgent):
         super().__init__()
         self.tools = [InvoiceExtractionTool()]
         self.rag_index = InvoiceRAGIndex()
+        self.llm = LLMClient()
+        self.response_cache = ExtractionCache() if EXTRACTION_CACHE_ENABLED else None
+
+    def _regex_extraction(self, invoice_text: str) -> Dict:
+        """Degraded mode: the regex tool's fields, with dates normalised to ISO for InvoiceData."""
+        extracted_data = self.tools[0]._extract_fields(invoice_text)
+        date_field = extracted_data["invoice_date"]
+        for fmt in ("%Y-%m-%d", "%d/%m/%Y"):
+            try:
+                date_field["value"] = datetime.strptime(date_field["value"], fmt).date().isoformat()
+                break
+            except ValueError:
+                continue
+        else:
+            date_field.update(value=datetime.now().date().isoformat(), confidence=0.1)
+        extracted_data["total_amount"]["value"] = extracted_data["total_amount"]["value"].replace(",", "")
+        return extracted_data
+
+    def _extraction_complete(self, text: str) -> bool:
+        """True once the text looks like an invoice and its number and final total can already be found."""
+        text_lower = text.lower()
+        if not any(indicator in text_lower for indicator in INVOICE_INDICATORS):
+            return False
+        fields = self.tools[0]._extract_fields(text)
+        return bool(fields["invoice_number"]["value"] and INVOICE_TOTAL.search(text))
 
-    async def run(self, document_path: str) -> InvoiceData:
+    async def run(self, document_path: str, deadline: Optional[Deadline] = None) -> InvoiceData:
         logger.info(f"Processing document: {document_path}")
+        deadline = deadline or Deadline(None)
         try:
-            # Extract text from document
+            ocr_pages = None
+            # Extract text from document in a thread, so a deadline can cancel the wait. The thread itself
+            # only stops at the next page boundary (Tesseract is killed), so one page may still finish
+            # after the invoice was routed as timed out
             if document_path.lower().endswith(".pdf"):
-                invoice_text = extract_text_from_pdf(document_path)
+                invoice_text = await asyncio.to_thread(extract_text_from_pdf, document_path,
+                                                       first_pages=PDF_FIRST_PAGES, last_pages=PDF_LAST_PAGES,
+                                                       stop_when=self._extraction_complete, deadline=deadline)
+                if not invoice_text.strip():
+                    # No text layer (scanned or poor-quality PDF): fall back to OCR
+                    deadline.check("ocr")
+                    try:
+                        ocr_result = await asyncio.to_thread(ocr_process_pdf, document_path, deadline=deadline)
+                        invoice_text = ocr_result["text"]
+                        ocr_pages = ocr_result["pages"]
+                    except DeadlineExceeded:
+                        raise
+                    except Exception as e:
+                        logger.warning(f"OCR fallback failed for {document_path}: {str(e)}")
             else:
-                invoice_text = ocr_process_image(document_path)
+                invoice_text = await asyncio.to_thread(ocr_process_image, document_path, deadline)
 
             # Handle empty or unreadable files
             if not invoice_text.strip():
@@ -124,9 +159,8 @@ class InvoiceExtractionAgent(BaseAgent):
                 )
 
             # Initial check for invoice-like content
-            invoice_indicators = ["invoice", "bill", "total", "amount", "date", "payment"]
             text_lower = invoice_text.lower()
-            if not any(indicator in text_lower for indicator in invoice_indicators):
+            if not any(indicator in text_lower for indicator in INVOICE_INDICATORS):
                 logger.warning(f"Document {document_path} does not appear to be an invoice")
                 return InvoiceData(
                     vendor_name="Unknown",
@@ -139,31 +173,52 @@ class InvoiceExtractionAgent(BaseAgent):
                 )
 
             # Check RAG for similar invoices
-            rag_result = self.rag_index.classify_invoice(invoice_text)
+            rag_result = await asyncio.to_thread(self.rag_index.classify_invoice, invoice_text)
             rag_confidence_penalty = 0.2 if rag_result['status'] == 'similar_error' else 0.0
             if rag_result['status'] == 'similar_error':
                 logger.warning(f"Invoice similar to known error: {rag_result['matched_invoice_id']}")
 
+            extraction_mode = "llm"
+            tokens = {"prompt_tokens": None, "completion_tokens": None}
+            # Re-sends and reprints of an already extracted invoice reuse its fields
+            cached = self.response_cache.lookup(invoice_text) if self.response_cache else None
             try:
-                # Use OpenAI API to extract fields
-                response = client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    messages=[
-                        {"role": "system", "content": "Extract the following fields from the invoice text and return them in JSON format: vendor_name, invoice_number, invoice_date, total_amount. Convert any amounts to GBP if not already in GBP. Ensure total_amount is a numeric string without currency symbols. Always set currency field to 'GBP'."},
-                        {"role": "user", "content": invoice_text}
-                    ],
-                    response_format={"type": "json_object"}
-                )
-                json_data = json.loads(response.choices[0].message.content)
-                
-                # Create structured data with confidence scores for each field
-                extracted_data = {
-                    "vendor_name": {"value": json_data.get("vendor_name", ""), "confidence": 0.95},
-                    "invoice_number": {"value": json_data.get("invoice_number", ""), "confidence": 0.95},
-                    "invoice_date": {"value": json_data.get("invoice_date", ""), "confidence": 0.95},
-                    "total_amount": {"value": json_data.get("total_amount", ""), "confidence": 0.95},
-                    "currency": {"value": "GBP", "confidence": 1.0}
-                }
+                deadline.check("extraction")
+                try:
+                    if cached:
+                        logger.info(f"Reusing cached extraction for {document_path} ({cached['match']} match)")
+                        extraction_mode = f"cache_{cached['match']}"
+                        json_data = cached["fields"]
+                    else:
+                        # Only the lines the prompt asks about are sent (no item tables or footers)
+                        prompt = compact_invoice_text(invoice_text)
+                        logger.debug(f"Prompt for {document_path}: {prompt['prompt_chars']} of {prompt['raw_chars']} characters")
+                        # Use OpenAI API to extract fields
+                        json_data, tokens = await self.llm.complete_json(
+                            timeout=deadline.cap(LLM_TIMEOUT_SECONDS),
+                            messages=[
+                                {"role": "system", "content": "Extract the following fields from the invoice text and return them in JSON format: vendor_name, invoice_number, invoice_date, total_amount, po_number (the purchase order reference, or null if none is quoted). Convert any amounts to GBP if not already in GBP. Ensure total_amount is a numeric string without currency symbols. Always set currency field to 'GBP'."},
+                                {"role": "user", "content": prompt["text"]}
+                            ]
+                        )
+
+                    # Create structured data with confidence scores for each field
+                    extracted_data = {
+                        "vendor_name": {"value": json_data.get("vendor_name", ""), "confidence": 0.95},
+                        "invoice_number": {"value": json_data.get("invoice_number", ""), "confidence": 0.95},
+                        "invoice_date": {"value": json_data.get("invoice_date", ""), "confidence": 0.95},
+                        "total_amount": {"value": json_data.get("total_amount", ""), "confidence": 0.95},
+                        "currency": {"value": "GBP", "confidence": 1.0}
+                    }
+                    # Kept out of confidence scoring: most invoices legitimately carry no PO
+                    po_number = json_data.get("po_number") or self.tools[0]._extract_fields(invoice_text)["po_number"]["value"]
+                except CircuitOpenError:
+                    # Provider is down: don't wait on it, extract with the regex tool instead
+                    logger.info(f"LLM circuit open, using regex extraction for {document_path}")
+                    extraction_mode = "regex_fallback"
+                    extracted_data = self._regex_extraction(invoice_text)
+                    po_number = extracted_data.pop("po_number")["value"]
+                po_number = str(po_number) if po_number else None
 
                 # Clean total amount
                 if extracted_data["total_amount"]["value"]:
@@ -175,6 +230,9 @@ class InvoiceExtractionAgent(BaseAgent):
 
                 # Compute confidence score based on field presence and quality
                 confidence = compute_confidence_score(extracted_data)
+                if extraction_mode == "cache_near":
+                    # Same invoice by fingerprint, but not the same text
+                    confidence = max(0.1, confidence - EXTRACTION_CACHE_NEAR_PENALTY)
                 
                 # Apply RAG penalty if similar to problematic invoices
                 if rag_confidence_penalty:
@@ -190,8 +248,17 @@ class InvoiceExtractionAgent(BaseAgent):
                 else:
                     review_status = "pending"
                     error_message = None
+                if extraction_mode == "regex_fallback":
+                    error_message = error_message or "Extracted in degraded mode (LLM unavailable)"
+                elif extraction_mode == "llm" and review_status == "pending" and self.response_cache:
+                    # Only confident extractions are worth reusing
+                    self.response_cache.put(invoice_text, json_data)
 
+            except DeadlineExceeded:
+                raise
             except Exception as e:
+                if deadline.expired():
+                    raise DeadlineExceeded("extraction", deadline) from e
                 logger.warning(f"Extraction failed: {str(e)}. Using fallback values.")
                 extracted_data = {
                     "vendor_name": {"value": "Unknown", "confidence": 0.1},
@@ -203,6 +270,8 @@ class InvoiceExtractionAgent(BaseAgent):
                 confidence = 0.1  # Low confidence for failed extractions
                 review_status = "needs_review"
                 error_message = f"Extraction failed: {str(e)}"
+                po_number = None
+                extraction_mode = "failed"
 
             # Create InvoiceData instance with computed values
             invoice_data = InvoiceData(
@@ -213,11 +282,17 @@ class InvoiceExtractionAgent(BaseAgent):
                 confidence=confidence,
                 review_status=review_status,
                 error_message=error_message,
-                currency="GBP"
+                currency="GBP",
+                po_number=po_number,
+                ocr_pages=ocr_pages,
+                extraction_mode=extraction_mode,
+                **tokens
             )
             logger.info(f"Extraction completed with confidence {confidence}")
             return invoice_data
 
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             logger.error(f"Critical error during extraction: {str(e)}", exc_info=True)
             return InvoiceData(
@@ -6,6 +6,7 @@ import logging
 import asyncio
 from datetime import datetime
 from config.logging_config import logger
+from config.settings import REVIEW_CONFIDENCE_THRESHOLD
 from agents.base_agent import BaseAgent
 from models.invoice import InvoiceData
 from models.validation_schema import ValidationResult
@@ -13,7 +14,7 @@ from models.validation_schema import ValidationResult
 class HumanReviewAgent(BaseAgent):
     def __init__(self):
         super().__init__()
-        self.confidence_threshold = 0.9  # Align with new standardized threshold
+        self.confidence_threshold = REVIEW_CONFIDENCE_THRESHOLD
 
     async def run(self, invoice_data: InvoiceData, validation_result: ValidationResult) -> dict:
         logger.info(f"Reviewing invoice: {invoice_data.invoice_number}")
@@ -0,0 +1,230 @@
+# /agents/llm_client.py
+# OpenAI chat client for field extraction, guarded by a circuit breaker, with optional hedging.
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+from dotenv import load_dotenv
+from config.logging_config import logger
+from config.settings import (
+    LLM_MODEL, LLM_TIMEOUT_SECONDS, LLM_BREAKER_FAILURES, LLM_BREAKER_RESET_SECONDS, LLM_BREAKER_PROBES,
+    LLM_HEDGE_ENABLED, LLM_HEDGE_PERCENTILE, LLM_HEDGE_MAX_RATE, LLM_LATENCY_WINDOW, LLM_HEDGE_MIN_SAMPLES
+)
+
+try:
+    from openai import AsyncOpenAI, APITimeoutError
+except ImportError:
+    logger.error("Required packages not found. Please run: pip install openai python-dotenv")
+    raise
+
+load_dotenv()  # Load environment variables from .env
+
+
+class CircuitOpenError(Exception):
+    """The LLM provider is considered down; the request was not sent."""
+
+
+class CircuitBreaker:
+    """Closed -> open after `failure_threshold` consecutive failures; open -> half-open after
+    `reset_timeout` seconds, when up to `half_open_probes` requests are let through. A successful
+    probe closes the circuit, a failed one opens it again for another `reset_timeout`."""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = LLM_BREAKER_FAILURES, reset_timeout: float = LLM_BREAKER_RESET_SECONDS,
+                 half_open_probes: int = LLM_BREAKER_PROBES):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = max(1, half_open_probes)
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probes_in_flight = 0
+        self._lock = threading.Lock()
+        self.stats = {"opened": 0, "rejected": 0, "failures": 0, "successes": 0}
+        self.last_opened: Optional[str] = None
+
+    def allow(self) -> bool:
+        """Whether a request may be sent now; a True in half-open state reserves a probe slot."""
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probes_in_flight = 0
+                logger.info("LLM circuit half-open: sending probe requests")
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and self._probes_in_flight < self.half_open_probes:
+                self._probes_in_flight += 1
+                return True
+            self.stats["rejected"] += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.stats["successes"] += 1
+            self.consecutive_failures = 0
+            if self.state != self.CLOSED:
+                logger.info("LLM circuit closed: provider is responding again")
+            self.state = self.CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self.stats["failures"] += 1
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.stats["opened"] += 1
+                    self.last_opened = datetime.now().isoformat()
+                    logger.warning(f"LLM circuit open after {self.consecutive_failures} consecutive failures; "
+                                   f"using regex extraction for {self.reset_timeout}s")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def release_probe(self):
+        """A half-open request finished without a verdict (e.g. it was cancelled)."""
+        with self._lock:
+            if self.state == self.HALF_OPEN and self._probes_in_flight:
+                self._probes_in_flight -= 1
+
+    def status(self) -> Dict[str, Any]:
+        return {"state": self.state, "consecutive_failures": self.consecutive_failures,
+                "last_opened": self.last_opened, **self.stats}
+
+
+class LLMClient:
+    """JSON-mode chat completions through one AsyncOpenAI client and a shared circuit breaker.
+
+    While the circuit is open `complete_json` raises CircuitOpenError immediately instead of waiting
+    for a provider that is failing, so callers can switch to their degraded path.
+
+    With hedging enabled, a request still unanswered after the `hedge_percentile` latency of recent
+    requests is sent a second time; the first successful reply wins and the other is cancelled.
+    At most `hedge_max_rate` of all requests are hedged, which bounds the extra provider load.
+    """
+
+    def __init__(self, client: Optional[AsyncOpenAI] = None, model: str = LLM_MODEL,
+                 breaker: Optional[CircuitBreaker] = None, hedge: bool = LLM_HEDGE_ENABLED,
+                 hedge_percentile: float = LLM_HEDGE_PERCENTILE, hedge_max_rate: float = LLM_HEDGE_MAX_RATE):
+        if client is None:
+            api_key = os.getenv("OPENAI_API_KEY")
+            if not api_key:
+                logger.error("OPENAI_API_KEY not found in environment variables. Please ensure it is set in .env file")
+                raise ValueError("OPENAI_API_KEY environment variable is required")
+            # Async so a request can be cancelled when the invoice's deadline runs out. The SDK's own
+            # retries are off: the workflow retries within the deadline, and each attempt is seen by the breaker
+            client = AsyncOpenAI(api_key=api_key, timeout=LLM_TIMEOUT_SECONDS, max_retries=0)
+        self.client = client
+        self.model = model
+        self.breaker = breaker or CircuitBreaker()
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_max_rate = hedge_max_rate
+        self.latencies = deque(maxlen=LLM_LATENCY_WINDOW)  # seconds, successful requests only
+        self.hedge_stats = {"requests": 0, "hedged": 0, "hedge_wins": 0, "primary_wins": 0, "budget_skipped": 0}
+
+    def hedge_delay(self) -> Optional[float]:
+        """Latency percentile after which a request is hedged; None until there is enough history."""
+        if not self.hedge or len(self.latencies) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.hedge_percentile / 100.0))]
+
+    async def _create(self, messages: List[Dict[str, str]], timeout: float, record_latency: bool = True):
+        started = time.monotonic()
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            response_format={"type": "json_object"},
+            timeout=timeout
+        )
+        if record_latency:
+            self.latencies.append(time.monotonic() - started)
+        return response
+
+    async def _hedged_create(self, messages: List[Dict[str, str]], timeout: float):
+        self.hedge_stats["requests"] += 1
+        delay = self.hedge_delay()
+        if delay is None or delay >= timeout:
+            return await self._create(messages, timeout)
+        # One latency sample per logical request, measured from the primary's start: recording each
+        # attempt would drop the slow (cancelled) primaries and pull the hedge delay down over time
+        started = time.monotonic()
+        tasks = [asyncio.ensure_future(self._create(messages, timeout, record_latency=False))]
+        try:
+            response = await self._first_response(tasks, messages, timeout, delay)
+            self.latencies.append(time.monotonic() - started)
+            return response
+        finally:
+            # The losing request (or both, if the caller was cancelled) is abandoned
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def _first_response(self, tasks: list, messages: List[Dict[str, str]], timeout: float, delay: float):
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done:
+            return tasks[0].result()
+        if self.hedge_stats["hedged"] >= self.hedge_max_rate * self.hedge_stats["requests"]:
+            self.hedge_stats["budget_skipped"] += 1
+            return await tasks[0]
+        self.hedge_stats["hedged"] += 1
+        logger.debug(f"LLM request slower than {delay:.2f}s, sending hedge request")
+        tasks.append(asyncio.ensure_future(self._create(messages, timeout - delay, record_latency=False)))
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    self.hedge_stats["hedge_wins" if task is tasks[1] else "primary_wins"] += 1
+                    return task.result()
+        tasks[1].exception()  # both failed: surface the primary's error
+        return tasks[0].result()
+
+    def hedge_status(self) -> Dict[str, Any]:
+        delay = self.hedge_delay()
+        return {"enabled": self.hedge, "delay_seconds": round(delay, 3) if delay is not None else None,
+                "latency_samples": len(self.latencies), **self.hedge_stats}
+
+    async def complete_json(self, messages: List[Dict[str, str]],
+                            timeout: float = LLM_TIMEOUT_SECONDS) -> Tuple[Dict[str, Any], Dict[str, Optional[int]]]:
+        """Parsed JSON reply and the token usage reported for it.
+
+        A timeout shorter than LLM_TIMEOUT_SECONDS was cut down by the caller's deadline; running
+        out of it says nothing about the provider, so it does not count toward the breaker.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError("LLM circuit is open")
+        verdict = False
+        try:
+            # Probes while half-open go out alone; duplicating them would only add load to a recovering provider
+            if self.hedge and self.breaker.state == CircuitBreaker.CLOSED:
+                response = await self._hedged_create(messages, timeout)
+            else:
+                response = await self._create(messages, timeout)
+            verdict = True
+            self.breaker.record_success()
+        except (APITimeoutError, asyncio.TimeoutError):
+            if timeout < LLM_TIMEOUT_SECONDS:
+                raise
+            verdict = True
+            self.breaker.record_failure()
+            raise
+        except Exception:
+            verdict = True
+            self.breaker.record_failure()
+            raise
+        finally:
+            if not verdict:
+                self.breaker.release_probe()
+        usage = getattr(response, "usage", None)
+        tokens = {"prompt_tokens": getattr(usage, "prompt_tokens", None),
+                  "completion_tokens": getattr(usage, "completion_tokens", None)}
+        # A malformed reply is the model's fault, not an outage; it does not trip the breaker
+        return json.loads(response.choices[0].message.content), tokens
@@ -0,0 +1,77 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import math
+import threading
+from typing import Dict, Any, Optional
+from config.logging_config import logger
+from config.settings import (
+    ADMISSION_MAX_IN_FLIGHT, ADMISSION_MAX_QUEUE_DEPTH, ADMISSION_RETRY_AFTER_SECONDS
+)
+
+
+class Rejection:
+    """Why a request was turned away and when the client should try again."""
+
+    def __init__(self, status_code: int, reason: str, retry_after: int):
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Bounds the upload work the API accepts.
+
+    Requests are admitted before their body is read. Too many concurrent uploads get 429 (the
+    client should slow down); a processing backlog above `max_queue_depth` gets 503 with a
+    Retry-After estimated from how long the workers need to drain the excess.
+    """
+
+    def __init__(self, scheduler, max_in_flight: int = ADMISSION_MAX_IN_FLIGHT,
+                 max_queue_depth: int = ADMISSION_MAX_QUEUE_DEPTH,
+                 retry_after: int = ADMISSION_RETRY_AFTER_SECONDS):
+        self.scheduler = scheduler
+        self.max_in_flight = max_in_flight
+        self.max_queue_depth = max_queue_depth
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {"in_flight": 0, "queue_depth": 0}
+        self._lock = threading.Lock()
+
+    def _drain_seconds(self, depth: int) -> int:
+        excess = depth - self.max_queue_depth + 1
+        per_job = self.scheduler.avg_job_seconds or self.retry_after
+        return max(self.retry_after, math.ceil(excess * per_job / max(self.scheduler.workers, 1)))
+
+    def try_admit(self) -> Optional[Rejection]:
+        """Reserve an in-flight slot; returns None when admitted (call `release` when done)."""
+        depth = self.scheduler.depth()
+        with self._lock:
+            if self.max_in_flight and self.in_flight >= self.max_in_flight:
+                self.rejected["in_flight"] += 1
+                rejection = Rejection(429, f"Too many uploads in progress ({self.in_flight})", self.retry_after)
+            elif self.max_queue_depth and depth >= self.max_queue_depth:
+                self.rejected["queue_depth"] += 1
+                rejection = Rejection(503, f"Processing queue is full ({depth} documents waiting)",
+                                      self._drain_seconds(depth))
+            else:
+                self.in_flight += 1
+                self.admitted += 1
+                return None
+        logger.warning(f"Rejected upload: {rejection.reason}; retry after {rejection.retry_after}s")
+        return rejection
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queue_depth": self.scheduler.depth(),
+            "max_queue_depth": self.max_queue_depth,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected)
+        }
@@ -7,7 +7,9 @@ print("os imported")
 load_dotenv()  # Load environment variables from .env
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 print("Path adjusted")
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request
+from pydantic import BaseModel
+from typing import List, Optional
 print("FastAPI imported")
 from workflows.orchestrator import InvoiceProcessingWorkflow
 print("Workflow imported")
@@ -20,11 +22,21 @@ print("uuid imported")
 import logging
 print("logging imported")
 from glob import glob  # added for process_all_invoices endpoint
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse
 import shutil
 import atexit
+import asyncio
+import zipfile
 from datetime import datetime  # Add datetime import
-from api.review_api import router as review_router
+from api.review_api import router as review_router, register_correction_listener, edited_fields, \
+    is_correction, record_correction
+from data_processing.columnar_export import InvoiceSnapshotExporter
+from workflows.scheduler import ProcessingScheduler
+from workflows.watcher import InvoiceDirectoryWatcher
+from api.admission import AdmissionController
+from data_processing.document_store import document_suffix
+from data_processing.po_matcher import rematch_invoices
+from config.settings import WATCH_RAW_INVOICES, BULK_MAX_FILES
 
 logger = logging.getLogger("InvoiceProcessing")
 
@@ -32,6 +44,44 @@ app = FastAPI(title="Brim Invoice Processing API")
 print("App created")
 workflow = InvoiceProcessingWorkflow()
 print("Workflow instance created")
+register_correction_listener(workflow.correction_indexer.submit)
+
+def invalidate_cached_extraction(correction: dict):
+    """A corrected invoice must not be served from the extraction cache again."""
+    if workflow.extraction_agent.response_cache:
+        workflow.extraction_agent.response_cache.invalidate(correction.get("invoice_id"))
+
+# Both edit paths (PUT /api/invoices/{n} and PUT /review/invoices/{n}) report field changes here
+register_correction_listener(invalidate_cached_extraction)
+scheduler = ProcessingScheduler(workflow)
+watcher = InvoiceDirectoryWatcher(scheduler, document_store=workflow.document_store)
+admission = AdmissionController(scheduler)
+# Endpoints that accept documents; admitted (or rejected) before the upload body is read
+ADMISSION_PATHS = ("/api/upload_invoice", "/api/upload_batch")
+
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    if request.method != "POST" or request.url.path not in ADMISSION_PATHS:
+        return await call_next(request)
+    rejection = admission.try_admit()
+    if rejection is not None:
+        return JSONResponse(status_code=rejection.status_code, content={"detail": rejection.reason},
+                            headers={"Retry-After": str(rejection.retry_after)})
+    try:
+        return await call_next(request)
+    finally:
+        admission.release()
+
+@app.on_event("startup")
+async def start_background_processing():
+    scheduler.start()
+    if WATCH_RAW_INVOICES:
+        watcher.start()
+
+@app.on_event("shutdown")
+async def stop_background_processing():
+    watcher.stop()
+    await scheduler.stop()
 
 @app.get("/")
 async def root():
@@ -39,94 +89,111 @@ async def root():
 
 OUTPUT_FILE = Path("data/processed/structured_invoices.json")
 
-def save_invoice(invoice_entry, output_file="data/processed/structured_invoices.json"):
-    """Save extracted invoice data to JSON, preserving existing entries."""
-    os.makedirs(os.path.dirname(output_file), exist_ok=True)
-    try:
-        if os.path.exists(output_file):
-            with open(output_file, 'r') as f:
-                all_invoices = json.load(f)
-        else:
-            all_invoices = []
-    except json.JSONDecodeError:
-        logger.warning(f"Invalid JSON in {output_file}, starting fresh")
-        all_invoices = []
-    
-    # Update existing entry or add new one
-    invoice_number = invoice_entry.get("invoice_number")
-    if invoice_number:
-        # Look for existing entry to update
-        for i, inv in enumerate(all_invoices):
-            if inv.get("invoice_number") == invoice_number:
-                all_invoices[i] = invoice_entry
-                break
-        else:
-            # No existing entry found, append new one
-            all_invoices.append(invoice_entry)
-    else:
-        # No invoice number, just append
-        all_invoices.append(invoice_entry)
-    
-    # Write updated data
-    with open(output_file, 'w') as f:
-        json.dump(all_invoices, f, indent=4)
-    logger.info(f"Saved invoice data to {output_file}")
+def save_invoice(invoice_entry):
+    """Save extracted invoice data, replacing any existing entry with the same number."""
+    if not invoice_entry.get("invoice_number"):
+        invoice_entry["invoice_number"] = f"TEMP_{uuid.uuid4()}"
+    workflow.invoice_store.commit(invoice_entry, flush=True)
+    logger.info(f"Saved invoice data to {OUTPUT_FILE}")
 
 @app.post("/api/upload_invoice")
 async def upload_invoice(file: UploadFile = File(...)):
     """Process an uploaded invoice PDF and save it."""
     try:
-        temp_path = Path(f"data/temp/{uuid.uuid4()}.pdf")
-        temp_path.parent.mkdir(exist_ok=True)
-        with open(temp_path, "wb") as f:
-            f.write(await file.read())
-        result = await workflow.process_invoice(str(temp_path))
-        return result
+        # Streamed to content-addressed storage; the stored file is kept as the invoice original
+        stored = await workflow.document_store.save_upload(file)
+        # Interactive lane: starts ahead of (and never waits behind) bulk runs
+        job = scheduler.submit(stored["path"], source="upload", filename=file.filename, lane="interactive")
+        return await job["future"]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing invoice: {str(e)}")
-    finally:
-        if temp_path.exists():
-            temp_path.unlink()
+
+@app.post("/api/upload_batch")
+async def upload_batch(files: List[UploadFile] = File(...)):
+    """Store many invoices (PDFs, images or ZIP archives of them) and process them in the background.
+
+    Returns a batch id to poll at /api/batches/{batch_id}.
+    """
+    documents, skipped = [], []
+    try:
+        for upload in files:
+            filename = upload.filename or ""
+            if filename.lower().endswith(".zip"):
+                # UploadFile spools large bodies to disk, so members are read from there lazily
+                stored, archive_skipped = await asyncio.to_thread(workflow.document_store.save_archive, upload.file)
+                documents.extend(stored)
+                skipped.extend(archive_skipped)
+            elif document_suffix(filename):
+                stored = await workflow.document_store.save_upload(upload, document_suffix(filename))
+                documents.append({**stored, "filename": filename})
+            else:
+                skipped.append({"filename": filename, "reason": "unsupported file type"})
+            if len(documents) > BULK_MAX_FILES:
+                raise HTTPException(status_code=413, detail=f"At most {BULK_MAX_FILES} documents per batch")
+    except HTTPException:
+        raise
+    except zipfile.BadZipFile as e:
+        raise HTTPException(status_code=400, detail=f"Invalid ZIP archive: {str(e)}")
+    except Exception as e:
+        logger.error(f"Error storing batch upload: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error storing uploads: {str(e)}")
+
+    if not documents:
+        raise HTTPException(status_code=400, detail="No invoice documents found in upload")
+    batch = scheduler.submit_batch(documents, source="bulk")
+    return {"batch_id": batch["batch_id"], "queued": batch["total"], "skipped": skipped}
+
+@app.get("/api/batches/{batch_id}")
+async def get_batch(batch_id: str):
+    """Progress of a bulk upload."""
+    batch = scheduler.batch_status(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail=f"Batch {batch_id} not found")
+    return batch
 
 @app.get("/api/invoices")
 async def get_invoices():
     """Fetch all processed invoices."""
     try:
-        if not OUTPUT_FILE.exists():
-            logger.info("Structured invoices file not found, returning empty list")
-            return []
-        with OUTPUT_FILE.open("r") as f:
-            data = json.load(f)
-            # Ensure timing fields exist and are non-zero if processing happened
-            for invoice in data:
-                for timing_field in ["extraction_time", "validation_time", "matching_time", "review_time", "total_time"]:
-                    invoice[timing_field] = float(invoice.get(timing_field, 0.0) or 0.0)
-            logger.info(f"Successfully loaded {len(data)} invoices")
-            return data
-    except json.JSONDecodeError as e:
-        logger.error(f"JSON decode error: {str(e)}")
-        return []
+        # Includes invoices still in the pipeline, showing their latest stage
+        data = workflow.invoice_store.all()
+        # Ensure timing fields exist and are non-zero if processing happened
+        for invoice in data:
+            for timing_field in ["extraction_time", "validation_time", "matching_time", "review_time", "total_time"]:
+                invoice[timing_field] = float(invoice.get(timing_field, 0.0) or 0.0)
+        logger.info(f"Successfully loaded {len(data)} invoices")
+        return data
     except Exception as e:
         logger.error(f"Error fetching invoices: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Failed to fetch invoices: {str(e)}")
 
 @app.get("/api/process_all_invoices")
-async def process_all_invoices():
-    """Process all invoice PDFs and save results."""
+async def process_all_invoices(force: bool = False):
+    """Process invoice documents in data/raw/invoices that have not been processed yet and save
+    results; `force` reprocesses every PDF there."""
     try:
-        invoice_files = glob("data/raw/invoices/*.pdf")
-        results = []
-        for file in invoice_files:
-            try:
-                result = await workflow.process_invoice(file)
-                # Removed PDF copying to data/processed
-                results.append(result)
-            except Exception as e:
-                logger.error(f"Failed to process {file}: {str(e)}")
-                continue
+        if force:
+            documents = [{"path": file} for file in glob("data/raw/invoices/*.pdf")]
+        else:
+            # Only new or changed files are hashed; content already processed (here or uploaded) is skipped
+            documents = await asyncio.to_thread(watcher.unprocessed_documents)
+        if not documents:
+            return {"message": "No new invoices to process"}
+        batch = scheduler.submit_batch(documents, source="process_all", lane="bulk")
+        jobs = [scheduler.jobs[job["job_id"]] for job in batch["jobs"]]
+        for job, document in zip(jobs, documents):
+            if document.get("digest"):
+                job["future"].add_done_callback(watcher.track(document["digest"]))
+        outcomes = await asyncio.gather(*(job["future"] for job in jobs), return_exceptions=True)
+        # Failures are logged by the scheduler
+        results = [outcome for outcome in outcomes if not isinstance(outcome, Exception)]
         
         if results:
             logger.info(f"Successfully processed {len(results)} invoices")
+            try:
+                InvoiceSnapshotExporter().export(mode="append", records=workflow.invoice_store.committed())
+            except Exception as e:
+                logger.warning(f"Failed to append batch to analytics snapshot: {str(e)}")
             return {"message": f"Processed {len(results)} invoices"}
         else:
             logger.warning("No invoices were processed successfully")
@@ -139,19 +206,14 @@ async def process_all_invoices():
 async def get_invoice_pdf(invoice_number: str):
     """Get the PDF file for a specific invoice from the raw invoices directory."""
     try:
-        # First try to find the original path from structured_invoices.json
-        if OUTPUT_FILE.exists():
-            with open(OUTPUT_FILE, "r") as f:
-                invoices = json.load(f)
-                for inv in invoices:
-                    if inv.get("invoice_number") == invoice_number:
-                        original_path = inv.get("original_path")
-                        if original_path and Path(original_path).exists():
-                            return FileResponse(
-                                original_path, 
-                                media_type="application/pdf",
-                                filename=f"{invoice_number}.pdf"
-                            )
+        # First try the stored original recorded for this invoice
+        original_path = workflow.document_store.path_for_invoice(invoice_number)
+        if original_path:
+            return FileResponse(
+                original_path,
+                media_type="application/pdf",
+                filename=f"{invoice_number}.pdf"
+            )
         
         # Fallback: search in raw/invoices directory
         raw_invoices_dir = Path("data/raw/invoices")
@@ -168,35 +230,37 @@ async def get_invoice_pdf(invoice_number: str):
         logger.error(f"Error retrieving PDF for invoice {invoice_number}: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/invoices/{invoice_number}/reprocess")
+async def reprocess_invoice(invoice_number: str):
+    """Run a stored invoice document through the pipeline again, in the low-priority reprocess lane."""
+    pdf_path = workflow.document_store.path_for_invoice(invoice_number)
+    if not pdf_path or not os.path.exists(pdf_path):
+        raise HTTPException(status_code=404, detail=f"No stored document for invoice {invoice_number}")
+    job = scheduler.submit(pdf_path, source="reprocess", lane="reprocess")
+    return scheduler.job_status(job["job_id"])
+
 @app.put("/api/invoices/{invoice_number}")
 async def update_invoice(invoice_number: str, updated_data: dict):
     """Update an invoice in the structured_invoices.json file."""
     try:
-        if not OUTPUT_FILE.exists():
-            raise HTTPException(status_code=404, detail="No invoices found")
-        
-        with OUTPUT_FILE.open("r") as f:
-            invoices = json.load(f)
-        
-        for invoice in invoices:
-            if invoice["invoice_number"] == invoice_number:
-                # Preserve metadata fields
-                preserved_fields = ["original_path", "extraction_time", "validation_time", "matching_time"]
-                for field in preserved_fields:
-                    if field in invoice and field not in updated_data:
-                        updated_data[field] = invoice[field]
-                
-                # Update timestamp
-                updated_data["last_modified"] = datetime.now().isoformat()
-                
-                # Update the invoice
-                invoice.update(updated_data)
-                
-                with OUTPUT_FILE.open("w") as f:
-                    json.dump(invoices, f, indent=4)
-                return {"status": "success", "message": f"Invoice {invoice_number} updated"}
-        
-        raise HTTPException(status_code=404, detail=f"Invoice {invoice_number} not found")
+        # Fields not in the request (original_path, stage timings, ...) are kept by the merge
+        previous = workflow.invoice_store.get(invoice_number, include_in_progress=False)
+        if previous is None:
+            raise HTTPException(status_code=404, detail=f"Invoice {invoice_number} not found")
+        edits = edited_fields(previous, updated_data)
+        # Update timestamp
+        updated_data["last_modified"] = datetime.now().isoformat()
+
+        workflow.invoice_store.update(invoice_number, updated_data)
+        if updated_data.get("review_status") in ["approved", "rejected"]:
+            workflow.anomaly_store.resolve([invoice_number], notes=updated_data.get("review_notes"))
+        if is_correction(updated_data.get("review_status"), edits):
+            # Rejected or edited extractions go into the RAG error corpus (via the correction listeners)
+            record_correction({"invoice_id": invoice_number, "corrections": edits,
+                               "reviewer_notes": updated_data.get("review_notes") or ""})
+        return {"status": "success", "message": f"Invoice {invoice_number} updated"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -204,29 +268,113 @@ async def update_invoice(invoice_number: str, updated_data: dict):
 async def get_metrics():
     """Return basic processing metrics."""
     try:
-        if not OUTPUT_FILE.exists():
-            return {
-                "total_invoices": 0,
-                "avg_confidence": 0,
-                "avg_processing_time": 0
-            }
-        
-        with OUTPUT_FILE.open("r") as f:
-            invoices = json.load(f)
-        
+        invoices = workflow.invoice_store.committed()
         total = len(invoices)
         avg_confidence = sum(float(inv.get("confidence", 0) or 0) for inv in invoices) / total if total > 0 else 0
         avg_time = sum(float(inv.get("total_time", 0) or 0) for inv in invoices) / total if total > 0 else 0
+        # Which matching tier resolved each invoice (po_number, vendor_fuzzy or none)
+        matching_tiers = {}
+        for inv in invoices:
+            if inv.get("match_tier"):
+                matching_tiers[inv["match_tier"]] = matching_tiers.get(inv["match_tier"], 0) + 1
+        # LLM token usage per vendor, for invoices extracted after token accounting was added
+        token_usage = {}
+        for inv in invoices:
+            if inv.get("prompt_tokens") is None:
+                continue
+            usage = token_usage.setdefault(inv.get("vendor_name") or "Unknown",
+                                           {"invoices": 0, "prompt_tokens": 0, "completion_tokens": 0})
+            usage["invoices"] += 1
+            usage["prompt_tokens"] += inv["prompt_tokens"]
+            usage["completion_tokens"] += inv.get("completion_tokens") or 0
+        for usage in token_usage.values():
+            usage["avg_prompt_tokens"] = round(usage["prompt_tokens"] / usage["invoices"], 1)
+            usage["avg_completion_tokens"] = round(usage["completion_tokens"] / usage["invoices"], 1)
         
         return {
             "total_invoices": total,
             "avg_confidence": round(avg_confidence, 3),
-            "avg_processing_time": round(avg_time, 2)
+            "avg_processing_time": round(avg_time, 2),
+            "matching_tiers": matching_tiers,
+            "token_usage_by_vendor": token_usage,
+            "admission": admission.status(),
+            "llm_circuit": workflow.extraction_agent.llm.breaker.status(),
+            "llm_hedging": workflow.extraction_agent.llm.hedge_status(),
+            "extraction_cache": workflow.extraction_agent.response_cache.status() if workflow.extraction_agent.response_cache else None
         }
     except Exception as e:
         logger.error(f"Error calculating metrics: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+class AnomalyResolveRequest(BaseModel):
+    invoice_numbers: List[str]
+    notes: Optional[str] = None
+
+@app.get("/api/anomalies")
+async def get_anomalies(reason: Optional[str] = None, expand: bool = False):
+    """List open anomalies, optionally by reason; `expand` joins the referenced invoice records."""
+    try:
+        anomalies = workflow.anomaly_store.open_anomalies(reason)
+        if expand:
+            for anomaly in anomalies:
+                anomaly["invoice"] = workflow.invoice_store.get(anomaly["invoice_number"])
+        return {"counts": workflow.anomaly_store.counts(), "anomalies": anomalies}
+    except Exception as e:
+        logger.error(f"Error fetching anomalies: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/anomalies/resolve")
+async def resolve_anomalies(request: AnomalyResolveRequest):
+    """Resolve several anomalies at once."""
+    resolved = workflow.anomaly_store.resolve(request.invoice_numbers, notes=request.notes)
+    return {"status": "success", "resolved": resolved}
+
+@app.post("/api/export/snapshot")
+async def export_snapshot(mode: str = "append"):
+    """Write processed invoices to the columnar analytics snapshot."""
+    if mode not in ("append", "overwrite"):
+        raise HTTPException(status_code=400, detail="mode must be 'append' or 'overwrite'")
+    try:
+        return InvoiceSnapshotExporter().export(mode=mode, records=workflow.invoice_store.committed())
+    except Exception as e:
+        logger.error(f"Error exporting snapshot: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/ingest/status")
+async def ingest_status():
+    """Directory watcher counters and processing queue depth."""
+    return {
+        "watcher": watcher.status() if WATCH_RAW_INVOICES else {"mode": "disabled"},
+        "queue_depth": scheduler.depth(),
+        "running": scheduler.running,
+        "lanes": scheduler.lane_status()
+    }
+
+@app.post("/api/invoices/rematch")
+async def rematch_all_invoices(write: bool = False):
+    """Re-match stored invoices against the current vendor master; `write` stores the new results."""
+    try:
+        return await asyncio.to_thread(rematch_invoices, write=write, matcher=workflow.matching_agent.matcher)
+    except Exception as e:
+        logger.error(f"Error re-matching invoices: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/vendors/status")
+async def vendor_master_status():
+    """Version and size of the vendor master currently used for matching."""
+    return workflow.matching_agent.vendor_master.snapshot.status()
+
+@app.post("/api/vendors/upload")
+async def upload_vendor_master(file: UploadFile = File(...)):
+    """Replace vendor_data.csv; matching switches to the new version once it is indexed."""
+    try:
+        return workflow.matching_agent.vendor_master.replace(await file.read())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error replacing vendor master: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 # Clean up temp directory on application exit
 def cleanup_temp_directory():
     temp_dir = Path("data/temp")
@@ -4,8 +4,12 @@ from dotenv import load_dotenv
 import os
 import json
 from datetime import datetime
-from pathlib import Path
+from decimal import Decimal, InvalidOperation
 from typing import Optional
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from data_processing.invoice_store import get_invoice_store
+from config.settings import CORRECTIONS_FILE
 
 load_dotenv()
 
@@ -32,24 +36,37 @@ class InvoiceUpdate(BaseModel):
     review_status: str = Field(..., description="Status of the review: pending, approved, or rejected")
     review_notes: Optional[str] = None
 
-PROCESSED_DIR = Path("data/processed")
-INVOICES_FILE = PROCESSED_DIR / "structured_invoices.json"
+# Callbacks notified after a correction is stored (e.g. the RAG correction indexer)
+correction_listeners = []
+# Extracted fields a reviewer can correct
+CORRECTABLE_FIELDS = ("vendor_name", "invoice_number", "invoice_date", "total_amount", "po_number")
 
-def load_invoices():
-    """Helper function to load invoices file"""
-    if not INVOICES_FILE.exists():
-        return []
-    try:
-        with INVOICES_FILE.open("r") as f:
-            return json.load(f)
-    except json.JSONDecodeError:
-        return []
+def register_correction_listener(listener):
+    correction_listeners.append(listener)
 
-def save_invoices(invoices: list):
-    """Helper function to save invoices file"""
-    PROCESSED_DIR.mkdir(parents=True, exist_ok=True)
-    with INVOICES_FILE.open("w") as f:
-        json.dump(invoices, f, indent=4)
+def _comparable(value):
+    """Amounts compare numerically (10.0 == "10.00"); everything else as trimmed text."""
+    try:
+        return Decimal(str(value))
+    except (InvalidOperation, ValueError):
+        return str(value if value is not None else "").strip()
+
+def edited_fields(previous: dict, update: dict) -> dict:
+    """Correctable fields whose value the update changes."""
+    return {field: update[field] for field in CORRECTABLE_FIELDS
+            if field in update and _comparable(update[field]) != _comparable(previous.get(field))}
+
+def record_correction(correction: dict):
+    """Append a correction to the corrections log and notify the listeners."""
+    with open(CORRECTIONS_FILE, "a") as f:
+        json.dump(correction, f)
+        f.write("\n")
+    for listener in correction_listeners:
+        listener(correction)
+
+def is_correction(review_status: Optional[str], edits: dict) -> bool:
+    """Only rejected or edited invoices are corrections; a plain approval confirms the extraction."""
+    return review_status == "rejected" or bool(edits)
 
 @router.get("/{invoice_id}", response_model=ReviewResponse)
 async def get_review(invoice_id: str):
@@ -75,9 +92,7 @@ async def submit_review(review: ReviewRequest):
 async def submit_correction(correction: ReviewRequest):
     try:
         # Save correction to a file (replace with database logic as needed)
-        with open("data/processed/corrections.json", "a") as f:
-            json.dump(correction.dict(), f)
-            f.write("\n")
+        record_correction(correction.dict())
         return ReviewResponse(
             status="corrected",
             message=f"Correction submitted for invoice {correction.invoice_id}",
@@ -90,26 +105,14 @@ async def submit_correction(correction: ReviewRequest):
 async def update_invoice(invoice_number: str, update_data: InvoiceUpdate):
     """Update an invoice with review information and perform necessary validations."""
     try:
-        invoices = load_invoices()
-        if not invoices:
-            raise HTTPException(status_code=404, detail="No invoices found")
-
-        # Find the invoice to update
-        invoice_index = None
-        for idx, invoice in enumerate(invoices):
-            if invoice.get("invoice_number") == invoice_number:
-                invoice_index = idx
-                break
-
-        if invoice_index is None:
+        store = get_invoice_store()
+        previous = store.get(invoice_number, include_in_progress=False)
+        if previous is None:
             raise HTTPException(status_code=404, detail=f"Invoice {invoice_number} not found")
 
-        # Preserve fields that shouldn't be overwritten
-        preserved_fields = ["original_path", "extraction_time", "validation_time", "matching_time"]
+        # Fields not in the update (original_path, stage timings, ...) are preserved by the merge
         update_dict = update_data.dict(exclude_unset=True)
-        for field in preserved_fields:
-            if field in invoices[invoice_index] and field not in update_dict:
-                update_dict[field] = invoices[invoice_index][field]
+        edits = edited_fields(previous, update_dict)
 
         # Add review metadata
         update_dict["review_date"] = datetime.now().isoformat()
@@ -119,15 +122,20 @@ async def update_invoice(invoice_number: str, update_data: InvoiceUpdate):
                 update_dict["resolution_notes"] = update_dict["review_notes"]
 
         # Update the invoice
-        invoices[invoice_index].update(update_dict)
-        save_invoices(invoices)
+        updated_invoice = store.update(invoice_number, update_dict)
+        if is_correction(update_dict.get("review_status"), edits):
+            # Listeners drop the cached extraction and index the invoice as a known error
+            record_correction({"invoice_id": invoice_number, "corrections": edits,
+                               "reviewer_notes": update_dict.get("review_notes") or ""})
 
         return {
             "status": "success",
             "message": f"Invoice {invoice_number} updated successfully",
-            "updated_invoice": invoices[invoice_index]
+            "updated_invoice": updated_invoice
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error updating invoice: {str(e)}")
 
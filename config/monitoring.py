@@ -1,4 +1,6 @@
+import asyncio
 import time
+from typing import Optional
 from config.logging_config import logger
 from contextlib import contextmanager
 
@@ -42,4 +44,60 @@ class Monitoring:
         try:
             yield timer_context
         finally:
-            pass  # The __exit__ method of TimerContext handles stopping the timer
\ No newline at end of file
+            pass  # The __exit__ method of TimerContext handles stopping the timer
+
+
+class DeadlineExceeded(Exception):
+    """Raised when an invoice's processing budget runs out."""
+
+    def __init__(self, stage: str, deadline: "Deadline"):
+        super().__init__(f"Processing budget of {deadline.budget:.1f}s exceeded during {stage}")
+        self.stage = stage
+        self.elapsed = deadline.elapsed()
+
+
+class Deadline:
+    """Overall time budget for one invoice, shared by every stage and retry.
+
+    A budget of 0 (or None) never expires.
+    """
+
+    def __init__(self, seconds: Optional[float]):
+        self.budget = seconds or 0.0
+        self.started = time.monotonic()
+        self.expires_at = self.started + seconds if seconds else None
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left, or None when unbounded."""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def cap(self, seconds: float) -> float:
+        """Limit a timeout or sleep to the time left."""
+        remaining = self.remaining()
+        return seconds if remaining is None else min(seconds, remaining)
+
+    def check(self, stage: str):
+        if self.expired():
+            raise DeadlineExceeded(stage, self)
+
+    async def run(self, awaitable, stage: str):
+        """Await `awaitable`, cancelling it when the budget runs out."""
+        remaining = self.remaining()
+        if remaining is None:
+            return await awaitable
+        if remaining <= 0:
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise DeadlineExceeded(stage, self)
+        try:
+            return await asyncio.wait_for(awaitable, remaining)
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(stage, self)
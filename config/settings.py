@@ -6,4 +6,123 @@ load_dotenv()
 
 # No longer needed for OpenAI API key (decided to run local model); kept for potential future environment variables
 # Add project-specific settings if needed (e.g., confidence thresholds)
-CONFIDENCE_THRESHOLD = float(os.getenv("CONFIDENCE_THRESHOLD", 0.8))
\ No newline at end of file
+CONFIDENCE_THRESHOLD = float(os.getenv("CONFIDENCE_THRESHOLD", 0.8))
+
+# Columnar analytics snapshots (Parquet, partitioned by processing date)
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", os.path.join("data", "processed", "snapshots"))
+
+# Validation thresholds shared by the validator, anomaly detector and human review agent
+REVIEW_CONFIDENCE_THRESHOLD = float(os.getenv("REVIEW_CONFIDENCE_THRESHOLD", 0.9))
+MAX_INVOICE_AMOUNT = os.getenv("MAX_INVOICE_AMOUNT", "1000000")  # GBP, parsed as Decimal
+MAX_TAX_RATIO = os.getenv("MAX_TAX_RATIO", "0.3")
+MAX_INVOICE_AGE_DAYS = int(os.getenv("MAX_INVOICE_AGE_DAYS", 365))
+# Optional JSON file replacing the default rule set in config/validation_rules.py
+VALIDATION_RULES_FILE = os.getenv("VALIDATION_RULES_FILE")
+
+# Per-vendor amount outlier model (running mean/variance and quantile sketches)
+VENDOR_STATS_FILE = os.getenv("VENDOR_STATS_FILE", os.path.join("data", "processed", "vendor_amount_stats.json"))
+VENDOR_AMOUNT_Z_THRESHOLD = float(os.getenv("VENDOR_AMOUNT_Z_THRESHOLD", 3.0))
+VENDOR_STATS_MIN_SAMPLES = int(os.getenv("VENDOR_STATS_MIN_SAMPLES", 5))
+
+# RAG error-classification index: auto, flat, hnsw, ivf_flat or ivf_pq
+RAG_INDEX_TYPE = os.getenv("RAG_INDEX_TYPE", "auto")
+RAG_INDEX_PATH = os.getenv("RAG_INDEX_PATH", os.path.join("data", "processed", "rag_index"))
+RAG_AUTO_FLAT_MAX = int(os.getenv("RAG_AUTO_FLAT_MAX", 10000))  # exact search below this corpus size
+RAG_AUTO_HNSW_MAX = int(os.getenv("RAG_AUTO_HNSW_MAX", 1000000))  # PQ-compressed IVF above this size
+RAG_HNSW_M = int(os.getenv("RAG_HNSW_M", 32))
+RAG_HNSW_EF_SEARCH = int(os.getenv("RAG_HNSW_EF_SEARCH", 64))
+RAG_IVF_NPROBE = int(os.getenv("RAG_IVF_NPROBE", 8))
+RAG_PQ_M = int(os.getenv("RAG_PQ_M", 16))  # sub-quantizers; must divide the embedding dimension
+# IVF-PQ candidates per requested neighbour that are re-scored against the full vectors
+RAG_PQ_REFINE_K_FACTOR = int(os.getenv("RAG_PQ_REFINE_K_FACTOR", 64))
+
+# Human review corrections feeding the RAG error corpus
+CORRECTIONS_FILE = os.getenv("CORRECTIONS_FILE", os.path.join("data", "processed", "corrections.json"))
+RAG_DEDUPE_SIMILARITY = float(os.getenv("RAG_DEDUPE_SIMILARITY", 0.975))  # skip corpus texts more similar than this
+RAG_SAVE_EVERY = int(os.getenv("RAG_SAVE_EVERY", 20))  # persist the index after this many additions
+
+# Invoice text embedding: sections are truncated to this many tokens and compared by cosine similarity
+RAG_CHUNK_MAX_TOKENS = int(os.getenv("RAG_CHUNK_MAX_TOKENS", 128))
+RAG_SIMILARITY_THRESHOLD = float(os.getenv("RAG_SIMILARITY_THRESHOLD", 0.95))
+
+# Sentence embedding backend: "torch" (SentenceTransformer) or "onnx" (int8-quantized ONNX Runtime on CPU)
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2")
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_ONNX_DIR = os.getenv("EMBEDDING_ONNX_DIR", os.path.join("data", "processed", "onnx_embedding"))
+EMBEDDING_ONNX_MIN_COSINE = float(os.getenv("EMBEDDING_ONNX_MIN_COSINE", 0.98))  # accuracy gate vs PyTorch
+
+# PDF parsing for extraction: only the first/last pages are read (0 and 0 = whole document)
+PDF_FIRST_PAGES = int(os.getenv("PDF_FIRST_PAGES", 2))
+PDF_LAST_PAGES = int(os.getenv("PDF_LAST_PAGES", 2))
+
+# Content-addressed storage of uploaded originals (data/uploads/<sha256[:2]>/<sha256>.pdf)
+UPLOAD_STORE_DIR = os.getenv("UPLOAD_STORE_DIR", os.path.join("data", "uploads"))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 1024 * 1024))
+
+# OCR fallback for PDFs without a text layer
+OCR_DPI = int(os.getenv("OCR_DPI", 300))
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", min(4, os.cpu_count() or 1)))
+OCR_CACHE_DIR = os.getenv("OCR_CACHE_DIR", os.path.join("data", "processed", "ocr_cache"))
+
+# Shared vendor master (vendor_data.csv), watched for changes and reloaded in the background
+VENDOR_DATA_FILE = os.getenv("VENDOR_DATA_FILE", os.path.join("data", "raw", "vendor_data.csv"))
+VENDOR_MASTER_POLL_SECONDS = float(os.getenv("VENDOR_MASTER_POLL_SECONDS", 5.0))
+
+# PO matching: minimum vendor-name similarity (token_sort_ratio / 100) for a fuzzy match
+PO_MATCH_THRESHOLD = float(os.getenv("PO_MATCH_THRESHOLD", 0.85))
+
+# Invoice store group commit: write after this many finished invoices or this many ms (0 = no timer)
+INVOICES_FILE = os.getenv("INVOICES_FILE", os.path.join("data", "processed", "structured_invoices.json"))
+INVOICE_STORE_FLUSH_EVERY = int(os.getenv("INVOICE_STORE_FLUSH_EVERY", 1))
+INVOICE_STORE_FLUSH_MS = int(os.getenv("INVOICE_STORE_FLUSH_MS", 0))
+
+# Background processing scheduler and data/raw/invoices watcher
+SCHEDULER_WORKERS = int(os.getenv("SCHEDULER_WORKERS", 4))
+RAW_INVOICES_DIR = os.getenv("RAW_INVOICES_DIR", os.path.join("data", "raw", "invoices"))
+WATCH_RAW_INVOICES = os.getenv("WATCH_RAW_INVOICES", "true").lower() in ("1", "true", "yes")
+WATCH_POLL_SECONDS = float(os.getenv("WATCH_POLL_SECONDS", 2.0))  # polling fallback when inotify is unavailable
+WATCH_DEBOUNCE_SECONDS = float(os.getenv("WATCH_DEBOUNCE_SECONDS", 1.0))  # size/mtime must be stable this long
+WATCH_STATE_FILE = os.getenv("WATCH_STATE_FILE", os.path.join("data", "processed", "watcher_state.json"))
+
+# Bulk upload limits (per request, after expanding ZIP archives)
+BULK_MAX_FILES = int(os.getenv("BULK_MAX_FILES", 1000))
+BULK_MAX_UNCOMPRESSED_BYTES = int(os.getenv("BULK_MAX_UNCOMPRESSED_BYTES", 2 * 1024 ** 3))
+
+# Scheduler priority lanes: stride-scheduling weights and workers kept free for interactive uploads
+SCHEDULER_LANE_WEIGHTS = os.getenv("SCHEDULER_LANE_WEIGHTS", "interactive=8,bulk=2,reprocess=1")
+SCHEDULER_INTERACTIVE_RESERVED = int(os.getenv("SCHEDULER_INTERACTIVE_RESERVED", 1))
+
+# Upload admission control (0 disables a limit): concurrent upload requests -> 429, queued documents -> 503
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", 16))
+ADMISSION_MAX_QUEUE_DEPTH = int(os.getenv("ADMISSION_MAX_QUEUE_DEPTH", 500))
+ADMISSION_RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", 5))
+
+# Per-invoice processing budget across all stages and retries (0 = unbounded), and per LLM request
+INVOICE_DEADLINE_SECONDS = float(os.getenv("INVOICE_DEADLINE_SECONDS", 60))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", 30))
+
+# LLM extraction client: model and circuit breaker (open after N consecutive failures, probe after the reset period)
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", 5))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", 30.0))
+LLM_BREAKER_PROBES = int(os.getenv("LLM_BREAKER_PROBES", 1))
+
+# Hedged LLM requests: resend a request still pending after this percentile of recent latencies,
+# for at most LLM_HEDGE_MAX_RATE of requests
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() in ("1", "true", "yes")
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", 95))
+LLM_HEDGE_MAX_RATE = float(os.getenv("LLM_HEDGE_MAX_RATE", 0.1))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", 20))
+LLM_LATENCY_WINDOW = int(os.getenv("LLM_LATENCY_WINDOW", 200))
+
+# Extraction prompt: maximum characters of invoice text sent after compaction (0 = no cap)
+PROMPT_MAX_CHARS = int(os.getenv("PROMPT_MAX_CHARS", 6000))
+
+# Near-duplicate extraction cache: reuse LLM fields for invoice text within this many SimHash bits
+EXTRACTION_CACHE_ENABLED = os.getenv("EXTRACTION_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+EXTRACTION_CACHE_FILE = os.getenv("EXTRACTION_CACHE_FILE", os.path.join("data", "processed", "extraction_cache.json"))
+EXTRACTION_CACHE_MAX_ENTRIES = int(os.getenv("EXTRACTION_CACHE_MAX_ENTRIES", 10000))
+# Estimated Jaccard similarity of word 3-shingles for a near match; reprints with a changed footer or
+# print date score ~0.8-0.9, different invoices from the same template stay below ~0.2
+EXTRACTION_CACHE_MIN_SIMILARITY = float(os.getenv("EXTRACTION_CACHE_MIN_SIMILARITY", 0.7))
+EXTRACTION_CACHE_NEAR_PENALTY = float(os.getenv("EXTRACTION_CACHE_NEAR_PENALTY", 0.05))  # confidence downgrade for near matches
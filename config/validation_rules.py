@@ -0,0 +1,38 @@
+# /config/validation_rules.py
+# Declarative validation rules for InvoiceValidationAgent, compiled by data_processing/rule_engine.py.
+#
+# Each rule checks one field; rules sharing an error key are tried in order and the first failure wins.
+# Checks: required, not_in, equals, date_format, gt, gte, lte (against "value") and lte_field (against "other").
+# "optional": true skips the rule when the field is empty. Messages may use {value} and {limit}.
+import json
+from config.settings import REVIEW_CONFIDENCE_THRESHOLD, MAX_INVOICE_AMOUNT, VALIDATION_RULES_FILE
+
+DEFAULT_VALIDATION_RULES = [
+    {"field": "confidence", "check": "gte", "value": REVIEW_CONFIDENCE_THRESHOLD,
+     "message": "Low confidence score: {value}"},
+    {"field": "vendor_name", "check": "required", "message": "Missing or invalid vendor name"},
+    {"field": "vendor_name", "check": "not_in", "value": ["Unknown", "Error"], "message": "Missing or invalid vendor name"},
+    {"field": "invoice_number", "check": "required", "message": "Missing or invalid invoice number"},
+    {"field": "invoice_number", "check": "not_in", "value": ["INVALID", "ERROR", "FAILED"],
+     "message": "Missing or invalid invoice number"},
+    {"field": "invoice_date", "check": "required", "message": "Missing invoice date"},
+    {"field": "invoice_date", "check": "date_format", "value": "%Y-%m-%d",
+     "message": "Invalid date format (expected YYYY-MM-DD)"},
+    {"field": "total_amount", "check": "required", "message": "Missing total amount"},
+    {"field": "total_amount", "check": "gt", "value": "0", "message": "Amount must be greater than zero",
+     "invalid_message": "Invalid amount format"},
+    {"field": "total_amount", "check": "lte", "value": MAX_INVOICE_AMOUNT,
+     "message": "Amount exceeds maximum threshold (£{limit:,})", "invalid_message": "Invalid amount format"},
+    {"field": "currency", "check": "equals", "value": "GBP", "message": "Only GBP currency is supported"},
+    {"field": "tax_amount", "check": "lte_field", "other": "total_amount", "optional": True,
+     "message": "Tax amount greater than total amount", "invalid_message": "Invalid tax amount format"},
+    {"field": "tax_amount", "check": "gte", "value": "0", "optional": True,
+     "message": "Negative tax amount", "invalid_message": "Invalid tax amount format"},
+]
+
+def load_validation_rules() -> list:
+    """Return the configured rule set: VALIDATION_RULES_FILE if set, else the defaults."""
+    if VALIDATION_RULES_FILE:
+        with open(VALIDATION_RULES_FILE, "r") as f:
+            return json.load(f)
+    return DEFAULT_VALIDATION_RULES
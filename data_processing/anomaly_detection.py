@@ -3,19 +3,27 @@
 import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from typing import Dict, Any
-import json
+from typing import Dict, Any, List, Union
 from datetime import datetime
 from decimal import Decimal
+import numpy as np
+import pandas as pd
 from models.invoice import InvoiceData
 from config.logging_config import logger
+from config.settings import REVIEW_CONFIDENCE_THRESHOLD, MAX_INVOICE_AMOUNT, MAX_TAX_RATIO, MAX_INVOICE_AGE_DAYS
 from data_processing.confidence_scoring import compute_confidence_score
+from data_processing.vendor_stats import VendorAmountModel
+from data_processing.invoice_store import get_invoice_store
 
 class AnomalyDetector:
     def __init__(self):
-        self.anomaly_threshold = 0.9  # Increased from 0.8 to match new confidence scoring
-        self.amount_threshold = Decimal('1000000')  # £1M threshold for large amounts
-        self.historical_data_file = os.path.join('data', 'processed', 'structured_invoices.json')
+        self.anomaly_threshold = REVIEW_CONFIDENCE_THRESHOLD
+        self.amount_threshold = Decimal(MAX_INVOICE_AMOUNT)  # £1M threshold for large amounts
+        self.tax_ratio_threshold = Decimal(MAX_TAX_RATIO)
+        self.max_age_days = MAX_INVOICE_AGE_DAYS
+        # Committed invoices only: an invoice still in the pipeline is not its own duplicate
+        self.invoice_store = get_invoice_store()
+        self.vendor_model = VendorAmountModel()
 
     def detect_anomalies(self, invoice_data: InvoiceData) -> Dict[str, Any]:
         """Detect anomalies in invoice data using confidence scores and business rules."""
@@ -37,6 +45,11 @@ class AnomalyDetector:
                     "reason": f"Amount £{invoice_data.total_amount} exceeds threshold £{self.amount_threshold}"
                 }
 
+            # Check amount against the vendor's own history
+            vendor_outlier = self.vendor_model.check(invoice_data.vendor_name, invoice_data.total_amount)
+            if vendor_outlier:
+                anomalies["vendor_amount_outlier"] = vendor_outlier
+
             # Check for duplicates using historical data
             duplicate_check = self._check_duplicates(invoice_data)
             if duplicate_check:
@@ -49,7 +62,7 @@ class AnomalyDetector:
 
             # Check for suspicious patterns
             if invoice_data.tax_amount and invoice_data.total_amount:
-                if invoice_data.tax_amount > invoice_data.total_amount * Decimal('0.3'):
+                if invoice_data.tax_amount > invoice_data.total_amount * self.tax_ratio_threshold:
                     anomalies["suspicious_tax"] = {
                         "tax_amount": str(invoice_data.tax_amount),
                         "total_amount": str(invoice_data.total_amount),
@@ -67,26 +80,154 @@ class AnomalyDetector:
             logger.error(f"Error in anomaly detection: {str(e)}", exc_info=True)
             return {"error": str(e)}
 
-    def _check_duplicates(self, invoice_data: InvoiceData) -> Dict[str, Any]:
-        """Check for duplicate invoices in historical data."""
+    def detect_anomalies_batch(self, invoices: Union[List[InvoiceData], pd.DataFrame]) -> List[Dict[str, Any]]:
+        """Vectorized detect_anomalies over a batch (InvoiceData list or DataFrame with the same columns).
+
+        Produces the same per-invoice dicts as the scalar path. History is read once and joined
+        against the batch, and the current date is taken once for the whole batch.
+        """
+        if isinstance(invoices, pd.DataFrame):
+            frame = invoices.reset_index(drop=True)
+        else:
+            frame = pd.DataFrame([inv.model_dump() for inv in invoices])
+        if frame.empty:
+            return []
         try:
-            if not os.path.exists(self.historical_data_file):
-                return None
+            return self._detect_frame(frame)
+        except Exception as e:
+            logger.error(f"Error in batch anomaly detection: {str(e)}", exc_info=True)
+            if isinstance(invoices, pd.DataFrame):
+                return [{"error": str(e)} for _ in range(len(frame))]
+            return [self.detect_anomalies(inv) for inv in invoices]
 
-            with open(self.historical_data_file, 'r') as f:
-                historical_invoices = json.load(f)
+    def _detect_frame(self, frame: pd.DataFrame) -> List[Dict[str, Any]]:
+        n = len(frame)
+        if "tax_amount" not in frame.columns:
+            frame = frame.assign(tax_amount=None)
+        results: List[Dict[str, Any]] = [{} for _ in range(n)]
+        confidence = frame["confidence"].to_numpy(dtype=float)
+        totals_raw = frame["total_amount"].to_numpy(dtype=object)
+        taxes_raw = frame["tax_amount"].to_numpy(dtype=object)
+        totals = pd.to_numeric(frame["total_amount"], errors="coerce").to_numpy(dtype=float)
+        taxes = pd.to_numeric(frame["tax_amount"], errors="coerce").to_numpy(dtype=float)
 
-            for hist_inv in historical_invoices:
-                if hist_inv.get("invoice_number") == invoice_data.invoice_number:
-                    if hist_inv.get("vendor_name") != invoice_data.vendor_name:
-                        continue  # Same number but different vendor, might be coincidence
+        # Confidence score
+        for i in np.flatnonzero(confidence < self.anomaly_threshold):
+            results[i]["low_confidence"] = {
+                "score": float(confidence[i]),
+                "threshold": self.anomaly_threshold,
+                "reason": f"Confidence score {confidence[i]:.2f} below threshold {self.anomaly_threshold}"
+            }
 
-                    return {
-                        "original_date": hist_inv.get("invoice_date"),
-                        "original_amount": hist_inv.get("total_amount"),
-                        "reason": "Invoice number already exists in system"
-                    }
+        # Amount threshold; float candidates are confirmed with exact Decimal arithmetic
+        with np.errstate(invalid="ignore"):
+            amount_candidates = np.flatnonzero(totals > float(self.amount_threshold) - 1.0)
+        for i in amount_candidates:
+            total = Decimal(str(totals_raw[i]))
+            if total > self.amount_threshold:
+                results[i]["high_amount"] = {
+                    "amount": str(totals_raw[i]),
+                    "threshold": str(self.amount_threshold),
+                    "reason": f"Amount £{totals_raw[i]} exceeds threshold £{self.amount_threshold}"
+                }
+
+        # Vendor outliers: vectorized pre-filter on (mean, std) per vendor, confirmed by the model
+        vendors = frame["vendor_name"]
+        vendor_stats = {v: self.vendor_model.stats_for(v) for v in vendors.unique()}
+        vendor_stats = {v: stats for v, stats in vendor_stats.items() if stats is not None}
+        means = vendors.map({v: stats.mean for v, stats in vendor_stats.items()}).to_numpy(dtype=float)
+        stds = vendors.map({v: stats.std for v, stats in vendor_stats.items()}).to_numpy(dtype=float)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            outlier_candidates = np.flatnonzero((stds > 0) & ((totals - means) / stds > self.vendor_model.z_threshold * (1 - 1e-9)))
+        for i in outlier_candidates:
+            vendor_outlier = self.vendor_model.check(vendors.iloc[i], totals_raw[i])
+            if vendor_outlier:
+                results[i]["vendor_amount_outlier"] = vendor_outlier
 
+        # Duplicates: one hash join against history instead of a scan per invoice
+        duplicates = self._duplicate_matches(frame)
+        if duplicates is not None:
+            original_dates = duplicates["original_date"].to_numpy(dtype=object)
+            original_amounts = duplicates["original_amount"].to_numpy(dtype=object)
+            for i in np.flatnonzero(duplicates["_merge"].to_numpy() == "both"):
+                results[i]["duplicate"] = {
+                    "original_date": None if pd.isna(original_dates[i]) else original_dates[i],
+                    "original_amount": None if pd.isna(original_amounts[i]) else original_amounts[i],
+                    "reason": "Invoice number already exists in system"
+                }
+
+        # Date checks against a single "today"
+        current_date = datetime.now().date()
+        dates = pd.to_datetime(frame["invoice_date"].astype(str), format="%Y-%m-%d", errors="coerce")
+        days_old = (pd.Timestamp(current_date) - dates).dt.days.to_numpy()
+        unparsed = dates.isna().to_numpy()
+        with np.errstate(invalid="ignore"):
+            future = ~unparsed & (days_old < 0)
+            too_old = ~unparsed & (days_old > self.max_age_days)
+        for i in np.flatnonzero(unparsed | future | too_old):
+            if unparsed[i]:
+                date_check = self._validate_date(frame["invoice_date"].iloc[i])
+            elif future[i]:
+                date_check = {
+                    "date": dates.iloc[i].date().isoformat(),
+                    "current_date": str(current_date),
+                    "reason": "Invoice date is in the future"
+                }
+            else:
+                date_check = {
+                    "date": dates.iloc[i].date().isoformat(),
+                    "age_in_days": int(days_old[i]),
+                    "reason": "Invoice is over 1 year old"
+                }
+            if date_check:
+                results[i]["date_issue"] = date_check
+
+        # Tax ratio; candidates confirmed with Decimal like the scalar path
+        ratio = float(self.tax_ratio_threshold)
+        with np.errstate(invalid="ignore"):
+            tax_candidates = np.flatnonzero((taxes != 0) & (totals != 0) & (taxes >= totals * ratio * (1 - 1e-9)))
+        for i in tax_candidates:
+            tax, total = Decimal(str(taxes_raw[i])), Decimal(str(totals_raw[i]))
+            if tax and total and tax > total * self.tax_ratio_threshold:
+                results[i]["suspicious_tax"] = {
+                    "tax_amount": str(taxes_raw[i]),
+                    "total_amount": str(totals_raw[i]),
+                    "reason": "Tax amount unusually high relative to total"
+                }
+
+        flagged = sum(1 for r in results if r)
+        logger.info(f"Batch anomaly detection: {flagged}/{n} invoices flagged")
+        return results
+
+    def _duplicate_matches(self, frame: pd.DataFrame):
+        """Left-join the batch against history on (invoice_number, vendor_name), first match wins."""
+        try:
+            historical_invoices = self.invoice_store.committed()
+            if not historical_invoices:
+                return None
+            history = pd.DataFrame(
+                [{"invoice_number": h.get("invoice_number"), "vendor_name": h.get("vendor_name"),
+                  "original_date": h.get("invoice_date"), "original_amount": h.get("total_amount")}
+                 for h in historical_invoices],
+                columns=["invoice_number", "vendor_name", "original_date", "original_amount"]
+            ).drop_duplicates(subset=["invoice_number", "vendor_name"], keep="first")
+            keys = frame[["invoice_number", "vendor_name"]]
+            return keys.merge(history, how="left", on=["invoice_number", "vendor_name"], indicator=True)
+        except Exception as e:
+            logger.error(f"Error checking duplicates: {str(e)}")
+            return None
+
+    def _check_duplicates(self, invoice_data: InvoiceData) -> Dict[str, Any]:
+        """Check for duplicate invoices in historical data."""
+        try:
+            hist_inv = self.invoice_store.get(invoice_data.invoice_number, include_in_progress=False)
+            if hist_inv and hist_inv.get("vendor_name") == invoice_data.vendor_name:
+                return {
+                    "original_date": hist_inv.get("invoice_date"),
+                    "original_amount": hist_inv.get("total_amount"),
+                    "reason": "Invoice number already exists in system"
+                }
+            # Same number but different vendor might be coincidence
             return None
 
         except Exception as e:
@@ -107,9 +248,9 @@ class AnomalyDetector:
                     "reason": "Invoice date is in the future"
                 }
 
-            # Very old invoice check (over 1 year old)
+            # Very old invoice check (over 1 year old by default)
             days_old = (current_date - invoice_date).days
-            if days_old > 365:
+            if days_old > self.max_age_days:
                 return {
                     "date": str(invoice_date),
                     "age_in_days": days_old,
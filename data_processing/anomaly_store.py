@@ -0,0 +1,127 @@
+# /data_processing/anomaly_store.py
+# Indexed store of flagged invoices, referencing invoice records by invoice number.
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import json
+import threading
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Iterable
+from config.logging_config import logger
+
+# Only these fields are persisted; the invoice itself lives in structured_invoices.json
+ANOMALY_FIELDS = ["invoice_number", "anomaly_reasons", "detection_time", "resolved", "resolved_time", "resolution_notes"]
+
+
+def reason_key(reason: str) -> str:
+    """Index key for a reason, e.g. 'Processing error: timeout' -> 'Processing error'."""
+    return reason.split(":", 1)[0].strip()
+
+
+class AnomalyStore:
+    """Anomaly entries indexed by invoice number, open/resolved state and reason."""
+
+    def __init__(self, anomalies_file: str = os.path.join("data", "processed", "anomalies.json")):
+        self.anomalies_file = anomalies_file
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._open: set = set()
+        self._by_reason: Dict[str, set] = {}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.anomalies_file, "r") as f:
+                stored = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            stored = []
+        for entry in stored:
+            invoice_number = entry.get("invoice_number")
+            if not invoice_number:
+                continue
+            # Older files embedded a full copy of the invoice; keep only the reference fields
+            self._index({field: entry[field] for field in ANOMALY_FIELDS if field in entry})
+        logger.info(f"Loaded {len(self._entries)} anomalies ({len(self._open)} open) from {self.anomalies_file}")
+
+    def _index(self, entry: Dict[str, Any]):
+        invoice_number = entry["invoice_number"]
+        self._unindex(invoice_number)
+        self._entries[invoice_number] = entry
+        if not entry.get("resolved"):
+            self._open.add(invoice_number)
+        for reason in entry.get("anomaly_reasons", []):
+            self._by_reason.setdefault(reason_key(reason), set()).add(invoice_number)
+
+    def _unindex(self, invoice_number: str):
+        previous = self._entries.pop(invoice_number, None)
+        if previous is None:
+            return
+        self._open.discard(invoice_number)
+        for reason in previous.get("anomaly_reasons", []):
+            numbers = self._by_reason.get(reason_key(reason))
+            if numbers is not None:
+                numbers.discard(invoice_number)
+                if not numbers:
+                    del self._by_reason[reason_key(reason)]
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.anomalies_file), exist_ok=True)
+        tmp_path = f"{self.anomalies_file}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(list(self._entries.values()), f, indent=4)
+        os.replace(tmp_path, self.anomalies_file)
+
+    def record(self, invoice_number: str, reasons: List[str]) -> Dict[str, Any]:
+        """Add or reopen the anomaly for an invoice."""
+        entry = {
+            "invoice_number": invoice_number,
+            "anomaly_reasons": list(reasons),
+            "detection_time": datetime.now().isoformat(),
+            "resolved": False
+        }
+        with self._lock:
+            existed = invoice_number in self._entries
+            self._index(entry)
+            self._save()
+        logger.info(f"{'Updated existing' if existed else 'Added new'} anomaly for invoice {invoice_number}")
+        return entry
+
+    def get(self, invoice_number: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(invoice_number)
+        return dict(entry) if entry else None
+
+    def open_anomalies(self, reason: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Unresolved anomalies, optionally restricted to one reason, oldest first."""
+        with self._lock:
+            numbers = self._open if reason is None else self._open & self._by_reason.get(reason_key(reason), set())
+            entries = [dict(self._entries[n]) for n in numbers]
+        return sorted(entries, key=lambda e: e.get("detection_time", ""))
+
+    def resolve(self, invoice_numbers: Iterable[str], notes: Optional[str] = None) -> int:
+        """Mark anomalies resolved in bulk with a single write. Returns how many were open."""
+        resolved_time = datetime.now().isoformat()
+        count = 0
+        with self._lock:
+            for invoice_number in invoice_numbers:
+                if invoice_number not in self._open:
+                    continue
+                entry = self._entries[invoice_number]
+                entry["resolved"] = True
+                entry["resolved_time"] = resolved_time
+                if notes:
+                    entry["resolution_notes"] = notes
+                self._open.discard(invoice_number)
+                count += 1
+            if count:
+                self._save()
+        logger.info(f"Resolved {count} anomalies")
+        return count
+
+    def counts(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "total": len(self._entries),
+                "open": len(self._open),
+                "open_by_reason": {key: len(numbers & self._open) for key, numbers in self._by_reason.items()}
+            }
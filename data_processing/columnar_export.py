@@ -0,0 +1,206 @@
+# /data_processing/columnar_export.py
+# Exports processed invoices and stage timings to a columnar Parquet snapshot for analytics.
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import json
+import shutil
+import uuid
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+from config.logging_config import logger
+from config.settings import SNAPSHOT_DIR, INVOICES_FILE
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    from pyarrow import fs
+except ImportError:
+    pa = None
+
+STRING_COLUMNS = [
+    "invoice_number", "vendor_name", "invoice_date", "po_number", "currency",
+    "status", "review_status", "validation_status", "matching_status", "original_path"
+]
+FLOAT_COLUMNS = [
+    "total_amount", "tax_amount", "confidence",
+    "extraction_time", "validation_time", "matching_time", "review_time", "total_time"
+]
+# Low-cardinality columns are dictionary-encoded to keep the files small
+DICTIONARY_COLUMNS = ["vendor_name", "currency", "status", "review_status", "validation_status", "matching_status"]
+PARTITION_COLUMN = "processed_date"
+STATE_FILE = "_export_state.json"
+
+
+def _snapshot_schema():
+    fields = []
+    for col in STRING_COLUMNS:
+        if col in DICTIONARY_COLUMNS:
+            fields.append(pa.field(col, pa.dictionary(pa.int32(), pa.string())))
+        else:
+            fields.append(pa.field(col, pa.string()))
+    fields += [pa.field(col, pa.float64()) for col in FLOAT_COLUMNS]
+    fields += [
+        pa.field("processed_time", pa.timestamp("us")),
+        pa.field("snapshot_time", pa.timestamp("us")),
+        pa.field(PARTITION_COLUMN, pa.string()),
+    ]
+    return pa.schema(fields)
+
+
+def _parse_time(value) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+def _to_float(value) -> Optional[float]:
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _last_changed(record: Dict[str, Any]) -> Optional[datetime]:
+    """Most recent modification time recorded on an invoice entry."""
+    times = [_parse_time(record.get(key)) for key in ("processed_time", "review_date", "last_modified")]
+    times = [t for t in times if t is not None]
+    return max(times) if times else None
+
+
+class InvoiceSnapshotExporter:
+    """Writes invoice records to a Parquet dataset partitioned by processing date.
+
+    `append` mode only writes records changed since the previous export, so a record can appear
+    in several parts; readers keep the row with the latest `snapshot_time` per invoice.
+    """
+
+    def __init__(self, snapshot_dir: str = SNAPSHOT_DIR,
+                 source_file: str = INVOICES_FILE):
+        if pa is None:
+            raise ImportError("pyarrow is required for columnar export. Please run: pip install pyarrow")
+        self.snapshot_dir = snapshot_dir
+        self.source_file = source_file
+        self.schema = _snapshot_schema()
+
+    def _load_records(self) -> List[Dict[str, Any]]:
+        try:
+            with open(self.source_file, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            logger.warning(f"No readable invoices in {self.source_file}, nothing to export")
+            return []
+
+    def _load_state(self) -> Dict[str, Any]:
+        try:
+            with open(os.path.join(self.snapshot_dir, STATE_FILE), "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_state(self, state: Dict[str, Any]):
+        path = os.path.join(self.snapshot_dir, STATE_FILE)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+
+    def _to_table(self, records: List[Dict[str, Any]], snapshot_time: datetime):
+        columns = {col: [] for col in self.schema.names}
+        for record in records:
+            for col in STRING_COLUMNS:
+                value = record.get(col)
+                columns[col].append(None if value is None else str(value))
+            for col in FLOAT_COLUMNS:
+                columns[col].append(_to_float(record.get(col)))
+            processed_time = _parse_time(record.get("processed_time")) or snapshot_time
+            columns["processed_time"].append(processed_time)
+            columns["snapshot_time"].append(snapshot_time)
+            columns[PARTITION_COLUMN].append(processed_time.date().isoformat())
+        return pa.table(columns, schema=self.schema)
+
+    def export(self, mode: str = "append", records: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """Export invoices to the snapshot. `mode` is 'append' (changed records only) or 'overwrite'."""
+        if mode not in ("append", "overwrite"):
+            raise ValueError(f"Unsupported export mode: {mode}")
+        records = self._load_records() if records is None else records
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        state = self._load_state() if mode == "append" else {}
+        watermark = _parse_time(state.get("watermark"))
+
+        if watermark is not None:
+            records = [r for r in records if (_last_changed(r) or datetime.max) > watermark]
+        records = [r for r in records if r.get("invoice_number")]
+        if not records:
+            logger.info("Snapshot is up to date, no invoices to export")
+            return {"mode": mode, "exported": 0, "snapshot_dir": self.snapshot_dir}
+
+        if mode == "overwrite":
+            for name in os.listdir(self.snapshot_dir):
+                if name.startswith(f"{PARTITION_COLUMN}="):
+                    shutil.rmtree(os.path.join(self.snapshot_dir, name))
+
+        snapshot_time = datetime.now()
+        table = self._to_table(records, snapshot_time)
+        ds.write_dataset(
+            table,
+            self.snapshot_dir,
+            format="parquet",
+            partitioning=ds.partitioning(pa.schema([(PARTITION_COLUMN, pa.string())]), flavor="hive"),
+            basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+        )
+
+        changed = [t for t in (_last_changed(r) for r in records) if t is not None]
+        new_watermark = max(changed + ([watermark] if watermark else []), default=snapshot_time)
+        self._save_state({"watermark": new_watermark.isoformat(), "last_export": snapshot_time.isoformat()})
+        logger.info(f"Exported {len(records)} invoices to {self.snapshot_dir} ({mode})")
+        return {"mode": mode, "exported": len(records), "snapshot_dir": self.snapshot_dir}
+
+
+def load_snapshot(columns: Optional[List[str]] = None, snapshot_dir: str = SNAPSHOT_DIR,
+                  latest_only: bool = True, filter=None):
+    """Scan the snapshot into a pandas DataFrame, memory-mapping the Parquet files.
+
+    With `latest_only` the newest exported version of each invoice is kept.
+    Returns None if no snapshot has been written yet.
+    """
+    if pa is None:
+        raise ImportError("pyarrow is required to read snapshots. Please run: pip install pyarrow")
+    if not os.path.isdir(snapshot_dir) or not any(
+        name.startswith(f"{PARTITION_COLUMN}=") for name in os.listdir(snapshot_dir)
+    ):
+        return None
+
+    dataset = ds.dataset(
+        snapshot_dir,
+        format="parquet",
+        partitioning="hive",
+        filesystem=fs.LocalFileSystem(use_mmap=True),
+        exclude_invalid_files=True,
+    )
+    read_columns = None
+    if columns is not None:
+        read_columns = list(dict.fromkeys(columns + (["invoice_number", "snapshot_time"] if latest_only else [])))
+    table = dataset.to_table(columns=read_columns, filter=filter)
+    df = table.to_pandas()
+    if latest_only and not df.empty:
+        df = (df.sort_values("snapshot_time")
+                .drop_duplicates(subset="invoice_number", keep="last")
+                .reset_index(drop=True))
+        if columns is not None:
+            df = df[columns]
+    return df
+
+
+if __name__ == "__main__":
+    mode = sys.argv[1] if len(sys.argv) > 1 else "append"
+    exporter = InvoiceSnapshotExporter()
+    print(exporter.export(mode=mode))
+    print(load_snapshot(columns=["invoice_number", "total_amount", "total_time"]))
@@ -1,33 +1,79 @@
 # /data_processing/document_parser.py (Updated)
 
+import mmap
 import pdfplumber
-from typing import Optional
+from contextlib import contextmanager
+from typing import Optional, Iterator, Tuple, Callable, List
 import logging
+import os
 from pathlib import Path
 from config.logging_config import setup_logging
+from config.monitoring import Deadline, DeadlineExceeded
 
 logger = setup_logging()
 
-def extract_text_from_pdf(pdf_path: str) -> str:
-    """Extract text from PDF with error handling for corrupted files."""
+def select_pages(page_count: int, first_pages: int = 0, last_pages: int = 0) -> List[int]:
+    """Page indices to read: the first K and last K pages in document order, or every page if both are 0."""
+    if not first_pages and not last_pages:
+        return list(range(page_count))
+    head = range(min(first_pages, page_count))
+    tail = range(max(page_count - last_pages, 0), page_count)
+    return sorted(set(head) | set(tail))
+
+@contextmanager
+def open_pdf(pdf_path: str):
+    """Open a PDF for parsing from a read-only memory map instead of buffered reads."""
+    with open(pdf_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError(f"Empty PDF file: {pdf_path}")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            with pdfplumber.open(mapped) as pdf:
+                yield pdf
+
+def iter_pdf_pages(pdf_path: str, first_pages: int = 0, last_pages: int = 0) -> Iterator[Tuple[int, str]]:
+    """Lazily yield (page_number, text) for the selected pages, releasing each page's objects after use."""
+    with open_pdf(pdf_path) as pdf:
+        for index in select_pages(len(pdf.pages), first_pages, last_pages):
+            page = pdf.pages[index]
+            try:
+                yield index + 1, page.extract_text() or ""
+            except Exception as e:
+                logger.warning(f"Failed to extract text from page {index + 1}: {str(e)}")
+            finally:
+                page.close()
+
+def extract_text_from_pdf(pdf_path: str, first_pages: int = 0, last_pages: int = 0,
+                          stop_when: Optional[Callable[[str], bool]] = None,
+                          deadline: Optional[Deadline] = None) -> str:
+    """Extract text from PDF with error handling for corrupted files.
+
+    `first_pages`/`last_pages` restrict parsing to the head and tail of long documents, and
+    `stop_when(text_so_far)` ends parsing early once it returns True. With a `deadline`, parsing
+    raises DeadlineExceeded between pages once it has run out, so a worker thread whose caller
+    already gave up does not keep parsing.
+    """
     logger.info(f"Extracting text from PDF: {pdf_path}")
     try:
-        with pdfplumber.open(pdf_path) as pdf:
-            text = ""
-            for page in pdf.pages:
-                try:
-                    page_text = page.extract_text() or ""
-                    text += page_text + "\n"
-                except Exception as e:
-                    logger.warning(f"Failed to extract text from page: {str(e)}")
-                    continue
-            
-            if not text.strip():
-                logger.warning("No text extracted from PDF, might be scanned or corrupted")
-                return ""
-            
-            logger.info(f"Successfully extracted {len(text)} characters")
-            return text
+        parts = []
+        pages_read = 0
+        for page_number, page_text in iter_pdf_pages(pdf_path, first_pages, last_pages):
+            if deadline is not None:
+                deadline.check("pdf parsing")
+            parts.append(page_text)
+            pages_read += 1
+            if stop_when is not None and stop_when("\n".join(parts)):
+                logger.info(f"Stopped after page {page_number}: required content found")
+                break
+        text = "\n".join(parts) + "\n" if parts else ""
+
+        if not text.strip():
+            logger.warning("No text extracted from PDF, might be scanned or corrupted")
+            return ""
+
+        logger.info(f"Successfully extracted {len(text)} characters from {pages_read} pages")
+        return text
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"Failed to process PDF {pdf_path}: {str(e)}", exc_info=True)
-        return ""
\ No newline at end of file
+        return ""
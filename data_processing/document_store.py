@@ -0,0 +1,168 @@
+# /data_processing/document_store.py
+# Content-addressed storage of original invoice documents, indexed by invoice number.
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import hashlib
+import json
+import threading
+import uuid
+import zipfile
+from typing import Dict, Any, Optional, List, Tuple
+from config.logging_config import logger
+from config.settings import UPLOAD_STORE_DIR, UPLOAD_CHUNK_SIZE, BULK_MAX_FILES, BULK_MAX_UNCOMPRESSED_BYTES
+
+DOCUMENT_EXTENSIONS = (".pdf", ".png", ".jpg", ".jpeg", ".tif", ".tiff")
+
+
+def document_suffix(filename: str) -> Optional[str]:
+    """Lower-case extension if the file is a supported invoice document, else None."""
+    suffix = os.path.splitext(filename or "")[1].lower()
+    return suffix if suffix in DOCUMENT_EXTENSIONS else None
+
+
+class DocumentStore:
+    """Stores each original once under its SHA-256 and maps invoice numbers to stored paths.
+
+    Uploads are streamed to a partial file in chunks while the hash is computed, then renamed
+    into place, so a document is never held in memory or copied twice.
+    """
+
+    def __init__(self, root: str = UPLOAD_STORE_DIR, chunk_size: int = UPLOAD_CHUNK_SIZE,
+                 invoices_file: str = os.path.join("data", "processed", "structured_invoices.json")):
+        self.root = root
+        self.chunk_size = chunk_size
+        self.index_file = os.path.join(root, "index.json")
+        self._lock = threading.Lock()
+        self._paths: Dict[str, str] = {}
+        self._load(invoices_file)
+        self._linked = set(self._paths.values())
+
+    def _load(self, invoices_file: str):
+        try:
+            with open(self.index_file, "r") as f:
+                self._paths = json.load(f)
+            return
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+        # First start: seed the index from previously processed invoices
+        try:
+            with open(invoices_file, "r") as f:
+                invoices = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            invoices = []
+        self._paths = {inv["invoice_number"]: inv["original_path"] for inv in invoices
+                       if inv.get("invoice_number") and inv.get("original_path")}
+        if self._paths:
+            self._save()
+            logger.info(f"Indexed {len(self._paths)} original documents from {invoices_file}")
+
+    def _save(self):
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = f"{self.index_file}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._paths, f)
+        os.replace(tmp_path, self.index_file)
+
+    def path_for_digest(self, digest: str, suffix: str = ".pdf") -> str:
+        return os.path.join(self.root, digest[:2], f"{digest}{suffix}")
+
+    def _partial_path(self) -> str:
+        os.makedirs(self.root, exist_ok=True)
+        return os.path.join(self.root, f".partial-{uuid.uuid4().hex}")
+
+    def _commit(self, partial_path: str, digest: str, size: int, suffix: str) -> Dict[str, Any]:
+        path = self.path_for_digest(digest, suffix)
+        existed = os.path.exists(path)
+        if existed:
+            os.remove(partial_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(partial_path, path)
+        logger.info(f"{'Deduplicated' if existed else 'Stored'} document {digest[:12]} ({size} bytes)")
+        return {"path": path, "sha256": digest, "size": size, "duplicate": existed}
+
+    async def save_upload(self, upload, suffix: str = ".pdf") -> Dict[str, Any]:
+        """Stream an UploadFile (anything with async `read(n)`) into the store."""
+        partial_path = self._partial_path()
+        sha256, size = hashlib.sha256(), 0
+        try:
+            with open(partial_path, "wb") as f:
+                while True:
+                    chunk = await upload.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    sha256.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+            return self._commit(partial_path, sha256.hexdigest(), size, suffix)
+        except BaseException:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            raise
+
+    def save_stream(self, stream, suffix: str = ".pdf") -> Dict[str, Any]:
+        """Copy a binary file object (e.g. an archive member) into the store in chunks."""
+        partial_path = self._partial_path()
+        sha256, size = hashlib.sha256(), 0
+        try:
+            with open(partial_path, "wb") as f:
+                for chunk in iter(lambda: stream.read(self.chunk_size), b""):
+                    sha256.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+            return self._commit(partial_path, sha256.hexdigest(), size, suffix)
+        except BaseException:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            raise
+
+    def save_archive(self, archive, max_files: int = BULK_MAX_FILES,
+                     max_bytes: int = BULK_MAX_UNCOMPRESSED_BYTES) -> Tuple[List[Dict[str, Any]], List[Dict[str, str]]]:
+        """Stream each document in a ZIP archive (path or seekable file object) into the store.
+
+        Members are decompressed one chunk at a time; the archive is never extracted as a whole.
+        Returns (stored documents with their member name, skipped members with a reason).
+        """
+        stored, skipped = [], []
+        total_bytes = 0
+        with zipfile.ZipFile(archive) as zf:
+            for member in zf.infolist():
+                if member.is_dir():
+                    continue
+                name = os.path.basename(member.filename)
+                suffix = document_suffix(name)
+                if suffix is None or name.startswith("."):
+                    skipped.append({"filename": member.filename, "reason": "unsupported file type"})
+                    continue
+                if len(stored) >= max_files:
+                    skipped.append({"filename": member.filename, "reason": f"more than {max_files} documents"})
+                    continue
+                total_bytes += member.file_size
+                if total_bytes > max_bytes:
+                    skipped.append({"filename": member.filename, "reason": "archive exceeds the size limit"})
+                    continue
+                with zf.open(member) as stream:
+                    stored.append({**self.save_stream(stream, suffix), "filename": name})
+        logger.info(f"Stored {len(stored)} documents from archive, skipped {len(skipped)}")
+        return stored, skipped
+
+    def link(self, invoice_number: str, path: str):
+        """Record which stored document an invoice was extracted from."""
+        if not invoice_number or not path:
+            return
+        with self._lock:
+            if self._paths.get(invoice_number) == path:
+                return
+            self._paths[invoice_number] = path
+            self._linked.add(path)
+            self._save()
+
+    def is_processed(self, digest: str, suffix: str = ".pdf") -> bool:
+        """Whether a document with this content was stored and an invoice was extracted from it."""
+        return self.path_for_digest(digest, suffix) in self._linked
+
+    def path_for_invoice(self, invoice_number: str) -> Optional[str]:
+        path = self._paths.get(invoice_number)
+        return path if path and os.path.exists(path) else None
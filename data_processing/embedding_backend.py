@@ -0,0 +1,196 @@
+# /data_processing/embedding_backend.py
+# Sentence embedding backends: full-precision PyTorch or int8-quantized ONNX Runtime on CPU.
+#
+#   python -m data_processing.embedding_backend export
+#   python -m data_processing.embedding_backend benchmark --texts 256
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import argparse
+import json
+import time
+from typing import Dict, Any, List, Optional
+import numpy as np
+from config.logging_config import logger
+from config.settings import (
+    EMBEDDING_MODEL_NAME, EMBEDDING_BACKEND, EMBEDDING_ONNX_DIR, EMBEDDING_ONNX_MIN_COSINE, RAG_CHUNK_MAX_TOKENS
+)
+
+ONNX_MODEL_FILE = "model.onnx"
+QUANTIZED_MODEL_FILE = "model.int8.onnx"
+META_FILE = "export.json"
+
+SAMPLE_TEXTS = [
+    "Invoice Number: INV-1001 Vendor: ABC Corp Date: 2024-01-15",
+    "Description Qty Price Widget A 10 5.00 Widget B 2 12.50",
+    "Subtotal 75.00 VAT 15.00 Total 90.00 Amount due within 30 days",
+    "Bill To: Example Ltd, 1 High Street, London",
+    "Consulting services March 2024 40 hours at 95.00",
+    "Total Amount Due: £1,250.00 Payment terms: Net 30",
+]
+
+
+def _load_torch_model(model_name: str = EMBEDDING_MODEL_NAME):
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(model_name)
+    model.max_seq_length = RAG_CHUNK_MAX_TOKENS
+    return model
+
+
+class OnnxEmbeddingModel:
+    """Drop-in replacement for SentenceTransformer.encode backed by an exported ONNX transformer.
+
+    Runs the transformer in ONNX Runtime and applies the same mean pooling as all-MiniLM-L6-v2,
+    so PyTorch is not needed at inference time.
+    """
+
+    def __init__(self, model_dir: str = EMBEDDING_ONNX_DIR, quantized: bool = True,
+                 max_seq_length: int = RAG_CHUNK_MAX_TOKENS):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+        path = os.path.join(model_dir, QUANTIZED_MODEL_FILE if quantized else ONNX_MODEL_FILE)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No exported ONNX model at {path}")
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.max_seq_length = max_seq_length
+        logger.info(f"Loaded ONNX embedding model from {path}")
+
+    def encode(self, texts, batch_size: int = 32, normalize_embeddings: bool = False, **kwargs) -> np.ndarray:
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        batches = []
+        for start in range(0, len(texts), max(batch_size, 1)):
+            encoded = self.tokenizer(texts[start:start + batch_size], padding=True, truncation=True,
+                                     max_length=self.max_seq_length, return_tensors="np")
+            feeds = {name: encoded[name].astype(np.int64) for name in self.input_names if name in encoded}
+            token_embeddings = self.session.run(None, feeds)[0]
+            mask = encoded["attention_mask"][..., None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            batches.append(pooled)
+        embeddings = np.concatenate(batches).astype(np.float32) if batches else np.zeros((0, 384), np.float32)
+        if normalize_embeddings:
+            embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings[0] if single else embeddings
+
+
+def compare_embeddings(reference: np.ndarray, candidate: np.ndarray) -> Dict[str, float]:
+    """Row-wise cosine similarity between two embedding matrices."""
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    cosine = (reference * candidate).sum(axis=1)
+    return {"min_cosine": round(float(cosine.min()), 5), "mean_cosine": round(float(cosine.mean()), 5)}
+
+
+def export_onnx_model(model_name: str = EMBEDDING_MODEL_NAME, model_dir: str = EMBEDDING_ONNX_DIR,
+                      check_texts: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Export the transformer to ONNX, quantize it to int8 and check it against the PyTorch embeddings.
+
+    The result of the accuracy check is written next to the model; `load_embedding_model` refuses
+    a quantized model whose minimum cosine similarity was below EMBEDDING_ONNX_MIN_COSINE.
+    """
+    import torch
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    os.makedirs(model_dir, exist_ok=True)
+    st_model = _load_torch_model(model_name)
+    transformer = st_model[0].auto_model.eval()
+    st_model.tokenizer.save_pretrained(model_dir)
+
+    dummy = st_model.tokenizer(["example invoice text"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in dummy]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    onnx_path = os.path.join(model_dir, ONNX_MODEL_FILE)
+    with torch.no_grad():
+        torch.onnx.export(transformer, tuple(dummy[name] for name in input_names), onnx_path,
+                          input_names=input_names, output_names=["last_hidden_state"],
+                          dynamic_axes=dynamic_axes, opset_version=14)
+    quantized_path = os.path.join(model_dir, QUANTIZED_MODEL_FILE)
+    quantize_dynamic(onnx_path, quantized_path, weight_type=QuantType.QInt8)
+
+    texts = check_texts or SAMPLE_TEXTS
+    reference = st_model.encode(texts, normalize_embeddings=True)
+    meta = {"model_name": model_name, "max_seq_length": RAG_CHUNK_MAX_TOKENS}
+    for label, quantized in (("fp32", False), ("int8", True)):
+        candidate = OnnxEmbeddingModel(model_dir, quantized=quantized).encode(texts, normalize_embeddings=True)
+        meta[label] = compare_embeddings(reference, candidate)
+    meta["size_mb"] = {
+        "fp32": round(os.path.getsize(onnx_path) / 2 ** 20, 1),
+        "int8": round(os.path.getsize(quantized_path) / 2 ** 20, 1)
+    }
+    with open(os.path.join(model_dir, META_FILE), "w") as f:
+        json.dump(meta, f, indent=4)
+    logger.info(f"Exported ONNX embedding model to {model_dir}: {meta}")
+    return meta
+
+
+def load_embedding_model(backend: str = EMBEDDING_BACKEND, model_name: str = EMBEDDING_MODEL_NAME,
+                         model_dir: str = EMBEDDING_ONNX_DIR):
+    """Model exposing `encode` for the configured backend, falling back to PyTorch if ONNX is unusable."""
+    if backend == "onnx":
+        try:
+            with open(os.path.join(model_dir, META_FILE), "r") as f:
+                meta = json.load(f)
+            if meta.get("model_name") != model_name:
+                raise ValueError(f"exported model is {meta.get('model_name')}, expected {model_name}")
+            min_cosine = meta.get("int8", {}).get("min_cosine", 0)
+            if min_cosine < EMBEDDING_ONNX_MIN_COSINE:
+                raise ValueError(f"int8 accuracy check failed (min cosine {min_cosine})")
+            return OnnxEmbeddingModel(model_dir)
+        except (ImportError, FileNotFoundError, ValueError, json.JSONDecodeError) as e:
+            logger.warning(f"ONNX embedding backend unavailable ({str(e)}), using PyTorch")
+    elif backend != "torch":
+        logger.warning(f"Unknown embedding backend '{backend}', using PyTorch")
+    return _load_torch_model(model_name)
+
+
+def benchmark_backends(texts: List[str], model_dir: str = EMBEDDING_ONNX_DIR, batch_size: int = 32) -> List[Dict[str, Any]]:
+    """Throughput of each backend on the same texts, and accuracy relative to PyTorch."""
+    backends = [("torch", _load_torch_model())]
+    for label, quantized in (("onnx_fp32", False), ("onnx_int8", True)):
+        try:
+            backends.append((label, OnnxEmbeddingModel(model_dir, quantized=quantized)))
+        except (ImportError, FileNotFoundError) as e:
+            logger.warning(f"Skipping {label}: {str(e)}")
+
+    results, reference = [], None
+    for label, model in backends:
+        model.encode(texts[:batch_size], batch_size=batch_size)  # warm-up
+        start = time.perf_counter()
+        embeddings = model.encode(texts, batch_size=batch_size, normalize_embeddings=True)
+        seconds = time.perf_counter() - start
+        if reference is None:
+            reference = embeddings
+        row = {"backend": label, "texts_per_second": round(len(texts) / seconds, 1),
+               "ms_per_text": round(seconds / len(texts) * 1000, 3)}
+        row.update(compare_embeddings(reference, embeddings))
+        results.append(row)
+        logger.info(f"Benchmark {label}: {row}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or benchmark the sentence embedding backends")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("export", help="Export the model to ONNX, quantize to int8 and check accuracy")
+    bench_parser = subparsers.add_parser("benchmark", help="Throughput and accuracy of each backend")
+    bench_parser.add_argument("--texts", type=int, default=256, help="Number of invoice-like texts to encode")
+    bench_parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        print(json.dumps(export_onnx_model(), indent=4))
+        return
+
+    texts = [SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)] + f" ref {i}" for i in range(args.texts)]
+    for row in benchmark_backends(texts, batch_size=args.batch_size):
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
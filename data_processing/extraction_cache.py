@@ -0,0 +1,178 @@
+# /data_processing/extraction_cache.py
+# Reuses LLM extraction results for invoices whose text was already seen, even from different PDF bytes.
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+import numpy as np
+from config.logging_config import logger
+from config.settings import (
+    EXTRACTION_CACHE_FILE, EXTRACTION_CACHE_MAX_ENTRIES, EXTRACTION_CACHE_MIN_SIMILARITY
+)
+from data_processing.prompt_preparation import normalize_invoice_text
+
+SHINGLE_SIZE = 3
+# 64 MinHash values in 16 LSH bands of 4: pairs with Jaccard 0.7 become candidates with probability
+# ~0.98, pairs at 0.2 with ~0.03
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16
+MINHASH_PRIME = 4294967311  # smallest prime above 2**32
+_rng = np.random.default_rng(20240601)
+_MINHASH_A = _rng.integers(1, 2 ** 31, MINHASH_PERMUTATIONS, dtype=np.uint64)
+_MINHASH_B = _rng.integers(0, 2 ** 32, MINHASH_PERMUTATIONS, dtype=np.uint64)
+DIGIT_GROUPING = re.compile(r"(?<=\d),(?=\d{3})")
+
+
+def normalize_for_fingerprint(text: str) -> str:
+    """Whitespace-, case- and thousands-separator-insensitive form of the invoice text."""
+    return DIGIT_GROUPING.sub("", "\n".join(normalize_invoice_text(text)).lower())
+
+
+def minhash(normalized_text: str) -> np.ndarray:
+    """MinHash signature over word 3-shingles; the share of equal values estimates Jaccard similarity."""
+    words = normalized_text.split()
+    shingles = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(max(1, len(words) - SHINGLE_SIZE + 1))}
+    hashes = np.array([int.from_bytes(hashlib.blake2b(s.encode(), digest_size=4).digest(), "big")
+                       for s in shingles], dtype=np.uint64)
+    # (a * x + b) mod p per permutation; a < 2**31 and x < 2**32 keep the product inside uint64
+    permuted = (np.outer(hashes, _MINHASH_A) + _MINHASH_B) % np.uint64(MINHASH_PRIME)
+    return (permuted.min(axis=0) & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+
+
+class ExtractionCache:
+    """Extracted fields keyed by a fingerprint of the normalized invoice text.
+
+    An exact match compares a SHA-256 of the normalized text. Near matches use a MinHash signature
+    with an LSH index: the signature is split into LSH_BANDS bands, texts sharing any band exactly
+    are candidates, and the best candidate is accepted if its estimated Jaccard similarity reaches
+    `min_similarity`. A near match is only reused if the cached invoice number and total both occur
+    in the new text, so a different invoice on the same template is never served from the cache.
+    The cache is persisted to a JSON file and bounded to `max_entries` (oldest evicted first).
+    """
+
+    def __init__(self, cache_file: str = EXTRACTION_CACHE_FILE, max_entries: int = EXTRACTION_CACHE_MAX_ENTRIES,
+                 min_similarity: float = EXTRACTION_CACHE_MIN_SIMILARITY):
+        self.cache_file = cache_file
+        self.max_entries = max_entries
+        self.min_similarity = min_similarity
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._signatures: Dict[str, np.ndarray] = {}
+        self._buckets: Dict[tuple, set] = {}
+        self._lock = threading.Lock()
+        self.stats = {"exact_hits": 0, "near_hits": 0, "guard_rejections": 0, "misses": 0}
+        self._load()
+
+    @staticmethod
+    def _band_keys(signature: np.ndarray) -> List[tuple]:
+        rows = MINHASH_PERMUTATIONS // LSH_BANDS
+        return [(band, signature[band * rows:(band + 1) * rows].tobytes()) for band in range(LSH_BANDS)]
+
+    def _index(self, key: str, entry: Dict[str, Any]):
+        signature = np.frombuffer(bytes.fromhex(entry["minhash"]), dtype=np.uint32)
+        self._entries[key] = entry
+        self._signatures[key] = signature
+        for band_key in self._band_keys(signature):
+            self._buckets.setdefault(band_key, set()).add(key)
+
+    def _remove(self, key: str):
+        del self._entries[key]
+        for band_key in self._band_keys(self._signatures.pop(key)):
+            bucket = self._buckets.get(band_key)
+            if bucket:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band_key]
+
+    def _load(self):
+        try:
+            with open(self.cache_file, "r") as f:
+                stored = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        if stored.get("minhash") != [MINHASH_PERMUTATIONS, LSH_BANDS]:
+            logger.info("Extraction cache was built with a different fingerprint; starting empty")
+            return
+        for key, entry in stored.get("entries", {}).items():
+            self._index(key, entry)
+        logger.info(f"Loaded {len(self._entries)} cached extractions from {self.cache_file}")
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.cache_file) or ".", exist_ok=True)
+        tmp_path = f"{self.cache_file}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"minhash": [MINHASH_PERMUTATIONS, LSH_BANDS], "entries": self._entries}, f, separators=(",", ":"))
+        os.replace(tmp_path, self.cache_file)
+
+    @staticmethod
+    def _guard(fields: Dict[str, Any], normalized_text: str) -> bool:
+        """The cached key fields must literally appear in the new document."""
+        invoice_number = str(fields.get("invoice_number") or "").lower()
+        total = DIGIT_GROUPING.sub("", str(fields.get("total_amount") or ""))
+        return bool(invoice_number and total) and invoice_number in normalized_text and total in normalized_text
+
+    def lookup(self, text: str) -> Optional[Dict[str, Any]]:
+        """Cached fields for this text as {'fields', 'match': 'exact' | 'near', 'similarity'}, or None."""
+        normalized = normalize_for_fingerprint(text)
+        key = hashlib.sha256(normalized.encode()).hexdigest()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.stats["exact_hits"] += 1
+                return {"fields": dict(entry["fields"]), "match": "exact", "similarity": 1.0}
+            signature = minhash(normalized)
+            candidates = set()
+            for band_key in self._band_keys(signature):
+                candidates |= self._buckets.get(band_key, set())
+            best, best_similarity = None, self.min_similarity
+            for candidate in candidates:
+                similarity = float(np.mean(self._signatures[candidate] == signature))
+                if similarity >= best_similarity:
+                    best, best_similarity = candidate, similarity
+            if best is None:
+                self.stats["misses"] += 1
+                return None
+            fields = self._entries[best]["fields"]
+            if not self._guard(fields, normalized):
+                self.stats["guard_rejections"] += 1
+                return None
+            self.stats["near_hits"] += 1
+            return {"fields": dict(fields), "match": "near", "similarity": round(best_similarity, 3)}
+
+    def put(self, text: str, fields: Dict[str, Any]):
+        """Remember the fields extracted from this text and persist the cache."""
+        normalized = normalize_for_fingerprint(text)
+        key = hashlib.sha256(normalized.encode()).hexdigest()
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._index(key, {"minhash": minhash(normalized).tobytes().hex(), "fields": fields,
+                              "created": datetime.now().isoformat()})
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+            try:
+                self._save()
+            except OSError as e:
+                logger.warning(f"Failed to persist extraction cache: {str(e)}")
+
+    def invalidate(self, invoice_number: Optional[str]) -> int:
+        """Drop cached extractions for an invoice, e.g. after a reviewer corrected it."""
+        if not invoice_number:
+            return 0
+        with self._lock:
+            keys = [key for key, entry in self._entries.items()
+                    if entry["fields"].get("invoice_number") == invoice_number]
+            for key in keys:
+                self._remove(key)
+            if keys:
+                self._save()
+        return len(keys)
+
+    def status(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), **self.stats}
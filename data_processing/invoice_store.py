@@ -0,0 +1,155 @@
+# /data_processing/invoice_store.py
+# In-memory view of structured_invoices.json with group-committed writes.
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import atexit
+import json
+import threading
+import time
+from typing import Callable, Dict, Any, List, Optional
+from config.logging_config import logger
+from config.settings import INVOICES_FILE, INVOICE_STORE_FLUSH_EVERY, INVOICE_STORE_FLUSH_MS
+
+
+class InvoiceStore:
+    """Invoice records keyed by invoice number, persisted with group commit.
+
+    Pipeline stages `stage` their intermediate updates, which are visible to readers but never
+    written. `commit` finalizes an invoice; the file is rewritten once every `flush_every` commits,
+    or `flush_ms` after the first unwritten commit, in one atomic replace. Direct edits (review,
+    API updates) pass `flush=True` to be durable before returning. State derived from the invoices
+    can persist on the same cadence through `add_flush_listener`.
+    """
+
+    def __init__(self, invoices_file: str = INVOICES_FILE, flush_every: int = INVOICE_STORE_FLUSH_EVERY,
+                 flush_ms: int = INVOICE_STORE_FLUSH_MS):
+        self.invoices_file = invoices_file
+        self.flush_every = max(1, flush_every)
+        self.flush_ms = flush_ms
+        self._lock = threading.RLock()
+        self._records: Dict[str, Dict[str, Any]] = {}
+        self._in_progress: Dict[str, Dict[str, Any]] = {}
+        self._unflushed = 0
+        self._timer: Optional[threading.Timer] = None
+        self.flush_count = 0
+        self._flush_listeners: List[Callable[[], None]] = []
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.invoices_file, "r") as f:
+                stored = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            stored = []
+        for record in stored:
+            # Records without a number were written by older versions; keep them addressable
+            key = record.get("invoice_number") or f"_unnumbered_{len(self._records)}"
+            self._records[key] = record
+        logger.info(f"Loaded {len(self._records)} invoices from {self.invoices_file}")
+
+    @staticmethod
+    def _merge(previous: Optional[Dict[str, Any]], entry: Dict[str, Any]) -> Dict[str, Any]:
+        record = dict(entry)
+        if previous and "original_path" in previous and "original_path" not in record:
+            record["original_path"] = previous["original_path"]
+        return record
+
+    def stage(self, entry: Dict[str, Any]):
+        """Buffer an in-progress update; readers see it, nothing is written."""
+        invoice_number = entry["invoice_number"]
+        with self._lock:
+            previous = self._in_progress.get(invoice_number) or self._records.get(invoice_number)
+            self._in_progress[invoice_number] = self._merge(previous, entry)
+
+    def commit(self, entry: Dict[str, Any], flush: bool = False) -> Dict[str, Any]:
+        """Finalize an invoice record; it is written with the next group flush."""
+        invoice_number = entry["invoice_number"]
+        with self._lock:
+            previous = self._in_progress.pop(invoice_number, None) or self._records.get(invoice_number)
+            record = self._merge(previous, entry)
+            self._records[invoice_number] = record
+            self._unflushed += 1
+            if flush or self._unflushed >= self.flush_every:
+                self.flush()
+            elif self.flush_ms and self._timer is None:
+                self._timer = threading.Timer(self.flush_ms / 1000.0, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        return record
+
+    def update(self, invoice_number: str, fields: Dict[str, Any], flush: bool = True) -> Optional[Dict[str, Any]]:
+        """Apply edits to a committed invoice and write them immediately, unless the caller
+        batches several updates and flushes once. None if not found."""
+        with self._lock:
+            record = self._records.get(invoice_number)
+            if record is None:
+                return None
+            record.update(fields)
+            self._unflushed += 1
+            if flush:
+                self.flush()
+            return dict(record)
+
+    def add_flush_listener(self, listener: Callable[[], None]):
+        """Call `listener` after every flush, e.g. to persist derived statistics alongside."""
+        self._flush_listeners.append(listener)
+
+    def flush(self):
+        """Write all committed records in one atomic replace."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._unflushed:
+                return
+            start = time.perf_counter()
+            os.makedirs(os.path.dirname(self.invoices_file) or ".", exist_ok=True)
+            tmp_path = f"{self.invoices_file}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(list(self._records.values()), f, separators=(",", ":"))
+            os.replace(tmp_path, self.invoices_file)
+            written, self._unflushed = self._unflushed, 0
+            self.flush_count += 1
+        logger.info(f"Flushed {written} invoice updates to {self.invoices_file} "
+                    f"in {(time.perf_counter() - start) * 1000:.1f}ms")
+        for listener in self._flush_listeners:
+            try:
+                listener()
+            except Exception as e:
+                logger.warning(f"Flush listener failed: {str(e)}")
+
+    def get(self, invoice_number: str, include_in_progress: bool = True) -> Optional[Dict[str, Any]]:
+        """Latest view of an invoice, including in-progress stages unless disabled."""
+        with self._lock:
+            record = (self._in_progress.get(invoice_number) if include_in_progress else None) or \
+                self._records.get(invoice_number)
+            return dict(record) if record else None
+
+    def all(self, include_in_progress: bool = True) -> List[Dict[str, Any]]:
+        """All invoices; in-progress ones show their latest stage."""
+        with self._lock:
+            records = [dict(self._in_progress.get(key, record)) if include_in_progress else dict(record)
+                       for key, record in self._records.items()]
+            if include_in_progress:
+                records.extend(dict(record) for key, record in self._in_progress.items()
+                               if key not in self._records)
+            return records
+
+    def committed(self) -> List[Dict[str, Any]]:
+        return self.all(include_in_progress=False)
+
+
+_invoice_store: Optional[InvoiceStore] = None
+_invoice_store_lock = threading.Lock()
+
+
+def get_invoice_store() -> InvoiceStore:
+    """Process-wide InvoiceStore shared by the workflow, the APIs and the anomaly detector."""
+    global _invoice_store
+    with _invoice_store_lock:
+        if _invoice_store is None:
+            _invoice_store = InvoiceStore()
+            atexit.register(_invoice_store.flush)
+        return _invoice_store
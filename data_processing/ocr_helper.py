@@ -2,20 +2,43 @@
 
 import pytesseract
 from PIL import Image
+import hashlib
 import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from pathlib import Path
+from typing import Dict, Any, List, Optional
+import numpy as np
 from config.logging_config import setup_logging
+from config.monitoring import Deadline, DeadlineExceeded
+from config.settings import OCR_DPI, OCR_WORKERS, OCR_CACHE_DIR, PDF_FIRST_PAGES, PDF_LAST_PAGES
+from data_processing.document_parser import select_pages
 
 logger = setup_logging()
 
-def ocr_process_image(image_path: str) -> str:
+# Concurrent Tesseract processes each get one thread instead of competing for every core
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+# Bumped when preprocessing changes so cached page images are regenerated
+PREPROCESS_VERSION = 1
+DESKEW_ANGLES = np.arange(-5.0, 5.5, 0.5)
+
+_raster_pool: Optional[ProcessPoolExecutor] = None
+
+def _tesseract_timeout(deadline: Optional[Deadline]) -> float:
+    """pytesseract timeout (0 = none); Tesseract is killed when the deadline runs out."""
+    remaining = deadline.remaining() if deadline is not None else None
+    return 0 if remaining is None else max(remaining, 0.001)
+
+def ocr_process_image(image_path: str, deadline: Optional[Deadline] = None) -> str:
     try:
         if not Path(image_path).exists():
             logger.error(f"Image file not found: {image_path}")
             raise FileNotFoundError(f"Image file not found: {image_path}")
         logger.info(f"Processing image with OCR: {image_path}")
         with Image.open(image_path) as img:
-            text = pytesseract.image_to_string(img)
+            text = pytesseract.image_to_string(img, timeout=_tesseract_timeout(deadline))
         if not text.strip():
             logger.warning(f"No text extracted from image: {image_path}")
             raise ValueError(f"No text extracted from image: {image_path}")
@@ -23,4 +46,134 @@ def ocr_process_image(image_path: str) -> str:
         return text.strip()
     except Exception as e:
         logger.error(f"Error performing OCR on {image_path}: {str(e)}")
-        raise RuntimeError(f"Failed to process image {image_path}: {str(e)}")
\ No newline at end of file
+        raise RuntimeError(f"Failed to process image {image_path}: {str(e)}")
+
+def otsu_threshold(gray: np.ndarray) -> int:
+    """Global threshold maximising between-class variance of the grey-level histogram."""
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    weights = np.cumsum(hist)
+    means = np.cumsum(hist * np.arange(256))
+    total_weight, total_mean = weights[-1], means[-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        between = (total_mean * weights - means * total_weight) ** 2 / (weights * (total_weight - weights))
+    return int(np.nanargmax(between))
+
+def estimate_skew(binary: Image.Image) -> float:
+    """Angle (degrees) whose rotation gives the sharpest horizontal text-line profile."""
+    small = binary.copy()
+    small.thumbnail((800, 800))
+    ink = Image.fromarray(255 - np.asarray(small))
+    best_angle, best_score = 0.0, -1.0
+    for angle in DESKEW_ANGLES:
+        rows = np.asarray(ink.rotate(float(angle), expand=False)).sum(axis=1, dtype=np.float64)
+        score = float(np.var(np.diff(rows)))
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+def preprocess_page(image: Image.Image) -> Image.Image:
+    """Greyscale, deskew and binarize a rendered page for Tesseract."""
+    gray = image.convert("L")
+    threshold = otsu_threshold(np.asarray(gray))
+    binary = gray.point(lambda v: 255 if v > threshold else 0)
+    angle = estimate_skew(binary)
+    if angle:
+        gray = gray.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+        binary = gray.point(lambda v: 255 if v > threshold else 0)
+    return binary.convert("1")
+
+def _rasterize_page(pdf_path: str, page_index: int, dpi: int, output_path: str) -> Dict[str, Any]:
+    """Process-pool worker: render one page, preprocess it and write it to the cache."""
+    import pypdfium2 as pdfium
+    start = time.perf_counter()
+    pdf = pdfium.PdfDocument(pdf_path)
+    try:
+        image = pdf[page_index].render(scale=dpi / 72).to_pil()
+    finally:
+        pdf.close()
+    rendered = time.perf_counter()
+    processed = preprocess_page(image)
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    processed.save(tmp_path, format="PNG")
+    os.replace(tmp_path, output_path)
+    return {
+        "page": page_index + 1,
+        "rasterize_ms": round((rendered - start) * 1000, 1),
+        "preprocess_ms": round((time.perf_counter() - rendered) * 1000, 1)
+    }
+
+def _get_raster_pool() -> ProcessPoolExecutor:
+    global _raster_pool
+    if _raster_pool is None:
+        _raster_pool = ProcessPoolExecutor(max_workers=OCR_WORKERS)
+    return _raster_pool
+
+def _file_digest(path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+def _ocr_page(image_path: str, timeout: float = 0) -> str:
+    with Image.open(image_path) as img:
+        return pytesseract.image_to_string(img, timeout=timeout)
+
+def ocr_process_pdf(pdf_path: str, dpi: int = OCR_DPI, first_pages: int = PDF_FIRST_PAGES,
+                    last_pages: int = PDF_LAST_PAGES, cache_dir: str = OCR_CACHE_DIR,
+                    deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+    """OCR a scanned PDF: pages are rasterized in a process pool, preprocessed images are cached
+    by document hash, and Tesseract runs on the pages concurrently.
+
+    With a `deadline`, pages not yet rasterized are cancelled, no further page is started and
+    running Tesseract processes are killed once it runs out (DeadlineExceeded / RuntimeError).
+
+    Returns {"text": ..., "pages": [per-page timings]}.
+    """
+    import pypdfium2 as pdfium
+    logger.info(f"Running OCR fallback on PDF: {pdf_path}")
+    pdf = pdfium.PdfDocument(pdf_path)
+    try:
+        page_count = len(pdf)
+    finally:
+        pdf.close()
+    page_indices = select_pages(page_count, first_pages, last_pages)
+
+    digest = _file_digest(pdf_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    cached_paths = {i: os.path.join(cache_dir, f"{digest}_v{PREPROCESS_VERSION}_{dpi}dpi_p{i + 1}.png")
+                    for i in page_indices}
+    timings: Dict[int, Dict[str, Any]] = {}
+    pending = {}
+    for i, path in cached_paths.items():
+        if os.path.exists(path):
+            timings[i] = {"page": i + 1, "cached": True}
+        else:
+            pending[i] = _get_raster_pool().submit(_rasterize_page, pdf_path, i, dpi, path)
+    try:
+        for i, future in pending.items():
+            try:
+                result = future.result(timeout=deadline.remaining() if deadline is not None else None)
+            except FutureTimeoutError:
+                raise DeadlineExceeded("ocr", deadline)
+            timings[i] = {**result, "cached": False}
+    except Exception:
+        for future in pending.values():
+            future.cancel()
+        raise
+
+    def run_tesseract(i: int) -> str:
+        if deadline is not None:
+            deadline.check("ocr")
+        start = time.perf_counter()
+        text = _ocr_page(cached_paths[i], _tesseract_timeout(deadline))
+        timings[i]["ocr_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return text
+
+    with ThreadPoolExecutor(max_workers=OCR_WORKERS) as executor:
+        texts = list(executor.map(run_tesseract, page_indices))
+
+    text = "\n".join(texts).strip()
+    pages = [timings[i] for i in page_indices]
+    logger.info(f"OCR extracted {len(text)} characters from {len(pages)} pages of {pdf_path}: {pages}")
+    return {"text": text, "pages": pages}
@@ -1,20 +1,150 @@
-import pandas as pd
-from fuzzywuzzy import fuzz
-from models.invoice import InvoiceData  # Adjust import based on your structure
+# /data_processing/po_matcher.py
+# Matches invoices to approved purchase orders, one invoice or a whole batch at a time.
+#
+#   python -m data_processing.po_matcher            # re-match processed invoices and report
+#   python -m data_processing.po_matcher --write    # ... and store the new matching results
+#
+# While the API is running, use POST /api/invoices/rematch instead so the write goes through its store.
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import argparse
+from collections import Counter
+from typing import Dict, Any, List, Optional
+import numpy as np
+from rapidfuzz import fuzz, process, utils as fuzz_utils
+from models.invoice import InvoiceData
 from config.logging_config import logger
+from config.settings import PO_MATCH_THRESHOLD
+from data_processing.vendor_master import VendorMaster, VendorSnapshot, get_vendor_master, normalize_po_number
+from data_processing.invoice_store import InvoiceStore, get_invoice_store
+
 
 class POMatcher:
-    def __init__(self, vendor_data_path: str = "data/raw/vendor_data.csv"):
-        self.vendor_data = pd.read_csv(vendor_data_path)
-    
+    """Two-tier matcher over the shared vendor master.
+
+    Tier 1 looks the invoice's PO number up in the approved-PO index and accepts it only if the PO's
+    vendor resembles the invoice vendor (same token_sort_ratio threshold). Remaining invoices are
+    scored against every vendor in one token_sort_ratio matrix (rapidfuzz cdist), and the best
+    vendor above the threshold supplies the PO.
+    """
+
+    def __init__(self, vendor_master: Optional[VendorMaster] = None, threshold: float = PO_MATCH_THRESHOLD):
+        self.vendor_master = vendor_master or get_vendor_master()
+        self.threshold = threshold
+
+    @property
+    def vendor_data(self):
+        return self.vendor_master.snapshot.po_data
+
+    @staticmethod
+    def _error(message: str) -> Dict[str, Any]:
+        return {"status": "error", "message": message, "po_number": None, "match_confidence": 0.0}
+
+    def score_matrix(self, snapshot: VendorSnapshot, vendor_names: List[str]) -> np.ndarray:
+        """Similarity in [0, 1] of each invoice vendor name (rows) to each vendor (columns)."""
+        queries = [fuzz_utils.default_process(str(name)) for name in vendor_names]
+        scores = process.cdist(queries, snapshot.vendor_choices, scorer=fuzz.token_sort_ratio,
+                               dtype=np.float32, workers=-1)
+        return scores / 100.0
+
+    def match_many(self, invoices: List[InvoiceData]) -> List[Dict[str, Any]]:
+        """Match a batch of invoices against one vendor-master snapshot."""
+        snapshot = self.vendor_master.snapshot
+        if snapshot.po_data.empty:
+            logger.warning("No PO data available for matching")
+            return [self._error("No PO data available") for _ in invoices]
+
+        results: List[Optional[Dict[str, Any]]] = [None] * len(invoices)
+        fuzzy_rows = []
+        vendor_mismatches: Dict[int, str] = {}
+        for i, invoice in enumerate(invoices):
+            key = normalize_po_number(invoice.po_number)
+            po_match = snapshot.po_index.get(key) if key else None
+            if po_match:
+                vendor_score = fuzz.token_sort_ratio(str(invoice.vendor_name), str(po_match["vendor_name"]),
+                                                     processor=fuzz_utils.default_process) / 100.0
+                if vendor_score > self.threshold:
+                    logger.info(f"PO {po_match['po_number']} on invoice {invoice.invoice_number} is approved for {po_match['vendor_name']}")
+                    results[i] = {"status": "matched", "po_number": po_match["po_number"],
+                                  "match_confidence": 1.0, "match_tier": "po_number"}
+                    continue
+                # A valid PO number quoted by the wrong vendor is not a match; fall back to the vendor name
+                logger.warning(f"PO {po_match['po_number']} on invoice {invoice.invoice_number} belongs to "
+                               f"{po_match['vendor_name']}, not {invoice.vendor_name} (similarity {vendor_score:.2f})")
+                vendor_mismatches[i] = po_match["po_number"]
+            fuzzy_rows.append(i)
+
+        if fuzzy_rows:
+            scores = self.score_matrix(snapshot, [invoices[i].vendor_name for i in fuzzy_rows])
+            best = scores.argmax(axis=1)
+            for row, i in enumerate(fuzzy_rows):
+                confidence = round(float(scores[row, best[row]]), 4)
+                if confidence > self.threshold:
+                    results[i] = {"status": "matched", "po_number": snapshot.po_lists[best[row]],
+                                  "match_confidence": confidence, "match_tier": "vendor_fuzzy"}
+                else:
+                    results[i] = {"status": "unmatched", "po_number": None,
+                                  "match_confidence": 0.0, "match_tier": "none"}
+                if i in vendor_mismatches:
+                    results[i]["po_vendor_mismatch"] = vendor_mismatches[i]
+
+        logger.info(f"Matched {len(invoices)} invoices: {dict(Counter(r.get('match_tier') for r in results))}")
+        return results
+
+    def match(self, invoice: InvoiceData) -> Dict[str, Any]:
+        return self.match_many([invoice])[0]
+
     def match_invoice(self, invoice: InvoiceData) -> tuple:
-        best_match = None
-        best_score = 0
-        for _, row in self.vendor_data.iterrows():
-            score = fuzz.token_set_ratio(invoice.vendor_name, row['Vendor Name'])
-            if score > best_score:
-                best_score = score
-                best_match = row['Approved PO List']  # Single PO number
-        confidence = best_score / 100.0 if best_match else 0.0
-        logger.info(f"Matched invoice to PO {best_match} with confidence {confidence}")
-        return best_match, confidence
\ No newline at end of file
+        """(po_number, confidence) for one invoice."""
+        result = self.match(invoice)
+        logger.info(f"Matched invoice to PO {result['po_number']} with confidence {result['match_confidence']}")
+        return result["po_number"], result["match_confidence"]
+
+
+def rematch_invoices(write: bool = False, store: Optional[InvoiceStore] = None,
+                     matcher: Optional[POMatcher] = None) -> Dict[str, Any]:
+    """Re-run matching over processed invoices, e.g. after the vendor master changed.
+
+    With `write`, changed results are applied through the invoice store and flushed once.
+    """
+    store = store or get_invoice_store()
+    records = [record for record in store.committed() if record.get("invoice_number")]
+    rows, invoices = [], []
+    for i, record in enumerate(records):
+        try:
+            invoices.append(InvoiceData(
+                vendor_name=record.get("vendor_name") or "",
+                invoice_number=record.get("invoice_number") or "",
+                invoice_date=record.get("invoice_date"),
+                total_amount=record.get("total_amount") or "0",
+                confidence=record.get("confidence", 0.0) or 0.0,
+                po_number=record.get("po_number")
+            ))
+            rows.append(i)
+        except Exception as e:
+            logger.debug(f"Skipping invoice {record.get('invoice_number')} for re-matching: {str(e)}")
+    results = (matcher or POMatcher()).match_many(invoices)
+    changed = 0
+    for i, result in zip(rows, results):
+        record = records[i]
+        fields = {"matching_status": result["status"], "match_tier": result.get("match_tier"),
+                  "matched_po_number": result["po_number"],
+                  "po_vendor_mismatch": result.get("po_vendor_mismatch")}
+        if all(record.get(key) == value for key, value in fields.items()):
+            continue
+        changed += 1
+        if write:
+            store.update(record["invoice_number"], fields, flush=False)
+    if write and changed:
+        store.flush()
+    return {"invoices": len(rows), "changed": changed,
+            "tiers": dict(Counter(r.get("match_tier") for r in results))}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-match processed invoices against the vendor master")
+    parser.add_argument("--write", action="store_true", help="Store the new matching results")
+    args = parser.parse_args()
+    print(rematch_invoices(write=args.write))
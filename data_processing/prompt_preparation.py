@@ -0,0 +1,73 @@
+# /data_processing/prompt_preparation.py
+# Compacts extracted invoice text before it is sent to the LLM.
+
+import re
+from typing import List, Dict, Any
+from config.settings import PROMPT_MAX_CHARS
+
+LINE_ITEMS_MARKER = re.compile(r"(?i)^(line items|items|description|qty|quantity)\b")
+TOTALS_MARKER = re.compile(r"(?i)^(sub\s*total|total|amount due|balance due|vat|tax)\b")
+# Ends a line-item table wherever it appears in the line ("Grand Total", "Invoice total", ...); VAT/tax
+# alone does not, because those words also appear in headers ("VAT Number")
+ITEMS_END_MARKER = re.compile(r"(?i)\b(total|amount due|balance due)\b")
+# A totals keyword followed by an amount; such a line is never dropped
+TOTAL_AMOUNT_LINE = re.compile(r"(?i)\b(total|amount due|balance due|vat|tax)\b.*?[£$€]?\s*\d[\d,]*(\.\d+)?")
+# Line-item rows kept from the end of a table that never closes, where an unlabelled total may sit
+UNCLOSED_ITEMS_TAIL = 3
+# Lines inside a line-item table that still carry a field the prompt asks for
+FIELD_HINT = re.compile(r"(?i)\b(invoice|vendor|supplier|date|p\.?o\.?|purchase order)\b")
+# Footer and boilerplate lines that never hold a requested field
+BOILERPLATE_LINE = re.compile(
+    r"(?i)^(page \d+( of \d+)?|thank you\b|terms( and|&)? conditions|registered (in|office)|"
+    r"company (reg(istration)?\.?|no\.?|number)|(tel|phone|fax|e-?mail|web(site)?)\s*[:.]|www\.|https?://|"
+    r"(bank|sort code|iban|swift|bic|account (name|no|number))\b)"
+)
+
+
+def normalize_invoice_text(text: str) -> List[str]:
+    """Collapse whitespace and drop empty lines and consecutive duplicates left by PDF extraction."""
+    lines = []
+    for line in text.splitlines():
+        line = " ".join(line.split())
+        if line and (not lines or lines[-1] != line):
+            lines.append(line)
+    return lines
+
+
+def compact_invoice_text(text: str, max_chars: int = PROMPT_MAX_CHARS) -> Dict[str, Any]:
+    """Keep only the lines the extraction prompt needs.
+
+    Whitespace is normalized, boilerplate/footer lines are dropped, and line-item rows are removed
+    unless they mention a requested field or a total amount; if the table never closes, its last
+    rows are kept. If the result is still longer than `max_chars`, the
+    middle is cut so the header (vendor, number, date) and the totals at the end both survive.
+    Returns the prompt text with the character counts before and after.
+    """
+    kept, dropped = [], []
+    in_items = False
+    for line in normalize_invoice_text(text):
+        if BOILERPLATE_LINE.match(line):
+            continue
+        if LINE_ITEMS_MARKER.match(line):
+            in_items = True
+            dropped = []
+            continue
+        if in_items and ITEMS_END_MARKER.search(line):
+            in_items = False
+        if in_items and not (FIELD_HINT.search(line) or TOTAL_AMOUNT_LINE.search(line)):
+            dropped.append(line)
+            continue
+        kept.append(line)
+    if in_items and dropped:
+        # No closing total line was recognised: the total may be among the last rows
+        kept.extend(dropped[-UNCLOSED_ITEMS_TAIL:])
+        dropped = dropped[:-UNCLOSED_ITEMS_TAIL]
+    dropped_items = len(dropped)
+
+    prompt = "\n".join(kept)
+    if max_chars and len(prompt) > max_chars:
+        head = max_chars * 2 // 3
+        # Cut on line boundaries so no field value is split
+        prompt = prompt[:head].rsplit("\n", 1)[0] + "\n...\n" + \
+            prompt[len(prompt) - (max_chars - head):].split("\n", 1)[-1]
+    return {"text": prompt, "raw_chars": len(text), "prompt_chars": len(prompt), "dropped_item_lines": dropped_items}
@@ -0,0 +1,111 @@
+# /data_processing/rag_corrections.py
+# Feeds human review corrections into the RAG error corpus from a background thread.
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import json
+import queue
+import threading
+from typing import Dict, Any, Optional
+from config.logging_config import logger
+from config.settings import CORRECTIONS_FILE, RAG_DEDUPE_SIMILARITY, RAG_SAVE_EVERY
+from data_processing.document_parser import extract_text_from_pdf
+from data_processing.invoice_store import get_invoice_store
+
+
+class CorrectionIndexer:
+    """Adds corrected invoices to an InvoiceRAGIndex so similar layouts are caught at extraction time.
+
+    `submit` only enqueues; text extraction, embedding and index updates happen on a daemon thread,
+    and the index is persisted every RAG_SAVE_EVERY additions or when the queue drains.
+    """
+
+    def __init__(self, rag_index, corrections_file: str = CORRECTIONS_FILE, invoice_store=None):
+        self.rag_index = rag_index
+        self.corrections_file = corrections_file
+        self.invoice_store = invoice_store or get_invoice_store()
+        self.queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue()
+        self._thread = None
+        self._unsaved = 0
+
+    def start(self, replay: bool = True):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, args=(replay,), name="rag-correction-indexer", daemon=True)
+        self._thread.start()
+        logger.info("Started RAG correction indexer")
+
+    def stop(self):
+        if self._thread is not None:
+            self.queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, correction: Dict[str, Any]):
+        """Queue a correction ({'invoice_id': ..., optional 'invoice_text'}) for indexing."""
+        self.queue.put(correction)
+
+    def _replay(self):
+        """Queue corrections recorded before this process started."""
+        try:
+            with open(self.corrections_file, "r") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return
+        replayed = 0
+        for line in lines:
+            try:
+                correction = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if not self.rag_index.has_document(self._document_id(correction)):
+                self.queue.put(correction)
+                replayed += 1
+        logger.info(f"Queued {replayed} stored corrections for the RAG corpus")
+
+    def _run(self, replay: bool):
+        if replay:
+            self._replay()
+        while True:
+            correction = self.queue.get()
+            if correction is None:
+                break
+            try:
+                self._index_correction(correction)
+            except Exception as e:
+                logger.error(f"Failed to index correction for {correction.get('invoice_id')}: {str(e)}")
+            if self._unsaved and (self._unsaved >= RAG_SAVE_EVERY or self.queue.empty()):
+                self._save()
+        if self._unsaved:
+            self._save()
+
+    def _save(self):
+        try:
+            self.rag_index.save()
+            self._unsaved = 0
+        except Exception as e:
+            logger.error(f"Failed to persist RAG index: {str(e)}")
+
+    @staticmethod
+    def _document_id(correction: Dict[str, Any]) -> str:
+        return f"correction:{correction.get('invoice_id')}"
+
+    def _index_correction(self, correction: Dict[str, Any]):
+        document_id = self._document_id(correction)
+        if self.rag_index.has_document(document_id):
+            return
+        text = correction.get("invoice_text") or self._invoice_text(correction.get("invoice_id"))
+        if not text:
+            logger.warning(f"No invoice text available for correction {correction.get('invoice_id')}, skipping")
+            return
+        if self.rag_index.add_invoice(document_id, text, dedupe_similarity=RAG_DEDUPE_SIMILARITY):
+            self._unsaved += 1
+
+    def _invoice_text(self, invoice_id: str) -> Optional[str]:
+        """Re-read the original document of a processed invoice."""
+        invoice = self.invoice_store.get(invoice_id) if invoice_id else None
+        path = invoice.get("original_path") if invoice else None
+        if path and os.path.exists(path) and path.lower().endswith(".pdf"):
+            return extract_text_from_pdf(path)
+        return None
@@ -1,24 +1,129 @@
-from sentence_transformers import SentenceTransformer
 import faiss
 import numpy as np
 import os
+import json
+import math
+import threading
+from typing import List
 from config.logging_config import logger
+from config.settings import (
+    RAG_INDEX_TYPE, RAG_INDEX_PATH, RAG_AUTO_FLAT_MAX, RAG_AUTO_HNSW_MAX,
+    RAG_HNSW_M, RAG_HNSW_EF_SEARCH, RAG_IVF_NPROBE, RAG_PQ_M, RAG_PQ_REFINE_K_FACTOR,
+    RAG_CHUNK_MAX_TOKENS, RAG_SIMILARITY_THRESHOLD
+)
 from data_processing.document_parser import extract_text_from_pdf
+from data_processing.embedding_backend import load_embedding_model
+from data_processing.prompt_preparation import normalize_invoice_text, LINE_ITEMS_MARKER, TOTALS_MARKER
 
-model = SentenceTransformer('all-MiniLM-L6-v2')
+# Loaded on first use, so index tooling that never embeds text (rag_index_tools benchmark) does not pay for it
+_model = None
+_model_lock = threading.Lock()
+
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq")
+# Bumped whenever embeddings change meaning, so persisted indexes are rebuilt
+EMBEDDING_VERSION = 2
+
+def chunk_invoice_text(text: str, max_tokens: int = RAG_CHUNK_MAX_TOKENS) -> List[str]:
+    """Split invoice text into header, line-item and totals sections, each truncated to max_tokens words."""
+    sections = {"header": [], "items": [], "totals": []}
+    current = "header"
+    for line in normalize_invoice_text(text):
+        if current == "header" and LINE_ITEMS_MARKER.match(line):
+            current = "items"
+        elif current != "totals" and TOTALS_MARKER.match(line):
+            current = "totals"
+        sections[current].append(line)
+    chunks = []
+    for lines in sections.values():
+        words = " ".join(lines).split()
+        if words:
+            chunks.append(" ".join(words[:max_tokens]))
+    return chunks
+
+def get_embedding_model():
+    global _model
+    with _model_lock:
+        if _model is None:
+            _model = load_embedding_model()
+        return _model
+
+def compute_embeddings(texts: List[str]) -> np.ndarray:
+    """Encode several texts in one batch into L2-normalized vectors."""
+    embeddings = get_embedding_model().encode(texts, batch_size=max(len(texts), 1), normalize_embeddings=True)
+    return np.asarray(embeddings, dtype=np.float32).reshape(len(texts), -1)
 
 def compute_embedding(text: str, dim: int = 384) -> np.ndarray:
-    """Compute embedding for a given text using SentenceTransformer."""
-    embedding = model.encode(text)
-    return np.array(embedding, dtype=np.float32)
+    """Embed an invoice as the normalized mean of its section embeddings (one encode call)."""
+    chunks = chunk_invoice_text(text) or [""]
+    embedding = compute_embeddings(chunks).mean(axis=0)
+    norm = np.linalg.norm(embedding)
+    return (embedding / norm if norm > 0 else embedding).astype(np.float32)
+
+def select_index_type(corpus_size: int) -> str:
+    """Pick an index type for the corpus size: exact search for small corpora, HNSW, then IVF-PQ."""
+    if corpus_size <= RAG_AUTO_FLAT_MAX:
+        return "flat"
+    if corpus_size <= RAG_AUTO_HNSW_MAX:
+        return "hnsw"
+    return "ivf_pq"
+
+def create_faiss_index(dim: int, index_type: str, corpus_size: int, metric=faiss.METRIC_INNER_PRODUCT):
+    """Create an (untrained) FAISS index of the given type sized for the corpus."""
+    if index_type == "flat":
+        return faiss.IndexFlat(dim, metric)
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, RAG_HNSW_M, metric)
+        index.hnsw.efSearch = RAG_HNSW_EF_SEARCH
+        return index
+    if index_type in ("ivf_flat", "ivf_pq"):
+        # ~4*sqrt(n) lists, keeping at least 39 training points per centroid as FAISS recommends
+        nlist = max(1, min(int(4 * math.sqrt(max(corpus_size, 1))), corpus_size // 39))
+        quantizer = faiss.IndexFlat(dim, metric)
+        if index_type == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, metric)
+        else:
+            if dim % RAG_PQ_M:
+                raise ValueError(f"RAG_PQ_M={RAG_PQ_M} must divide the embedding dimension {dim}")
+            # 8 bits per code needs 256 training points per sub-quantizer; use fewer bits on small corpora
+            nbits = 8 if corpus_size >= 256 * 39 else max(1, min(8, int(math.log2(max(corpus_size // 39, 2)))))
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, RAG_PQ_M, nbits, metric)
+        index.nprobe = min(RAG_IVF_NPROBE, nlist)
+        if index_type == "ivf_pq":
+            # PQ scores are approximate; re-rank the candidates with exact inner products so results
+            # compare correctly against RAG_SIMILARITY_THRESHOLD
+            index = faiss.IndexRefineFlat(index)
+            index.k_factor = RAG_PQ_REFINE_K_FACTOR
+        return index
+    raise ValueError(f"Unknown RAG index type: {index_type} (expected auto or one of {INDEX_TYPES})")
+
+def build_faiss_index(embeddings: np.ndarray, index_type: str = "auto", metric=faiss.METRIC_INNER_PRODUCT):
+    """Create, train if needed and populate an index over the embeddings."""
+    dim = embeddings.shape[1]
+    index_type = select_index_type(len(embeddings)) if index_type == "auto" else index_type
+    index = create_faiss_index(dim, index_type, len(embeddings), metric)
+    if not index.is_trained:
+        index.train(embeddings)
+    if len(embeddings):
+        index.add(embeddings)
+    return index, index_type
 
 class InvoiceRAGIndex:
-    def __init__(self, dim: int = 384):
+    def __init__(self, dim: int = 384, index_type: str = RAG_INDEX_TYPE, index_path: str = RAG_INDEX_PATH):
         self.dim = dim
-        self.index = faiss.IndexFlatL2(dim)
+        self.requested_type = index_type
+        self.index_path = index_path
+        # Guards index/documents: queries run on the request path while corrections are added in the background
+        self._lock = threading.RLock()
+        # Embeddings are kept (in a buffer grown by doubling) so the index can be rebuilt/retrained
+        self._vectors = np.zeros((16, dim), dtype=np.float32)
+        self._count = 0
         self.documents = []  # List of dicts with invoice details
-        logger.debug(f"Initialized FAISS index with dimension {dim}")
-        self.load_test_samples()
+        self._document_ids = set()
+        if not self.load():
+            self.index, self.index_type = build_faiss_index(self.embeddings, "flat")
+            self.load_test_samples()
+            self.build()
+        logger.debug(f"Initialized FAISS {self.index_type} index with dimension {dim}")
 
     def load_test_samples(self):
         """Load test sample invoices into the FAISS index."""
@@ -31,6 +136,8 @@ class InvoiceRAGIndex:
             "invoice_standard_example.pdf"
         ]
         for sample in sample_files:
+            if self.has_document(sample):
+                continue
             path = os.path.join(test_dir, sample)
             if os.path.exists(path):
                 text = extract_text_from_pdf(path)
@@ -41,32 +148,124 @@ class InvoiceRAGIndex:
             else:
                 logger.warning(f"Sample file not found: {path}")
 
-    def add_invoice(self, invoice_id: str, invoice_text: str):
-        embedding = compute_embedding(invoice_text, self.dim)
-        self.index.add(np.expand_dims(embedding, axis=0))
-        self.documents.append({'invoice_id': invoice_id, 'invoice_text': invoice_text})
+    @property
+    def embeddings(self) -> np.ndarray:
+        return self._vectors[:self._count]
+
+    def _append_embedding(self, embedding: np.ndarray):
+        if self._count == len(self._vectors):
+            grown = np.zeros((max(16, 2 * len(self._vectors)), self.dim), dtype=np.float32)
+            grown[:self._count] = self._vectors[:self._count]
+            self._vectors = grown
+        self._vectors[self._count] = embedding
+        self._count += 1
+
+    def build(self, index_type: str = None):
+        """(Re)build the index over all stored embeddings, training it when the type requires it."""
+        index_type = index_type or self.requested_type
+        with self._lock:
+            snapshot = self.embeddings.copy()
+        # Training can be slow, so it runs without the lock; vectors added meanwhile are appended before the swap
+        index, built_type = build_faiss_index(snapshot, index_type)
+        with self._lock:
+            if self._count > len(snapshot):
+                index.add(self.embeddings[len(snapshot):])
+            self.index, self.index_type = index, built_type
+        logger.info(f"Built FAISS {self.index_type} index over {len(snapshot)} invoices")
+
+    def has_document(self, invoice_id: str) -> bool:
+        return invoice_id in self._document_ids
+
+    def add_invoice(self, invoice_id: str, invoice_text: str, dedupe_similarity: float = None) -> bool:
+        """Add an invoice to the index. With `dedupe_similarity`, near-identical texts are skipped."""
+        embedding = np.expand_dims(compute_embedding(invoice_text, self.dim), axis=0)
+        with self._lock:
+            if dedupe_similarity is not None and self.index.ntotal:
+                D, I = self.index.search(embedding, 1)
+                if 0 <= I[0][0] < len(self.documents) and D[0][0] > dedupe_similarity:
+                    logger.info(f"Skipped {invoice_id}: near-duplicate of {self.documents[I[0][0]]['invoice_id']}")
+                    return False
+            self._append_embedding(embedding[0])
+            self.documents.append({'invoice_id': invoice_id, 'invoice_text': invoice_text})
+            self._document_ids.add(invoice_id)
+            # With automatic selection, switch index type once the corpus outgrows the current one
+            rebuild = self.requested_type == "auto" and select_index_type(self._count) != self.index_type
+            if not rebuild:
+                self.index.add(embedding)
+        if rebuild:
+            self.build()
         logger.info(f"Added invoice {invoice_id} to FAISS index")
+        return True
+
+    def save(self, index_path: str = None):
+        """Persist the index, embeddings and documents to a directory."""
+        index_path = index_path or self.index_path
+        os.makedirs(index_path, exist_ok=True)
+        with self._lock:
+            faiss.write_index(self.index, os.path.join(index_path, "index.faiss"))
+            np.save(os.path.join(index_path, "embeddings.npy"), self.embeddings)
+            with open(os.path.join(index_path, "documents.json"), "w") as f:
+                json.dump({"index_type": self.index_type, "embedding_version": EMBEDDING_VERSION,
+                           "documents": self.documents}, f)
+        logger.info(f"Saved FAISS {self.index_type} index with {len(self.documents)} invoices to {index_path}")
+
+    def load(self, index_path: str = None) -> bool:
+        """Load a persisted index (see data_processing/rag_index_tools.py build). Returns False if absent."""
+        index_path = index_path or self.index_path
+        if not os.path.exists(os.path.join(index_path, "documents.json")):
+            return False
+        try:
+            with open(os.path.join(index_path, "documents.json"), "r") as f:
+                meta = json.load(f)
+            if meta.get("embedding_version") != EMBEDDING_VERSION:
+                logger.warning(f"Index at {index_path} uses outdated embeddings, re-embedding its documents")
+                self._reembed(meta.get("documents", []), index_path)
+                return True
+            self.index = faiss.read_index(os.path.join(index_path, "index.faiss"))
+            self._vectors = np.load(os.path.join(index_path, "embeddings.npy")).astype(np.float32)
+            self._count = len(self._vectors)
+        except (FileNotFoundError, json.JSONDecodeError, RuntimeError):
+            return False
+        self.documents = meta["documents"]
+        self._document_ids = {doc['invoice_id'] for doc in self.documents}
+        self.index_type = meta["index_type"]
+        logger.info(f"Loaded FAISS {self.index_type} index with {len(self.documents)} invoices from {index_path}")
+        return True
+
+    def _reembed(self, documents: List[dict], index_path: str):
+        """Rebuild from persisted document texts, so corrections added since the last version survive."""
+        self.index, self.index_type = build_faiss_index(self.embeddings, "flat")
+        for doc in documents:
+            if doc.get("invoice_text") and not self.has_document(doc["invoice_id"]):
+                self.add_invoice(doc["invoice_id"], doc["invoice_text"])
+        self.load_test_samples()
+        self.build()
+        self.save(index_path)
 
     def query_invoice(self, invoice_text: str, k: int = 1):
         embedding = compute_embedding(invoice_text, self.dim)
-        D, I = self.index.search(np.expand_dims(embedding, axis=0), k)
         results = []
-        for idx, distance in zip(I[0], D[0]):
-            if idx < len(self.documents):
-                doc = self.documents[idx]
-                results.append({
-                    'invoice_id': doc['invoice_id'],
-                    'distance': float(distance)
-                })
+        with self._lock:
+            D, I = self.index.search(np.expand_dims(embedding, axis=0), k)
+            for idx, similarity in zip(I[0], D[0]):
+                if 0 <= idx < len(self.documents):
+                    doc = self.documents[idx]
+                    results.append({
+                        'invoice_id': doc['invoice_id'],
+                        'similarity': float(similarity),
+                        'distance': 1.0 - float(similarity)  # cosine distance
+                    })
         logger.debug(f"Query results: {results}")
         return results
 
-    def classify_invoice(self, invoice_text: str, threshold: float = 0.1) -> dict:
+    def classify_invoice(self, invoice_text: str, threshold: float = RAG_SIMILARITY_THRESHOLD) -> dict:
+        """Classify as 'similar_error' when the nearest corpus invoice has cosine similarity >= threshold."""
         results = self.query_invoice(invoice_text, k=1)
-        if results and results[0]['distance'] < threshold:
+        if results and results[0]['similarity'] >= threshold:
             classification = {
                 'status': 'similar_error',
                 'matched_invoice_id': results[0]['invoice_id'],
+                'similarity': results[0]['similarity'],
                 'distance': results[0]['distance']
             }
             logger.info(f"Invoice classified as similar to error invoice {results[0]['invoice_id']}")
@@ -78,5 +277,5 @@ class InvoiceRAGIndex:
 if __name__ == "__main__":
     rag = InvoiceRAGIndex()
     new_invoice_text = "This invoice content seems to lack a product code."
-    classification = rag.classify_invoice(new_invoice_text, threshold=0.5)
-    print(classification)
\ No newline at end of file
+    classification = rag.classify_invoice(new_invoice_text, threshold=0.5)  # cosine similarity
+    print(classification)
@@ -0,0 +1,105 @@
+# /data_processing/rag_index_tools.py
+# Build and benchmark the FAISS index used by the RAG error classifier.
+#
+#   python -m data_processing.rag_index_tools build --type hnsw
+#   python -m data_processing.rag_index_tools benchmark --synthetic 100000
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import argparse
+import time
+from typing import Dict, Any, List, Optional
+import numpy as np
+import faiss
+from config.logging_config import logger
+from data_processing.rag_helper import INDEX_TYPES, build_faiss_index, select_index_type
+
+
+def recall(index, queries: np.ndarray, truth: np.ndarray, k: int) -> float:
+    _, found = index.search(queries, k)
+    hits = sum(len(set(f[f >= 0]) & set(t)) for f, t in zip(found, truth))
+    return round(hits / (len(queries) * k), 4)
+
+
+def benchmark_index_types(embeddings: np.ndarray, queries: np.ndarray, k: int = 5,
+                          index_types: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """Compare index types against exact (flat) search: build time, query latency and recall@k.
+
+    For an index that re-ranks with exact vectors (ivf_pq) the recall of its approximate base index
+    is reported as well.
+    """
+    index_types = index_types or list(INDEX_TYPES)
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    k = min(k, len(embeddings))
+
+    exact_index, _ = build_faiss_index(embeddings, "flat")
+    _, truth = exact_index.search(queries, k)
+
+    results = []
+    for index_type in index_types:
+        start = time.perf_counter()
+        index, _ = build_faiss_index(embeddings, index_type)
+        build_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for query in queries:
+            index.search(query[None, :], k)  # one query at a time, like the request path
+        latency_ms = (time.perf_counter() - start) / len(queries) * 1000
+
+        results.append({
+            "index_type": index_type,
+            "build_seconds": round(build_seconds, 3),
+            "query_latency_ms": round(latency_ms, 4),
+            f"recall@{k}": recall(index, queries, truth, k)
+        })
+        if isinstance(index, faiss.IndexRefineFlat):
+            results[-1][f"unrefined_recall@{k}"] = recall(faiss.downcast_index(index.base_index), queries, truth, k)
+        logger.info(f"Benchmark {index_type}: {results[-1]}")
+    return results
+
+
+def synthetic_embeddings(n: int, dim: int = 384, clusters: int = 50, seed: int = 0) -> np.ndarray:
+    """Clustered unit vectors, roughly shaped like sentence embeddings of templated invoices."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, n)] + 0.5 * rng.normal(size=(n, dim)).astype(np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or benchmark the RAG FAISS index")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="Train/build the index over the corpus and save it")
+    build_parser.add_argument("--type", default=None, help="auto, " + ", ".join(INDEX_TYPES))
+    bench_parser = subparsers.add_parser("benchmark", help="Recall vs latency of each index type")
+    bench_parser.add_argument("--synthetic", type=int, default=0, help="Benchmark on N synthetic vectors instead of the corpus")
+    bench_parser.add_argument("--queries", type=int, default=200)
+    bench_parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        from data_processing.rag_helper import InvoiceRAGIndex
+        rag = InvoiceRAGIndex()
+        rag.build(args.type)
+        rag.save()
+        print(f"Built {rag.index_type} index over {len(rag.documents)} invoices at {rag.index_path}")
+        return
+
+    if args.synthetic:
+        embeddings = synthetic_embeddings(args.synthetic)
+    else:
+        from data_processing.rag_helper import InvoiceRAGIndex
+        embeddings = InvoiceRAGIndex().embeddings
+    rng = np.random.default_rng(1)
+    queries = embeddings[rng.integers(0, len(embeddings), args.queries)]
+    queries = queries + 0.05 * rng.normal(size=queries.shape).astype(np.float32)
+    print(f"Corpus size {len(embeddings)} (auto selects {select_index_type(len(embeddings))})")
+    for row in benchmark_index_types(embeddings, queries, k=args.k):
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+# /data_processing/rule_engine.py
+# Compiles declarative validation rules (config/validation_rules.py) into predicate functions.
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Any, List, Callable, Optional
+import numpy as np
+import pandas as pd
+from config.logging_config import logger
+from config.validation_rules import load_validation_rules
+
+NUMERIC_CHECKS = {"gt", "gte", "lte", "lte_field"}
+
+
+def _is_empty(value) -> bool:
+    return not value
+
+
+def _to_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _empty_mask(column: pd.Series) -> np.ndarray:
+    """`not value` over a column of raw values (a non-numeric string is not empty)."""
+    return column.map(_is_empty).to_numpy(dtype=bool)
+
+
+class CompiledRule:
+    """A single rule compiled into a scalar predicate and a vectorized failure mask."""
+
+    def __init__(self, rule: Dict[str, Any]):
+        self.field = rule["field"]
+        self.check = rule["check"]
+        self.key = rule.get("error_key", self.field)
+        self.optional = rule.get("optional", False)
+        self.message = rule["message"]
+        self.invalid_message = rule.get("invalid_message", f"Invalid {self.field} format")
+        self.other = rule.get("other")
+        self.limit = rule.get("value")
+        self.numeric = self.check in NUMERIC_CHECKS
+        if self.check in ("gt", "gte", "lte"):
+            self.limit = Decimal(str(self.limit))
+        self.predicate = self._compile_scalar()
+
+    def _compile_scalar(self) -> Callable[[Any, Any], bool]:
+        limit = self.limit
+        if self.check == "required":
+            return lambda v, o: not _is_empty(v)
+        if self.check == "not_in":
+            excluded = frozenset(limit)
+            return lambda v, o: v not in excluded
+        if self.check == "equals":
+            return lambda v, o: v == limit
+        if self.check == "date_format":
+            return lambda v, o: bool(datetime.strptime(str(v), limit))
+        if self.check == "gt":
+            return lambda v, o: v > limit
+        if self.check == "gte":
+            return lambda v, o: v >= limit
+        if self.check == "lte":
+            return lambda v, o: v <= limit
+        if self.check == "lte_field":
+            return lambda v, o: not v > o
+        raise ValueError(f"Unknown validation check '{self.check}' for field '{self.field}'")
+
+    def format_message(self, value) -> str:
+        return self.message.format(value=value, limit=self.limit)
+
+    def evaluate(self, record: Any) -> Optional[str]:
+        """Return an error message if the rule fails for one invoice, else None."""
+        value = getattr(record, self.field, None)
+        if self.optional and _is_empty(value):
+            return None
+        other = getattr(record, self.other, None) if self.other else None
+        try:
+            if self.numeric and not isinstance(value, (int, float, Decimal)):
+                value = Decimal(str(value))
+            if not self.predicate(value, other):
+                return self.format_message(value)
+        except ValueError:
+            if self.check == "date_format":
+                return self.format_message(value)
+            return self.invalid_message
+        except (TypeError, InvalidOperation):
+            return self.invalid_message
+        return None
+
+    def failure_mask(self, frame: pd.DataFrame, numeric: Dict[str, np.ndarray]) -> np.ndarray:
+        """Vectorized failure mask over a frame of raw values with one row per invoice.
+
+        `numeric` holds the float64 view of each numeric field (NaN where unparseable).
+        """
+        column = frame[self.field]
+        if self.check == "required":
+            failed = _empty_mask(column)
+        elif self.check == "not_in":
+            failed = column.isin(list(self.limit)).to_numpy()
+        elif self.check == "equals":
+            failed = (column != self.limit).to_numpy()
+        elif self.check == "date_format":
+            present = column.notna()
+            parsed = pd.to_datetime(column.astype(str), format=self.limit, errors="coerce")
+            failed = (present & parsed.isna()).to_numpy()
+        else:
+            values = numeric[self.field]
+            with np.errstate(invalid="ignore"):
+                if self.check == "lte_field":
+                    bound = numeric[self.other]
+                    failed = values > bound
+                    invalid = np.isnan(values) | np.isnan(bound)
+                else:
+                    limit = float(self.limit)
+                    if self.check == "gt":
+                        failed = ~(values > limit)
+                    elif self.check == "gte":
+                        failed = ~(values >= limit)
+                    else:
+                        failed = ~(values <= limit)
+                    invalid = np.isnan(values)
+            # Unparseable values fail too; the scalar path reports them as invalid
+            failed = failed | invalid
+        if self.optional:
+            failed = failed & ~_empty_mask(column)
+        return np.asarray(failed, dtype=bool)
+
+
+class ValidationRuleSet:
+    """Compiled rule set evaluated per invoice or in bulk over a batch."""
+
+    def __init__(self, rules: Optional[List[Dict[str, Any]]] = None):
+        rules = load_validation_rules() if rules is None else rules
+        self.rules = [CompiledRule(rule) for rule in rules]
+        self.fields = sorted({r.field for r in self.rules} | {r.other for r in self.rules if r.other})
+        self.numeric_fields = sorted({r.field for r in self.rules if r.numeric} |
+                                     {r.other for r in self.rules if r.other})
+        logger.debug(f"Compiled {len(self.rules)} validation rules over fields {self.fields}")
+
+    def evaluate(self, invoice_data: Any) -> Dict[str, str]:
+        """Errors for one invoice, keyed by field (first failing rule per key)."""
+        errors = {}
+        for rule in self.rules:
+            if rule.key in errors:
+                continue
+            message = rule.evaluate(invoice_data)
+            if message is not None:
+                errors[rule.key] = message
+        return errors
+
+    def to_frame(self, invoices: List[Any]) -> pd.DataFrame:
+        """Columnar view of the raw values of the fields the rules read."""
+        return pd.DataFrame({field: pd.Series([getattr(inv, field, None) for inv in invoices], dtype=object)
+                             for field in self.fields})
+
+    def to_numeric(self, frame: pd.DataFrame) -> Dict[str, np.ndarray]:
+        """Float64 view of each numeric field, converted once per batch."""
+        return {field: frame[field].map(_to_float).to_numpy(dtype=float) for field in self.numeric_fields}
+
+    def evaluate_batch(self, invoices: List[Any]) -> List[Dict[str, str]]:
+        """Errors for many invoices, evaluating each rule once over the whole batch."""
+        if not invoices:
+            return []
+        frame = self.to_frame(invoices)
+        numeric = self.to_numeric(frame)
+        errors: List[Dict[str, str]] = [{} for _ in invoices]
+        claimed: Dict[str, np.ndarray] = {}
+        for rule in self.rules:
+            taken = claimed.setdefault(rule.key, np.zeros(len(invoices), dtype=bool))
+            failed = rule.failure_mask(frame, numeric) & ~taken
+            for i in np.flatnonzero(failed):
+                # Messages come from the scalar path so batch and per-invoice results are identical
+                errors[i][rule.key] = rule.evaluate(invoices[i]) or rule.format_message(getattr(invoices[i], rule.field, None))
+            taken |= failed
+        return errors
@@ -0,0 +1,169 @@
+# /data_processing/vendor_master.py
+# Shared, hot-reloadable view of vendor_data.csv and the match indexes built from it.
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import hashlib
+import io
+import re
+import threading
+from datetime import datetime
+from typing import Dict, Any, Optional
+import pandas as pd
+from rapidfuzz import utils as fuzz_utils
+from config.logging_config import logger
+from config.settings import VENDOR_DATA_FILE, VENDOR_MASTER_POLL_SECONDS
+
+REQUIRED_COLUMNS = ["Vendor Name", "Approved PO List"]
+PO_SEPARATORS = re.compile(r"[,;|\s]+")
+
+
+def normalize_po_number(po_number) -> str:
+    """Canonical PO key: case and punctuation are ignored, so 'po-686011' finds 'PO_686011'."""
+    return re.sub(r"[^A-Z0-9]", "", str(po_number or "").upper())
+
+
+def build_po_index(po_data: pd.DataFrame) -> Dict[str, dict]:
+    """Map each approved PO number (lists may hold several) to its PO and vendor."""
+    index = {}
+    for vendor_name, po_list in zip(po_data["Vendor Name"], po_data["Approved PO List"]):
+        if pd.isna(po_list):
+            continue
+        for po_number in PO_SEPARATORS.split(str(po_list)):
+            key = normalize_po_number(po_number)
+            if not key:
+                continue
+            if key in index and index[key]["vendor_name"] != vendor_name:
+                logger.warning(f"PO {po_number} is approved for both {index[key]['vendor_name']} and {vendor_name}")
+                continue
+            index[key] = {"po_number": po_number, "vendor_name": vendor_name}
+    return index
+
+
+def read_vendor_table(source) -> pd.DataFrame:
+    """Read and check a vendor CSV (path or file object)."""
+    df = pd.read_csv(source)
+    if not all(col in df.columns for col in REQUIRED_COLUMNS):
+        raise ValueError("PO CSV missing required columns: 'Vendor Name', 'Approved PO List'")
+    return df
+
+
+class VendorSnapshot:
+    """One immutable version of the vendor table with its indexes. Never modified after build."""
+
+    def __init__(self, po_data: pd.DataFrame, digest: str = "", version: int = 0):
+        self.po_data = po_data
+        self.po_index = build_po_index(po_data)
+        # Vendor names preprocessed once per version for matrix scoring
+        self.vendor_choices = [fuzz_utils.default_process(str(name)) for name in po_data["Vendor Name"]]
+        self.po_lists = po_data["Approved PO List"].tolist()
+        self.digest = digest
+        self.version = version
+        self.loaded_at = datetime.now().isoformat()
+
+    @classmethod
+    def empty(cls) -> "VendorSnapshot":
+        return cls(pd.DataFrame(columns=REQUIRED_COLUMNS))
+
+    def status(self) -> Dict[str, Any]:
+        return {"version": self.version, "vendors": len(self.po_data), "po_numbers": len(self.po_index),
+                "sha256": self.digest, "loaded_at": self.loaded_at}
+
+
+class VendorMaster:
+    """Serves the current VendorSnapshot and replaces it when vendor_data.csv changes.
+
+    A daemon thread polls the file's mtime/size; changed content is parsed and indexed off the
+    request path and then published with a single reference assignment, so matching never waits
+    and each match sees one consistent snapshot. A file that fails to parse leaves the current
+    snapshot in place.
+    """
+
+    def __init__(self, vendor_file: str = VENDOR_DATA_FILE, poll_interval: float = VENDOR_MASTER_POLL_SECONDS):
+        self.vendor_file = vendor_file
+        self.poll_interval = poll_interval
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._stat = None
+        self.snapshot = VendorSnapshot.empty()
+        self.reload()
+
+    def _file_stat(self):
+        try:
+            stat = os.stat(self.vendor_file)
+            return stat.st_mtime_ns, stat.st_size
+        except FileNotFoundError:
+            return None
+
+    def reload(self, force: bool = False) -> bool:
+        """Rebuild from the file if its content changed. Returns True if a new snapshot was published."""
+        with self._reload_lock:
+            stat = self._file_stat()
+            if stat is None:
+                if self._stat is None:
+                    logger.error(f"PO file not found: {self.vendor_file}")
+                self._stat = None
+                return False
+            if stat == self._stat and not force:
+                return False
+            self._stat = stat
+            try:
+                with open(self.vendor_file, "rb") as f:
+                    content = f.read()
+                digest = hashlib.sha256(content).hexdigest()
+                if digest == self.snapshot.digest and not force:
+                    return False
+                snapshot = VendorSnapshot(read_vendor_table(io.BytesIO(content)), digest, self.snapshot.version + 1)
+            except Exception as e:
+                logger.error(f"Failed to load PO data from {self.vendor_file}, keeping version {self.snapshot.version}: {str(e)}")
+                return False
+            self.snapshot = snapshot
+        logger.info(f"Loaded vendor master version {snapshot.version} from {self.vendor_file}: "
+                    f"{len(snapshot.po_data)} vendors, {len(snapshot.po_index)} approved PO numbers")
+        return True
+
+    def replace(self, content: bytes) -> Dict[str, Any]:
+        """Validate an uploaded vendor CSV, write it over the vendor file and publish it."""
+        read_vendor_table(io.BytesIO(content))  # raises ValueError before anything is written
+        os.makedirs(os.path.dirname(self.vendor_file) or ".", exist_ok=True)
+        tmp_path = f"{self.vendor_file}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, self.vendor_file)
+        self.reload(force=True)
+        return self.snapshot.status()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._watch, name="vendor-master-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.reload()
+            except Exception as e:
+                logger.error(f"Vendor master watcher error: {str(e)}")
+
+
+_vendor_master: Optional[VendorMaster] = None
+_vendor_master_lock = threading.Lock()
+
+
+def get_vendor_master() -> VendorMaster:
+    """Process-wide VendorMaster, started on first use."""
+    global _vendor_master
+    with _vendor_master_lock:
+        if _vendor_master is None:
+            _vendor_master = VendorMaster()
+            _vendor_master.start()
+        return _vendor_master
@@ -0,0 +1,218 @@
+# /data_processing/vendor_stats.py
+# Per-vendor streaming statistics on invoice amounts for outlier detection.
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import bisect
+import json
+import math
+import threading
+from typing import Dict, Any, List, Optional, Set
+from config.logging_config import logger
+from config.settings import VENDOR_STATS_FILE, VENDOR_AMOUNT_Z_THRESHOLD, VENDOR_STATS_MIN_SAMPLES
+
+
+def vendor_key(vendor_name) -> str:
+    return " ".join(str(vendor_name or "").lower().split())
+
+
+class P2Quantile:
+    """P-square streaming estimate of a single quantile (Jain & Chlamtac), O(1) memory and update."""
+
+    def __init__(self, p: float, heights: Optional[List[float]] = None, positions: Optional[List[int]] = None):
+        self.p = p
+        self.q = list(heights or [])
+        self.n = list(positions or [])
+
+    def add(self, x: float):
+        q, n, p = self.q, self.n, self.p
+        if len(q) < 5:
+            bisect.insort(q, x)
+            if len(q) == 5:
+                self.n = [1, 2, 3, 4, 5]
+            return
+
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = bisect.bisect_right(q, x) - 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+
+        count = n[4]
+        desired = [1, 1 + (count - 1) * p / 2, 1 + (count - 1) * p, 1 + (count - 1) * (1 + p) / 2, count]
+        for i in range(1, 4):
+            d = desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                parabolic = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+                    (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+                )
+                if q[i - 1] < parabolic < q[i + 1]:
+                    q[i] = parabolic
+                else:
+                    q[i] = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                n[i] += d
+
+    def value(self) -> Optional[float]:
+        if not self.q:
+            return None
+        if len(self.q) < 5:
+            return self.q[int(round((len(self.q) - 1) * self.p))]
+        return self.q[2]
+
+
+class VendorAmountStats:
+    """Running mean/variance (Welford) plus median and p95 sketches for one vendor."""
+
+    def __init__(self, state: Optional[list] = None):
+        if state:
+            self.count, self.mean, self.m2 = state[0], state[1], state[2]
+            self.p50 = P2Quantile(0.5, *state[3])
+            self.p95 = P2Quantile(0.95, *state[4])
+        else:
+            self.count, self.mean, self.m2 = 0, 0.0, 0.0
+            self.p50 = P2Quantile(0.5)
+            self.p95 = P2Quantile(0.95)
+
+    def add(self, amount: float):
+        self.count += 1
+        delta = amount - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (amount - self.mean)
+        self.p50.add(amount)
+        self.p95.add(amount)
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def to_state(self) -> list:
+        return [self.count, round(self.mean, 6), round(self.m2, 6),
+                [[round(v, 6) for v in self.p50.q], self.p50.n],
+                [[round(v, 6) for v in self.p95.q], self.p95.n]]
+
+
+class VendorAmountModel:
+    """Flags amounts that are unusually large for the vendor, updated incrementally as invoices are saved.
+
+    An amount is an outlier when its z-score against the vendor's running mean exceeds the threshold
+    and it is above the vendor's estimated p95. Each invoice number is counted once, so reprocessing
+    an invoice does not skew its vendor. State is persisted as one small list per vendor plus the
+    counted invoice numbers; `flush` writes it only when something changed.
+    """
+
+    def __init__(self, state_file: str = VENDOR_STATS_FILE, z_threshold: float = VENDOR_AMOUNT_Z_THRESHOLD,
+                 min_samples: int = VENDOR_STATS_MIN_SAMPLES):
+        self.state_file = state_file
+        self.z_threshold = z_threshold
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self.vendors: Dict[str, VendorAmountStats] = {}
+        self.counted_invoices: Set[str] = set()
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.state_file, "r") as f:
+                state = json.load(f)
+            if "vendors" not in state:
+                state = {"vendors": state}  # written before invoice numbers were tracked
+            self.vendors = {key: VendorAmountStats(value) for key, value in state["vendors"].items()}
+            self.counted_invoices = set(state.get("invoices", []))
+            logger.info(f"Loaded amount statistics for {len(self.vendors)} vendors")
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.vendors = {}
+
+    def save(self):
+        with self._lock:
+            state = {"vendors": {key: stats.to_state() for key, stats in self.vendors.items()},
+                     "invoices": sorted(self.counted_invoices)}
+            self._dirty = False
+        os.makedirs(os.path.dirname(self.state_file) or ".", exist_ok=True)
+        tmp_path = f"{self.state_file}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f, separators=(",", ":"))
+        os.replace(tmp_path, self.state_file)
+
+    def flush(self):
+        """Persist the statistics if they changed since the last save."""
+        if self._dirty:
+            self.save()
+
+    def update(self, vendor_name, amount, invoice_number: Optional[str] = None) -> bool:
+        """Add one saved invoice amount to its vendor's statistics. Returns False if skipped,
+        including when `invoice_number` was already counted."""
+        key = vendor_key(vendor_name)
+        try:
+            value = float(amount)
+        except (TypeError, ValueError):
+            return False
+        if not key or key in ("unknown", "error") or value <= 0:
+            return False
+        with self._lock:
+            if invoice_number:
+                if invoice_number in self.counted_invoices:
+                    return False
+                self.counted_invoices.add(invoice_number)
+            self.vendors.setdefault(key, VendorAmountStats()).add(value)
+            self._dirty = True
+        return True
+
+    def stats_for(self, vendor_name) -> Optional[VendorAmountStats]:
+        return self.vendors.get(vendor_key(vendor_name))
+
+    def check(self, vendor_name, amount) -> Optional[Dict[str, Any]]:
+        """Return an anomaly dict if the amount is an outlier for this vendor, else None."""
+        value = float(amount)
+        # Read one consistent state; the workflow updates vendors concurrently
+        with self._lock:
+            stats = self.stats_for(vendor_name)
+            if stats is None or stats.count < self.min_samples:
+                return None
+            mean, std, count = stats.mean, stats.std, stats.count
+            median, p95 = stats.p50.value(), stats.p95.value()
+        if std <= 0 or p95 is None:
+            return None
+        z_score = (value - mean) / std
+        if z_score <= self.z_threshold or value <= p95:
+            return None
+        return {
+            "amount": str(amount),
+            "vendor_mean": round(mean, 2),
+            "vendor_std": round(std, 2),
+            "vendor_median": round(median, 2),
+            "vendor_p95": round(p95, 2),
+            "z_score": round(z_score, 2),
+            "sample_size": count,
+            "reason": f"Amount £{amount} is unusually high for {vendor_name} (z-score {z_score:.1f})"
+        }
+
+    def rebuild(self, records: List[Dict[str, Any]]) -> int:
+        """Recompute all vendor statistics from invoice history in one pass."""
+        with self._lock:
+            self.vendors = {}
+            self.counted_invoices = set()
+        added = sum(1 for r in records
+                    if self.update(r.get("vendor_name"), r.get("total_amount"), r.get("invoice_number")))
+        self.save()
+        logger.info(f"Rebuilt amount statistics for {len(self.vendors)} vendors from {added} invoices")
+        return added
+
+
+if __name__ == "__main__":
+    history_file = os.path.join("data", "processed", "structured_invoices.json")
+    try:
+        with open(history_file, "r") as f:
+            history = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        history = []
+    model = VendorAmountModel()
+    print(f"Rebuilt from {model.rebuild(history)} invoices")
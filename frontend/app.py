@@ -3,9 +3,19 @@ import requests
 import pandas as pd
 from datetime import datetime
 import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 API_URL = os.getenv("API_URL", "http://localhost:8000")
 
+def load_metrics_snapshot(columns):
+    """Load invoice metrics from the columnar snapshot, or None if unavailable."""
+    try:
+        from data_processing.columnar_export import load_snapshot
+        return load_snapshot(columns=columns)
+    except Exception:
+        return None
+
 def save_updated_invoice(updated_invoice):
     response = requests.put(
         f"{API_URL}/api/invoices/{updated_invoice['invoice_number']}",
@@ -170,12 +180,27 @@ elif page == "Review":
 
 elif page == "Metrics":
     st.header("📊 Performance Metrics")
-    response = requests.get(f"{API_URL}/api/invoices")
-    if response.status_code == 200:
-        invoices = response.json()
-        if invoices:
-            df = pd.DataFrame(invoices)
-            
+    if st.button("Refresh Snapshot"):
+        response = requests.post(f"{API_URL}/api/export/snapshot", params={"mode": "append"})
+        if response.status_code == 200:
+            st.success(f"Exported {response.json().get('exported', 0)} changed invoices")
+        else:
+            st.error(f"Failed to refresh snapshot: {response.text}")
+    metric_columns = ["invoice_number", "confidence", "extraction_time", "validation_time",
+                      "matching_time", "review_time", "total_time"]
+    # Prefer the columnar snapshot (shared data volume); fall back to the API
+    df = load_metrics_snapshot(metric_columns)
+    if df is None:
+        response = requests.get(f"{API_URL}/api/invoices")
+        if response.status_code == 200:
+            df = pd.DataFrame(response.json())
+        else:
+            st.error("Failed to fetch metrics from API")
+    else:
+        st.caption("Loaded from analytics snapshot")
+
+    if df is not None:
+        if not df.empty:
             # Safely calculate average confidence score
             avg_confidence = df.get("confidence", pd.Series([0])).mean()
             total_invoices = len(df)
@@ -198,14 +223,19 @@ elif page == "Metrics":
             
             # Processing Times with safe handling of missing or None values
             st.subheader("Processing Times")
-            times_df = pd.DataFrame([{
-                "Invoice": inv.get("invoice_number", "Unknown"),
-                "Extraction (s)": float(inv.get("extraction_time", 0.0) or 0.0),
-                "Validation (s)": float(inv.get("validation_time", 0.0) or 0.0),
-                "Matching (s)": float(inv.get("matching_time", 0.0) or 0.0),
-                "Review (s)": float(inv.get("review_time", 0.0) or 0.0),
-                "Total (s)": float(inv.get("total_time", 0.0) or 0.0)
-            } for inv in invoices])
+            def timing(col):
+                if col not in df.columns:
+                    return pd.Series(0.0, index=df.index)
+                return pd.to_numeric(df[col], errors="coerce").fillna(0.0)
+
+            times_df = pd.DataFrame({
+                "Invoice": df["invoice_number"].fillna("Unknown") if "invoice_number" in df.columns else "Unknown",
+                "Extraction (s)": timing("extraction_time"),
+                "Validation (s)": timing("validation_time"),
+                "Matching (s)": timing("matching_time"),
+                "Review (s)": timing("review_time"),
+                "Total (s)": timing("total_time")
+            })
             
             st.table(times_df.style.format({
                 "Extraction (s)": "{:.2f}",
@@ -216,5 +246,3 @@ elif page == "Metrics":
             }, na_rep="0.00"))
         else:
             st.info("No invoices available yet.")
-    else:
-        st.error("Failed to fetch metrics from API")
\ No newline at end of file
@@ -2,7 +2,7 @@
 
 from pydantic import BaseModel, Field, validator
 from datetime import date
-from typing import Optional
+from typing import Optional, List, Dict, Any
 from decimal import Decimal
 
 class InvoiceData(BaseModel):
@@ -17,6 +17,10 @@ class InvoiceData(BaseModel):
     po_number: Optional[str] = Field(None, description="Purchase Order reference number")
     tax_amount: Optional[Decimal] = Field(None, description="Tax amount if specified")
     currency: Optional[str] = Field("GBP", description="Invoice currency code")
+    ocr_pages: Optional[List[Dict[str, Any]]] = Field(None, description="Per-page OCR timings when text came from OCR")
+    extraction_mode: Optional[str] = Field(None, description="How fields were extracted: llm, cache_exact, cache_near, regex_fallback or failed")
+    prompt_tokens: Optional[int] = Field(None, description="LLM prompt tokens used for extraction")
+    completion_tokens: Optional[int] = Field(None, description="LLM completion tokens used for extraction")
     
     @validator("invoice_date", pre=True)
     def parse_date(cls, value):
@@ -0,0 +1,80 @@
+from datetime import date, timedelta
+from decimal import Decimal
+
+import pandas as pd
+import pytest
+
+from data_processing.anomaly_detection import AnomalyDetector
+from data_processing.invoice_store import InvoiceStore
+from data_processing.vendor_stats import VendorAmountModel
+from models.invoice import InvoiceData
+
+
+def invoice(**overrides):
+    fields = dict(vendor_name="ABC Corp", invoice_number="INV-NEW", invoice_date=date.today() - timedelta(days=10),
+                  total_amount=Decimal("100.00"), confidence=0.95, tax_amount=Decimal("20.00"))
+    fields.update(overrides)
+    return InvoiceData(**fields)
+
+
+@pytest.fixture
+def detector(tmp_path):
+    detector = AnomalyDetector()
+    detector.invoice_store = InvoiceStore(str(tmp_path / "invoices.json"), flush_ms=0)
+    detector.invoice_store.commit({"invoice_number": "INV-OLD", "vendor_name": "ABC Corp",
+                                   "invoice_date": "2025-01-02", "total_amount": "250.00"})
+    # Staged invoices are still in the pipeline and must not count as history
+    detector.invoice_store.stage({"invoice_number": "INV-STAGED", "vendor_name": "ABC Corp"})
+    detector.vendor_model = VendorAmountModel(str(tmp_path / "vendor_stats.json"), min_samples=5)
+    for i in range(20):
+        detector.vendor_model.update("Steady Supplies", 100 + (i % 5) * 5, f"SS-{i}")
+    return detector
+
+
+CASES = {
+    "normal": invoice(),
+    "low_confidence": invoice(confidence=0.5),
+    "high_amount": invoice(total_amount=Decimal("1000000.01")),
+    "at_amount_threshold": invoice(total_amount=Decimal("1000000.00")),
+    "vendor_outlier": invoice(vendor_name="Steady Supplies", total_amount=Decimal("5000.00")),
+    "vendor_usual": invoice(vendor_name="Steady Supplies", total_amount=Decimal("110.00")),
+    "duplicate": invoice(invoice_number="INV-OLD"),
+    "same_number_other_vendor": invoice(invoice_number="INV-OLD", vendor_name="XYZ Inc"),
+    "in_progress_not_duplicate": invoice(invoice_number="INV-STAGED"),
+    "future_date": invoice(invoice_date=date.today() + timedelta(days=3)),
+    "old_date": invoice(invoice_date=date.today() - timedelta(days=400)),
+    "suspicious_tax": invoice(tax_amount=Decimal("40.00")),
+    "no_tax": invoice(tax_amount=None),
+}
+
+
+@pytest.mark.parametrize("case", CASES)
+def test_scalar_flags(detector, case):
+    anomalies = detector.detect_anomalies(CASES[case])
+    expected = {
+        "low_confidence": {"low_confidence"},
+        "high_amount": {"high_amount"},
+        "vendor_outlier": {"vendor_amount_outlier"},
+        "duplicate": {"duplicate"},
+        "future_date": {"date_issue"},
+        "old_date": {"date_issue"},
+        "suspicious_tax": {"suspicious_tax"},
+    }.get(case, set())
+    assert set(anomalies) == expected
+
+
+@pytest.mark.parametrize("case", CASES)
+def test_batch_matches_scalar_per_invoice(detector, case):
+    assert detector.detect_anomalies_batch([CASES[case]]) == [detector.detect_anomalies(CASES[case])]
+
+
+def test_batch_matches_scalar_over_mixed_batch(detector):
+    invoices = list(CASES.values())
+    assert detector.detect_anomalies_batch(invoices) == [detector.detect_anomalies(inv) for inv in invoices]
+
+
+def test_batch_accepts_dataframe(detector):
+    invoices = list(CASES.values())
+    frame = pd.DataFrame([inv.model_dump() for inv in invoices])
+    assert detector.detect_anomalies_batch(frame) == detector.detect_anomalies_batch(invoices)
+    assert detector.detect_anomalies_batch([]) == []
@@ -0,0 +1,72 @@
+from data_processing.extraction_cache import ExtractionCache
+
+INVOICE = """Invoice Number: IN_5666658
+Vendor: Solis Inc
+Date: 2025-02-17
+VAT Number: 55569419
+Address: 6970 Cardenas Motorway Apt. 067 Burgessberg, AK 63021
+Line Items:
+- Edge (Code: ITM_4060, Qty: 9) - £378.10
+- Thing (Code: ITM_8577, Qty: 2) - £371.44
+- Form (Code: ITM_2320, Qty: 5) - £71.62
+Total Amount: £4296.08
+Printed 2025-02-17 by Solis Billing
+"""
+
+OTHER_INVOICE = """Invoice Number: IN_7712093
+Vendor: Solis Inc
+Date: 2025-03-02
+VAT Number: 55569419
+Address: 6970 Cardenas Motorway Apt. 067 Burgessberg, AK 63021
+Line Items:
+- Gear (Code: ITM_1182, Qty: 4) - £120.00
+- Bolt (Code: ITM_9034, Qty: 12) - £18.75
+Total Amount: £705.00
+Printed 2025-03-02 by Solis Billing
+"""
+
+FIELDS = {"vendor_name": "Solis Inc", "invoice_number": "IN_5666658", "total_amount": "4296.08"}
+
+
+def make_cache(tmp_path):
+    return ExtractionCache(cache_file=str(tmp_path / "cache.json"))
+
+
+def test_exact_hit_ignores_whitespace_and_case(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put(INVOICE, FIELDS)
+    result = cache.lookup(INVOICE.upper().replace("\n", "\n  "))
+    assert result["match"] == "exact"
+    assert result["fields"] == FIELDS
+
+
+def test_reprint_with_one_changed_line_is_a_near_hit(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put(INVOICE, FIELDS)
+    reprint = INVOICE.replace("Printed 2025-02-17 by Solis Billing", "Printed 2025-04-30 by Solis Billing (copy)")
+    result = cache.lookup(reprint)
+    assert result is not None
+    assert result["match"] == "near"
+    assert result["fields"]["invoice_number"] == "IN_5666658"
+    assert cache.stats["near_hits"] == 1
+
+
+def test_different_invoice_on_same_template_misses(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put(INVOICE, FIELDS)
+    assert cache.lookup(OTHER_INVOICE) is None
+
+
+def test_guard_rejects_near_match_with_different_total(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put(INVOICE, FIELDS)
+    assert cache.lookup(INVOICE.replace("£4296.08", "£4396.08")) is None
+    assert cache.stats["guard_rejections"] == 1
+
+
+def test_persisted_entries_reload_and_invalidate(tmp_path):
+    make_cache(tmp_path).put(INVOICE, FIELDS)
+    cache = make_cache(tmp_path)
+    assert cache.lookup(INVOICE)["match"] == "exact"
+    assert cache.invalidate("IN_5666658") == 1
+    assert make_cache(tmp_path).lookup(INVOICE) is None
@@ -0,0 +1,85 @@
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from data_processing.invoice_store import InvoiceStore
+from data_processing.po_matcher import POMatcher, rematch_invoices
+from data_processing.vendor_master import VendorMaster
+from models.invoice import InvoiceData
+
+VENDOR_CSV = """Vendor Name,Approved PO List
+Robinson Group,PO_686011
+Hughes and Sons,PO_112233;PO_445566
+"Baker, Patel and Stone",PO_778899
+"""
+
+
+def invoice(vendor_name, po_number=None, invoice_number="INV-1"):
+    return InvoiceData(vendor_name=vendor_name, invoice_number=invoice_number, invoice_date=date(2025, 1, 15),
+                       total_amount=Decimal("100.00"), confidence=0.95, po_number=po_number)
+
+
+@pytest.fixture
+def matcher(tmp_path):
+    vendor_file = tmp_path / "vendor_data.csv"
+    vendor_file.write_text(VENDOR_CSV)
+    return POMatcher(VendorMaster(str(vendor_file)), threshold=0.85)
+
+
+def test_po_number_tier(matcher):
+    result = matcher.match(invoice("Robinson Group", "PO_686011"))
+    assert result == {"status": "matched", "po_number": "PO_686011", "match_confidence": 1.0,
+                      "match_tier": "po_number"}
+
+
+def test_po_number_is_normalized_and_list_entries_indexed(matcher):
+    assert matcher.match(invoice("ROBINSON GROUP", "po-686011"))["po_number"] == "PO_686011"
+    assert matcher.match(invoice("Hughes and Sons", "PO 445566"))["po_number"] == "PO_445566"
+
+
+def test_po_of_another_vendor_falls_back_to_vendor_name(matcher):
+    result = matcher.match(invoice("Hughes and Sons", "PO_686011"))
+    assert result["match_tier"] == "vendor_fuzzy"
+    assert result["po_number"] == "PO_112233;PO_445566"
+    assert result["po_vendor_mismatch"] == "PO_686011"
+
+    unknown = matcher.match(invoice("Completely Different Ltd", "PO_686011"))
+    assert unknown["match_tier"] == "none"
+    assert unknown["po_vendor_mismatch"] == "PO_686011"
+
+
+def test_vendor_fuzzy_tier(matcher):
+    result = matcher.match(invoice("Baker Patel and Stone"))
+    assert result["status"] == "matched"
+    assert result["match_tier"] == "vendor_fuzzy"
+    assert result["po_number"] == "PO_778899"
+    assert 0.85 < result["match_confidence"] <= 1.0
+
+
+def test_unknown_vendor_and_po_is_unmatched(matcher):
+    result = matcher.match(invoice("Completely Different Ltd", "PO_000000"))
+    assert result == {"status": "unmatched", "po_number": None, "match_confidence": 0.0, "match_tier": "none"}
+
+
+def test_match_many_matches_one_at_a_time(matcher):
+    invoices = [invoice("Robinson Group", "PO_686011"), invoice("Baker Patel and Stone"),
+                invoice("Hughes and Sons", "PO_686011"), invoice("Completely Different Ltd")]
+    assert matcher.match_many(invoices) == [matcher.match(inv) for inv in invoices]
+
+
+def test_missing_vendor_file_returns_errors(tmp_path):
+    matcher = POMatcher(VendorMaster(str(tmp_path / "missing.csv")), threshold=0.85)
+    results = matcher.match_many([invoice("Robinson Group", "PO_686011"), invoice("Hughes and Sons")])
+    assert [r["status"] for r in results] == ["error", "error"]
+    assert all(r["po_number"] is None for r in results)
+
+
+def test_rematch_invoices_writes_changed_results(matcher, tmp_path):
+    store = InvoiceStore(str(tmp_path / "invoices.json"), flush_ms=0)
+    store.commit({"invoice_number": "INV-1", "vendor_name": "Robinson Group", "invoice_date": "2025-01-15",
+                  "total_amount": "100.00", "confidence": 0.95, "po_number": "PO_686011"})
+    report = rematch_invoices(write=True, store=store, matcher=matcher)
+    assert report == {"invoices": 1, "changed": 1, "tiers": {"po_number": 1}}
+    assert store.get("INV-1")["matched_po_number"] == "PO_686011"
+    assert rematch_invoices(write=True, store=store, matcher=matcher)["changed"] == 0
@@ -0,0 +1,70 @@
+from datetime import date
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+
+from data_processing.rule_engine import ValidationRuleSet
+from models.invoice import InvoiceData
+
+
+def invoice(**overrides):
+    fields = dict(vendor_name="ABC Corp", invoice_number="INV-1", invoice_date=date(2025, 1, 15),
+                  total_amount=Decimal("100.00"), confidence=0.95, currency="GBP")
+    fields.update(overrides)
+    return InvoiceData(**fields)
+
+
+def raw(**overrides):
+    """An unvalidated record, as read back from storage: any field may be malformed."""
+    fields = dict(vendor_name="ABC Corp", invoice_number="INV-1", invoice_date="2025-01-15",
+                  total_amount="100.00", confidence=0.95, currency="GBP", tax_amount=None)
+    fields.update(overrides)
+    return SimpleNamespace(**fields)
+
+
+INVOICES = [
+    invoice(),
+    invoice(confidence=0.2),
+    invoice(vendor_name=""),
+    invoice(vendor_name="Unknown"),
+    invoice(invoice_number="INVALID"),
+    invoice(total_amount=Decimal("0")),
+    invoice(total_amount=Decimal("-5")),
+    invoice(total_amount=Decimal("2000000")),
+    invoice(currency="USD"),
+    invoice(tax_amount=Decimal("150.00")),
+    invoice(tax_amount=Decimal("-1")),
+    invoice(tax_amount=Decimal("20.00")),
+    invoice(vendor_name="Error", invoice_number="", confidence=0.1, currency="EUR"),
+    raw(total_amount="abc"),
+    raw(total_amount=None),
+    raw(invoice_date="15/01/2025"),
+    raw(invoice_date=None),
+    raw(tax_amount="n/a"),
+    raw(tax_amount="10", total_amount="5"),
+]
+
+
+@pytest.fixture(scope="module")
+def rules():
+    return ValidationRuleSet()
+
+
+@pytest.mark.parametrize("record", INVOICES)
+def test_batch_matches_scalar_per_invoice(rules, record):
+    assert rules.evaluate_batch([record]) == [rules.evaluate(record)]
+
+
+def test_batch_matches_scalar_over_mixed_batch(rules):
+    assert rules.evaluate_batch(INVOICES) == [rules.evaluate(record) for record in INVOICES]
+
+
+def test_first_failing_rule_per_key_wins(rules):
+    errors = rules.evaluate(invoice(total_amount=Decimal("-5")))
+    assert errors == {"total_amount": "Amount must be greater than zero"}
+
+
+def test_valid_invoice_has_no_errors(rules):
+    assert rules.evaluate(invoice()) == {}
+    assert rules.evaluate_batch([]) == []
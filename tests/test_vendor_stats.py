@@ -0,0 +1,98 @@
+import json
+
+import numpy as np
+import pytest
+
+from data_processing.vendor_stats import P2Quantile, VendorAmountModel, VendorAmountStats
+
+
+@pytest.fixture(scope="module")
+def amounts():
+    # Invoice amounts are right-skewed; a lognormal sample exercises the tails of both sketches
+    return np.random.default_rng(7).lognormal(mean=6.0, sigma=0.6, size=5000)
+
+
+def test_welford_matches_numpy(amounts):
+    stats = VendorAmountStats()
+    for value in amounts:
+        stats.add(float(value))
+    assert stats.count == len(amounts)
+    assert stats.mean == pytest.approx(np.mean(amounts), rel=1e-9)
+    assert stats.std == pytest.approx(np.std(amounts, ddof=1), rel=1e-9)
+
+
+@pytest.mark.parametrize("p", [0.5, 0.95])
+def test_p2_quantile_close_to_exact(amounts, p):
+    sketch = P2Quantile(p)
+    for value in amounts:
+        sketch.add(float(value))
+    assert sketch.value() == pytest.approx(np.percentile(amounts, p * 100), rel=0.03)
+
+
+def test_p2_small_samples_are_exact():
+    sketch = P2Quantile(0.5)
+    assert sketch.value() is None
+    for value in [5.0, 1.0, 3.0]:
+        sketch.add(value)
+    assert sketch.value() == 3.0
+
+
+def test_state_round_trip(amounts):
+    stats = VendorAmountStats()
+    for value in amounts[:500]:
+        stats.add(float(value))
+    restored = VendorAmountStats(json.loads(json.dumps(stats.to_state())))
+    for value in amounts[500:1000]:
+        stats.add(float(value))
+        restored.add(float(value))
+    assert restored.count == stats.count
+    assert restored.mean == pytest.approx(stats.mean, rel=1e-6)
+    assert restored.std == pytest.approx(stats.std, rel=1e-6)
+    assert restored.p95.value() == pytest.approx(stats.p95.value(), rel=1e-6)
+
+
+@pytest.fixture
+def model(tmp_path):
+    return VendorAmountModel(str(tmp_path / "vendor_stats.json"), z_threshold=3.0, min_samples=5)
+
+
+def test_update_counts_each_invoice_once(model):
+    assert model.update("ABC Corp", "100.00", "INV-1")
+    assert not model.update("abc  corp", "100.00", "INV-1")
+    assert not model.update("Unknown", "100.00", "INV-2")
+    assert not model.update("ABC Corp", "0", "INV-3")
+    assert not model.update("ABC Corp", "n/a", "INV-4")
+    assert model.stats_for("ABC CORP").count == 1
+
+
+def test_check_flags_outlier_after_min_samples(model):
+    for i in range(4):
+        model.update("ABC Corp", 100 + i, f"INV-{i}")
+    assert model.check("ABC Corp", 5000) is None
+    model.update("ABC Corp", 104, "INV-4")
+    outlier = model.check("ABC Corp", 5000)
+    assert outlier["sample_size"] == 5
+    assert outlier["z_score"] > 3.0
+    assert model.check("ABC Corp", 103) is None
+    assert model.check("Other Ltd", 5000) is None
+
+
+def test_flush_persists_and_reloads(model, tmp_path):
+    for i in range(10):
+        model.update("ABC Corp", 100 + i, f"INV-{i}")
+    model.flush()
+    reloaded = VendorAmountModel(model.state_file, min_samples=5)
+    assert reloaded.counted_invoices == model.counted_invoices
+    assert reloaded.stats_for("ABC Corp").mean == pytest.approx(model.stats_for("ABC Corp").mean)
+    assert not reloaded.update("ABC Corp", 500, "INV-3")
+
+
+def test_loads_legacy_state_without_invoice_numbers(tmp_path):
+    stats = VendorAmountStats()
+    for value in [100.0, 110.0, 120.0]:
+        stats.add(value)
+    state_file = tmp_path / "vendor_stats.json"
+    state_file.write_text(json.dumps({"abc corp": stats.to_state()}))
+    model = VendorAmountModel(str(state_file))
+    assert model.stats_for("ABC Corp").count == 3
+    assert model.counted_invoices == set()
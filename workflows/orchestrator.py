@@ -4,16 +4,19 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from dotenv import load_dotenv
 import logging
 import asyncio
-import json
-from pathlib import Path
 import uuid
 from datetime import datetime  # Add this import
 from config.logging_config import logger  # Import singleton logger
-from config.monitoring import Monitoring  # Import Monitoring class
+from config.monitoring import Monitoring, Deadline, DeadlineExceeded
 from agents.extractor_agent import InvoiceExtractionAgent
 from agents.validator_agent import InvoiceValidationAgent
 from agents.matching_agent import PurchaseOrderMatchingAgent
 from agents.human_review_agent import HumanReviewAgent
+from data_processing.anomaly_store import AnomalyStore
+from data_processing.rag_corrections import CorrectionIndexer
+from data_processing.document_store import DocumentStore
+from data_processing.invoice_store import get_invoice_store
+from config.settings import CONFIDENCE_THRESHOLD, INVOICE_DEADLINE_SECONDS
 
 load_dotenv()  # Load environment variables from .env
 
@@ -24,25 +27,42 @@ class InvoiceProcessingWorkflow:
         self.validation_agent = InvoiceValidationAgent()
         self.matching_agent = PurchaseOrderMatchingAgent()
         self.review_agent = HumanReviewAgent()
+        self.invoice_store = get_invoice_store()
+        # Vendor statistics are written together with the invoices they were computed from
+        self.invoice_store.add_flush_listener(self.validation_agent.anomaly_detector.vendor_model.flush)
+        self.anomaly_store = AnomalyStore()
+        self.document_store = DocumentStore()
+        self.correction_indexer = CorrectionIndexer(self.extraction_agent.rag_index)
+        self.correction_indexer.start()
 
-    async def _retry_with_backoff(self, func, max_retries=3, base_delay=1):
+    async def _retry_with_backoff(self, func, max_retries=3, base_delay=1, deadline: Deadline = None, stage="stage"):
+        """Retry `func` with exponential backoff. With a deadline every attempt is cancelled when
+        the budget runs out, and no retry is started that could not finish within it."""
         logger.debug(f"Starting retry mechanism with max_retries={max_retries}, base_delay={base_delay}")
+        deadline = deadline or Deadline(None)
         for attempt in range(max_retries):
             try:
-                result = await func()
+                result = await deadline.run(func(), stage)
                 logger.debug(f"Retry attempt {attempt + 1} succeeded")
                 return result
+            except DeadlineExceeded:
+                raise
             except Exception as e:
                 if attempt == max_retries - 1:
                     logger.error(f"All {max_retries} retries failed: {str(e)}")
                     raise
                 delay = base_delay * (2 ** attempt)
+                if deadline.cap(delay) < delay:
+                    logger.warning(f"Attempt {attempt + 1} failed: {str(e)}. No budget left to retry {stage}")
+                    raise DeadlineExceeded(stage, deadline) from e
                 logger.warning(f"Attempt {attempt + 1} failed: {str(e)}. Retrying in {delay}s...")
                 await asyncio.sleep(delay)
 
-    async def process_invoice(self, document_path: str) -> dict:
+    async def process_invoice(self, document_path: str, deadline: Deadline = None) -> dict:
         logger.info(f"Starting invoice processing for: {document_path}")
         logger.debug(f"Processing pipeline initiated for document: {document_path}")
+        deadline = deadline or Deadline(INVOICE_DEADLINE_SECONDS)
+        extracted_dict = {"original_path": document_path}
 
         monitoring = Monitoring()
         extraction_time = None
@@ -52,7 +72,8 @@ class InvoiceProcessingWorkflow:
 
         try:
             with monitoring.timer("extraction") as timer:
-                extracted_data = await self._retry_with_backoff(lambda: self.extraction_agent.run(document_path))
+                extracted_data = await self._retry_with_backoff(
+                    lambda: self.extraction_agent.run(document_path, deadline), deadline=deadline, stage="extraction")
                 logger.info(f"Extraction completed: {extracted_data}")
             extraction_time = timer.duration  # Moved outside the with block
             
@@ -72,8 +93,17 @@ class InvoiceProcessingWorkflow:
                 "extraction_time": extraction_time,
                 "original_path": document_path
             }
+            if extracted_data.extraction_mode:
+                extracted_dict["extraction_mode"] = extracted_data.extraction_mode
+            if extracted_data.prompt_tokens is not None:
+                extracted_dict["prompt_tokens"] = extracted_data.prompt_tokens
+                extracted_dict["completion_tokens"] = extracted_data.completion_tokens
+            if extracted_data.ocr_pages:
+                extracted_dict["ocr_pages"] = extracted_data.ocr_pages
             # Save initial extraction data
             self._save_invoice_entry(extracted_dict)
+        except DeadlineExceeded as e:
+            return self._route_timed_out(extracted_dict, e, deadline)
         except Exception as e:
             logger.error(f"Extraction failed after retries: {str(e)}")
             invoice_entry = {
@@ -88,7 +118,7 @@ class InvoiceProcessingWorkflow:
                 "review_time": 0.0,
                 "total_time": extraction_time or 0.0
             }
-            self._save_invoice_entry(invoice_entry)
+            self._save_invoice_entry(invoice_entry, final=True)
             return invoice_entry
 
         try:
@@ -96,7 +126,8 @@ class InvoiceProcessingWorkflow:
             logger.debug(f"Validation input data: {extracted_data.model_dump()}")
             
             with monitoring.timer("validation") as timer:
-                validation_result = await self._retry_with_backoff(lambda: self.validation_agent.run(extracted_data))
+                validation_result = await self._retry_with_backoff(
+                    lambda: self.validation_agent.run(extracted_data), deadline=deadline, stage="validation")
                 logger.info(f"Validation completed for invoice: {extracted_data.invoice_number}")
             validation_time = timer.duration  # Moved outside the with block
             logger.debug(f"Validation result: {validation_result.model_dump()}, time: {validation_time:.2f}s")
@@ -109,6 +140,8 @@ class InvoiceProcessingWorkflow:
                 "status": "validated"
             })
             self._save_invoice_entry(extracted_dict)
+        except DeadlineExceeded as e:
+            return self._route_timed_out(extracted_dict, e, deadline)
         except Exception as e:
             logger.error(f"Validation failed after retries for invoice {extracted_data.invoice_number}: {str(e)}")
             invoice_entry = {
@@ -121,7 +154,7 @@ class InvoiceProcessingWorkflow:
                 "review_time": 0.0,
                 "total_time": (extraction_time or 0.0) + (validation_time or 0.0)
             }
-            self._save_invoice_entry(invoice_entry)
+            self._save_invoice_entry(invoice_entry, final=True)
             return invoice_entry
 
         try:
@@ -129,7 +162,8 @@ class InvoiceProcessingWorkflow:
             logger.debug(f"Matching input data: {extracted_data.model_dump()}")
             
             with monitoring.timer("matching") as timer:
-                matching_result = await self._retry_with_backoff(lambda: self.matching_agent.run(extracted_data))
+                matching_result = await self._retry_with_backoff(
+                    lambda: self.matching_agent.run(extracted_data), deadline=deadline, stage="matching")
                 logger.info(f"Matching completed for invoice: {extracted_data.invoice_number}")
             matching_time = timer.duration  # Moved outside the with block
             logger.debug(f"Matching result: {matching_result}, time: {matching_time:.2f}s")
@@ -137,10 +171,15 @@ class InvoiceProcessingWorkflow:
             # Update and save after matching
             extracted_dict.update({
                 "matching_status": matching_result["status"],
+                "match_tier": matching_result.get("match_tier"),
+                "matched_po_number": matching_result.get("po_number"),
+                "po_vendor_mismatch": matching_result.get("po_vendor_mismatch"),
                 "matching_time": matching_time,
                 "status": "matched"
             })
             self._save_invoice_entry(extracted_dict)
+        except DeadlineExceeded as e:
+            return self._route_timed_out(extracted_dict, e, deadline)
         except Exception as e:
             logger.error(f"Matching failed after retries for invoice {extracted_data.invoice_number}: {str(e)}")
             invoice_entry = {
@@ -155,13 +194,14 @@ class InvoiceProcessingWorkflow:
                 "review_time": 0.0,
                 "total_time": (extraction_time or 0.0) + (validation_time or 0.0) + (matching_time or 0.0)
             }
-            self._save_invoice_entry(invoice_entry)
+            self._save_invoice_entry(invoice_entry, final=True)
             return invoice_entry
 
         try:
             logger.info(f"Starting review for invoice: {extracted_data.invoice_number}")
             with monitoring.timer("review") as timer:
-                review_result = await self._retry_with_backoff(lambda: self.review_agent.run(extracted_data, validation_result))
+                review_result = await self._retry_with_backoff(
+                    lambda: self.review_agent.run(extracted_data, validation_result), deadline=deadline, stage="review")
                 logger.info(f"Review completed for invoice: {extracted_data.invoice_number}")
             review_time = timer.duration  # Moved outside the with block
             logger.debug(f"Review result: {review_result}, time: {review_time:.2f}s")
@@ -173,13 +213,21 @@ class InvoiceProcessingWorkflow:
                          (review_time or 0.0))
             
             # Update and save after review
+            review_status = review_result.get("status", "unknown")
+            if extracted_dict.get("po_vendor_mismatch") and review_status == "approved":
+                # The quoted PO belongs to another vendor; a person has to confirm it
+                review_status = "needs_review"
             extracted_dict.update({
-                "review_status": review_result.get("status", "unknown"),
+                "review_status": review_status,
                 "review_time": review_time,
                 "status": "completed",
                 "total_time": total_time
             })
-            self._save_invoice_entry(extracted_dict)
+            # Counted before the commit so the store's next flush also persists the statistics
+            self._update_vendor_stats(extracted_data, validation_result)
+            self._save_invoice_entry(extracted_dict, final=True)
+        except DeadlineExceeded as e:
+            return self._route_timed_out(extracted_dict, e, deadline)
         except Exception as e:
             logger.error(f"Review failed after retries for invoice {extracted_data.invoice_number}: {str(e)}")
             invoice_entry = {
@@ -197,7 +245,7 @@ class InvoiceProcessingWorkflow:
                              (matching_time or 0.0) +
                              (review_time or 0.0))
             }
-            self._save_invoice_entry(invoice_entry)
+            self._save_invoice_entry(invoice_entry, final=True)
             return invoice_entry
 
         result = {
@@ -215,108 +263,83 @@ class InvoiceProcessingWorkflow:
         logger.debug(f"Final result: {result}")
         return result
 
-    def _save_invoice_entry(self, invoice_entry, output_file="data/processed/structured_invoices.json"):
+    def _route_timed_out(self, invoice_entry: dict, error: DeadlineExceeded, deadline: Deadline) -> dict:
+        """Finish an invoice whose budget ran out: keep what the completed stages produced and
+        send it to review."""
+        logger.warning(f"{invoice_entry.get('invoice_number') or invoice_entry.get('original_path')}: {str(error)}")
+        invoice_entry = {
+            **invoice_entry,
+            "status": "deadline_exceeded",
+            "review_status": "needs_review",
+            "error_message": str(error),
+            "deadline_stage": error.stage,
+            "deadline_seconds": deadline.budget,
+            "total_time": round(error.elapsed, 3)
+        }
+        self._save_invoice_entry(invoice_entry, final=True)
+        return invoice_entry
+
+    def _update_vendor_stats(self, invoice_data, validation_result):
+        """Feed a completed invoice into the per-vendor amount model (outliers and repeats are left out)."""
+        if "vendor_amount_outlier" in validation_result.errors.get("anomalies", {}):
+            return
+        try:
+            vendor_model = self.validation_agent.anomaly_detector.vendor_model
+            vendor_model.update(invoice_data.vendor_name, invoice_data.total_amount, invoice_data.invoice_number)
+        except Exception as e:
+            logger.warning(f"Failed to update vendor amount statistics: {str(e)}")
+
+    @staticmethod
+    def _anomaly_reasons(invoice_entry) -> list:
+        """Reasons an invoice entry should be queued as an anomaly (empty if none)."""
+        if not (invoice_entry.get("review_status") == "needs_review" or
+                invoice_entry.get("validation_status") == "failed" or
+                invoice_entry.get("confidence", 1.0) < CONFIDENCE_THRESHOLD or
+                invoice_entry.get("validation_errors") or
+                invoice_entry.get("status") in ("error", "deadline_exceeded")):
+            return []
+        reasons = []
+        if invoice_entry.get("confidence", 1.0) < CONFIDENCE_THRESHOLD:
+            reasons.append("Low confidence")
+        if invoice_entry.get("validation_status") == "failed":
+            reasons.append("Validation failed")
+        # Anything matching the criteria above is flagged for review
+        reasons.append("Needs review")
+        if invoice_entry.get("status") == "deadline_exceeded":
+            reasons.append(f"Deadline exceeded during {invoice_entry.get('deadline_stage')}")
+        if invoice_entry.get("status") == "error":
+            reasons.append(f"Processing error: {invoice_entry.get('message', 'Unknown error')}")
+        return reasons
+
+    def _save_invoice_entry(self, invoice_entry, final: bool = False):
+        """Record a stage result. Intermediate stages stay in memory; the final record of each
+        invoice is committed once (group-flushed by the store) and checked for anomalies."""
         try:
-            os.makedirs("data/processed", exist_ok=True)
-            
-            # Load existing data or initialize
-            try:
-                if os.path.exists(output_file):
-                    with open(output_file, "r") as f:
-                        all_invoices = json.load(f)
-                else:
-                    all_invoices = []
-            except (FileNotFoundError, json.JSONDecodeError):
-                logger.warning(f"Invalid or missing JSON in {output_file}, starting fresh")
-                all_invoices = []
-            
             # Add essential fields if missing
             if not invoice_entry.get("processed_time"):
                 invoice_entry["processed_time"] = datetime.now().isoformat()
-            
-            # Update existing entry or add new one
+
             invoice_number = invoice_entry.get("invoice_number")
             if not invoice_number:
                 logger.warning("Invoice entry missing invoice_number, generating temporary ID")
                 invoice_number = f"TEMP_{uuid.uuid4()}"
                 invoice_entry["invoice_number"] = invoice_number
 
-            # Find and update existing entry or append new one
-            updated = False
-            for i, inv in enumerate(all_invoices):
-                if inv.get("invoice_number") == invoice_number:
-                    # Preserve original_path from existing entry if not in new data
-                    if "original_path" in inv and "original_path" not in invoice_entry:
-                        invoice_entry["original_path"] = inv["original_path"]
-                    all_invoices[i] = invoice_entry
-                    updated = True
-                    logger.info(f"Updated existing invoice entry: {invoice_number}")
-                    break
-            
-            if not updated:
-                all_invoices.append(invoice_entry)
-                logger.info(f"Added new invoice entry: {invoice_number}")
-            
-            # Write updated data back to file
-            with open(output_file, "w") as f:
-                json.dump(all_invoices, f, indent=4)
-            logger.info(f"Successfully saved invoice data to {output_file}")
-            
-            # Save to anomalies.json if meets any anomaly criteria
-            anomalies_file = "data/processed/anomalies.json"
-            if (invoice_entry.get("review_status") == "needs_review" or 
-                invoice_entry.get("validation_status") == "failed" or
-                invoice_entry.get("confidence", 1.0) < 0.8 or
-                invoice_entry.get("validation_errors") or
-                invoice_entry.get("status") == "error"):
-                
+            if not final:
+                self.invoice_store.stage(invoice_entry)
+                return
+
+            # Record an anomaly (by reference) if the entry meets any anomaly criteria
+            reasons = self._anomaly_reasons(invoice_entry)
+            if reasons:
                 # Ensure flagged status for review when anomaly is detected
                 invoice_entry["review_status"] = "needs_review"
-                
-                try:
-                    if os.path.exists(anomalies_file):
-                        with open(anomalies_file, "r") as f:
-                            anomalies = json.load(f)
-                    else:
-                        anomalies = []
-                except (FileNotFoundError, json.JSONDecodeError):
-                    anomalies = []
-                
-                # Determine anomaly reason(s)
-                reasons = []
-                if invoice_entry.get("confidence", 1.0) < 0.8:
-                    reasons.append("Low confidence")
-                if invoice_entry.get("validation_status") == "failed":
-                    reasons.append("Validation failed")
-                if invoice_entry.get("review_status") == "needs_review":
-                    reasons.append("Needs review")
-                if invoice_entry.get("status") == "error":
-                    reasons.append(f"Processing error: {invoice_entry.get('message', 'Unknown error')}")
-                
-                # Create anomaly entry with detailed information
-                anomaly_entry = {
-                    **invoice_entry,
-                    "anomaly_reasons": reasons,
-                    "detection_time": str(datetime.now().isoformat()),
-                    "resolved": False
-                }
-                
-                # Update existing or add new
-                invoice_number = invoice_entry.get("invoice_number")
-                existing_idx = next((i for i, a in enumerate(anomalies) 
-                                  if a.get("invoice_number") == invoice_number), None)
-                
-                if existing_idx is not None:
-                    anomalies[existing_idx] = anomaly_entry
-                    logger.info(f"Updated existing anomaly for invoice {invoice_number}")
-                else:
-                    anomalies.append(anomaly_entry)
-                    logger.info(f"Added new anomaly for invoice {invoice_number}")
-                
-                with open(anomalies_file, "w") as f:
-                    json.dump(anomalies, f, indent=4)
-                logger.info(f"Saved anomaly to {anomalies_file}")
-                
+            record = self.invoice_store.commit(invoice_entry)
+            logger.info(f"Committed invoice entry: {invoice_number}")
+            if reasons:
+                self.anomaly_store.record(invoice_number, reasons)
+            self.document_store.link(invoice_number, record.get("original_path"))
+
         except Exception as e:
             logger.error(f"Failed to save invoice entry: {str(e)}", exc_info=True)
 
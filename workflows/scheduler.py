@@ -0,0 +1,190 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import asyncio
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Callable, Dict, Any, Optional, List
+from config.logging_config import logger
+from config.settings import SCHEDULER_WORKERS, SCHEDULER_LANE_WEIGHTS, SCHEDULER_INTERACTIVE_RESERVED
+
+JOB_HISTORY = 10000  # finished jobs (and batches) kept for status polling
+DURATION_SMOOTHING = 0.2  # EWMA weight of the latest job in avg_job_seconds
+LANES = ("interactive", "bulk", "reprocess")
+
+
+def parse_lane_weights(spec: str) -> Dict[str, float]:
+    """'interactive=8,bulk=2,reprocess=1' -> weights; unknown lanes are rejected, missing ones get 1."""
+    weights = {lane: 1.0 for lane in LANES}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        lane, _, weight = part.partition("=")
+        if lane.strip() not in weights:
+            raise ValueError(f"Unknown scheduler lane '{lane.strip()}' (expected one of {', '.join(LANES)})")
+        weights[lane.strip()] = max(float(weight), 0.01)
+    return weights
+
+
+class ProcessingScheduler:
+    """Runs workflow.process_invoice for queued documents on a fixed pool of asyncio workers.
+
+    Jobs wait in one FIFO lane per priority class. Free workers pick between non-empty lanes by
+    stride scheduling, so each lane gets worker slots in proportion to its weight, and
+    `interactive_reserved` workers never take bulk or reprocess jobs: a single upload starts
+    immediately even while a month-end batch fills every other worker.
+    """
+
+    def __init__(self, workflow, workers: int = SCHEDULER_WORKERS, weights: Optional[Dict[str, float]] = None,
+                 interactive_reserved: int = SCHEDULER_INTERACTIVE_RESERVED):
+        self.workflow = workflow
+        self.workers = workers
+        self.weights = weights or parse_lane_weights(SCHEDULER_LANE_WEIGHTS)
+        self.interactive_reserved = min(max(interactive_reserved, 0), workers - 1)
+        self._lanes: Dict[str, deque] = {lane: deque() for lane in LANES}
+        self._pass: Dict[str, float] = {lane: 0.0 for lane in LANES}
+        self._last_pass = 0.0
+        self._wakeup: Optional[asyncio.Event] = None
+        self.running_by_lane: Dict[str, int] = {lane: 0 for lane in LANES}
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self.batches: Dict[str, Dict[str, Any]] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._finished = deque()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.running = 0
+        self.avg_job_seconds = 0.0
+
+    def start(self):
+        """Start the workers on the running event loop (call from application startup)."""
+        if self._tasks:
+            return
+        self.loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info(f"Started processing scheduler with {self.workers} workers")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, document_path: str, source: str = "api", filename: Optional[str] = None,
+               lane: str = "bulk") -> Dict[str, Any]:
+        """Queue a document in a lane; returns its job record (poll `jobs[job_id]` or await `job['future']`)."""
+        if lane not in self._lanes:
+            raise ValueError(f"Unknown scheduler lane '{lane}'")
+        job_id = str(uuid.uuid4())
+        job = {
+            "job_id": job_id,
+            "document_path": document_path,
+            "filename": filename or os.path.basename(document_path),
+            "source": source,
+            "lane": lane,
+            "status": "queued",
+            "queued_time": datetime.now().isoformat(),
+            "future": self.loop.create_future()
+        }
+        self.jobs[job_id] = job
+        if not self._lanes[lane]:
+            # An idle lane rejoins at the current pass instead of cashing in credit from its idle time
+            self._pass[lane] = max(self._pass[lane], self._last_pass)
+        self._lanes[lane].append(job)
+        self._wakeup.set()
+        logger.info(f"Queued {document_path} from {source} in {lane} lane (queue depth {self.depth()})")
+        return job
+
+    def submit_batch(self, documents: List[Dict[str, str]], source: str = "bulk", lane: str = "bulk") -> Dict[str, Any]:
+        """Queue several documents ({'path', 'filename'}) under one batch id."""
+        batch_id = str(uuid.uuid4())
+        job_ids = [self.submit(doc["path"], source, doc.get("filename"), lane)["job_id"] for doc in documents]
+        self.batches[batch_id] = {"batch_id": batch_id, "created_time": datetime.now().isoformat(), "job_ids": job_ids}
+        while len(self.batches) > JOB_HISTORY:
+            self.batches.pop(next(iter(self.batches)))
+        return self.batch_status(batch_id)
+
+    def batch_status(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        batch = self.batches.get(batch_id)
+        if batch is None:
+            return None
+        jobs = [self.job_status(job_id) or {"job_id": job_id, "status": "expired"} for job_id in batch["job_ids"]]
+        counts: Dict[str, int] = {}
+        for job in jobs:
+            counts[job["status"]] = counts.get(job["status"], 0) + 1
+        finished = sum(counts.get(status, 0) for status in ("done", "failed", "expired"))
+        return {
+            "batch_id": batch_id,
+            "created_time": batch["created_time"],
+            "total": len(jobs),
+            "counts": counts,
+            "complete": finished == len(jobs),
+            "jobs": [{k: job.get(k) for k in ("job_id", "filename", "status", "invoice_number", "error")} for job in jobs]
+        }
+
+    def submit_threadsafe(self, document_path: str, source: str, lane: str = "bulk",
+                          on_done: Optional[Callable[[asyncio.Future], None]] = None):
+        """Queue a document from another thread (e.g. the directory watcher). `on_done` is added
+        to the job's future and runs on the event loop when the job finishes."""
+        def submit():
+            job = self.submit(document_path, source, lane=lane)
+            if on_done is not None:
+                job["future"].add_done_callback(on_done)
+        self.loop.call_soon_threadsafe(submit)
+
+    def job_status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self.jobs.get(job_id)
+        return {k: v for k, v in job.items() if k != "future"} if job else None
+
+    def depth(self) -> int:
+        return sum(len(queue) for queue in self._lanes.values())
+
+    def lane_status(self) -> Dict[str, Dict[str, Any]]:
+        return {lane: {"queued": len(self._lanes[lane]), "running": self.running_by_lane[lane],
+                       "weight": self.weights[lane]} for lane in LANES}
+
+    def _next_job(self) -> Optional[Dict[str, Any]]:
+        """Pop the next job by stride scheduling, honouring the interactive reservation."""
+        background_running = self.running - self.running_by_lane["interactive"]
+        background_allowed = background_running < self.workers - self.interactive_reserved
+        eligible = [lane for lane in LANES if self._lanes[lane] and (lane == "interactive" or background_allowed)]
+        if not eligible:
+            return None
+        lane = min(eligible, key=lambda l: self._pass[l])
+        self._last_pass = self._pass[lane]
+        self._pass[lane] += 1.0 / self.weights[lane]
+        return self._lanes[lane].popleft()
+
+    async def _worker(self, worker_id: int):
+        while True:
+            job = self._next_job()
+            if job is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            job["status"] = "running"
+            job["start_time"] = datetime.now().isoformat()
+            started = self.loop.time()
+            self.running += 1
+            self.running_by_lane[job["lane"]] += 1
+            try:
+                result = await self.workflow.process_invoice(job["document_path"])
+                job["status"] = "done"
+                job["invoice_number"] = (result.get("extracted_data") or result).get("invoice_number")
+                job["future"].set_result(result)
+            except Exception as e:
+                logger.error(f"Scheduled processing of {job['document_path']} failed: {str(e)}")
+                job["status"] = "failed"
+                job["error"] = str(e)
+                job["future"].set_exception(e)
+                job["future"].exception()  # mark retrieved; callers that await still see it
+            finally:
+                self.running -= 1
+                self.running_by_lane[job["lane"]] -= 1
+                job["end_time"] = datetime.now().isoformat()
+                elapsed = self.loop.time() - started
+                self.avg_job_seconds = elapsed if not self.avg_job_seconds else \
+                    (1 - DURATION_SMOOTHING) * self.avg_job_seconds + DURATION_SMOOTHING * elapsed
+                self._finished.append(job["job_id"])
+                while len(self._finished) > JOB_HISTORY:
+                    self.jobs.pop(self._finished.popleft(), None)
+                # A freed slot may unblock background lanes held back by the reservation
+                self._wakeup.set()
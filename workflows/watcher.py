@@ -0,0 +1,266 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import hashlib
+import json
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple
+from config.logging_config import logger
+from data_processing.document_store import DOCUMENT_EXTENSIONS, document_suffix
+from config.settings import (
+    RAW_INVOICES_DIR, WATCH_POLL_SECONDS, WATCH_DEBOUNCE_SECONDS, WATCH_STATE_FILE
+)
+
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:  # optional: non-Linux hosts or not installed
+    INotify = None
+
+
+def file_digest(path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def job_succeeded(result: Dict[str, Any]) -> bool:
+    """Whether workflow.process_invoice produced a usable result (not an error or timeout entry)."""
+    entry = result.get("extracted_data") or result
+    return entry.get("status") not in ("error", "deadline_exceeded") and \
+        not any(key in entry for key in ("matching_error", "review_error"))
+
+
+class InvoiceDirectoryWatcher:
+    """Queues documents that appear in data/raw/invoices, once per distinct content.
+
+    Uses inotify (close-write and moved-in events) when inotify_simple is available on Linux and
+    falls back to polling the directory listing. A candidate is only hashed once its size and
+    mtime have been stable for the debounce period, so half-copied files are never queued.
+
+    Content already processed, whether it came through this directory or was uploaded into the
+    DocumentStore, is skipped. A digest only counts as processed once its job succeeded; a failed
+    file is retried when it changes, on the next start, or by an explicit rescan
+    (`unprocessed_documents`). Known file stats and digests are persisted; on the very first start
+    the files already in the directory are recorded as a baseline instead of being processed.
+    """
+
+    def __init__(self, scheduler, directory: str = RAW_INVOICES_DIR, state_file: str = WATCH_STATE_FILE,
+                 poll_interval: float = WATCH_POLL_SECONDS, debounce: float = WATCH_DEBOUNCE_SECONDS,
+                 document_store=None):
+        self.scheduler = scheduler
+        self.document_store = document_store
+        self.directory = directory
+        self.state_file = state_file
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self._files: Dict[str, list] = {}  # name -> [size, mtime_ns, digest]
+        self._digests: set = set()  # successfully processed
+        self._in_flight: set = set()  # queued or running
+        self._lock = threading.RLock()  # job callbacks and rescans run on the event loop thread
+        self._state_loaded = False
+        self._pending: Dict[str, Tuple[Tuple[int, int], float]] = {}  # name -> (stat, stable since)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.mode = "inotify" if INotify is not None and sys.platform.startswith("linux") else "polling"
+        self.stats = {"queued": 0, "duplicates": 0, "mode": self.mode}
+
+    def _load_state(self) -> bool:
+        try:
+            with open(self.state_file, "r") as f:
+                state = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return False
+        self._files = state.get("files", {})
+        self._digests = set(state.get("digests", []))
+        return True
+
+    def _save_state(self):
+        with self._lock:
+            state = {"files": dict(self._files), "digests": sorted(self._digests)}
+        os.makedirs(os.path.dirname(self.state_file) or ".", exist_ok=True)
+        tmp_path = f"{self.state_file}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_file)
+
+    def _is_known(self, name: str, digest: str) -> bool:
+        """Processed (or being processed) already, via this directory or an upload."""
+        if digest in self._digests or digest in self._in_flight:
+            return True
+        return self.document_store is not None and \
+            self.document_store.is_processed(digest, document_suffix(name) or ".pdf")
+
+    def _digest(self, name: str, stat: Tuple[int, int]) -> str:
+        """Content digest, reusing the recorded one while size and mtime are unchanged."""
+        known = self._files.get(name)
+        if known and (known[0], known[1]) == stat:
+            return known[2]
+        digest = file_digest(os.path.join(self.directory, name))
+        self._files[name] = [stat[0], stat[1], digest]
+        return digest
+
+    def track(self, digest: str):
+        """Mark a queued digest as in flight; returns the done-callback for its job's future."""
+        with self._lock:
+            self._in_flight.add(digest)
+        return lambda future: self._job_finished(digest, future)
+
+    def _job_finished(self, digest: str, future):
+        succeeded = not future.cancelled() and future.exception() is None and job_succeeded(future.result())
+        with self._lock:
+            self._in_flight.discard(digest)
+            if succeeded:
+                self._digests.add(digest)
+        if succeeded:
+            self._save_state()
+        else:
+            logger.warning(f"Watcher: processing of document {digest[:12]} failed; it will be retried on change or rescan")
+
+    def unprocessed_documents(self) -> List[Dict[str, str]]:
+        """Documents in the directory whose content has not been processed, as {'path', 'digest'}.
+
+        Only new or changed files are hashed. Call `track` for each one that gets queued.
+        """
+        documents = []
+        with self._lock:
+            if not self._state_loaded:  # rescans also work while the watcher itself is disabled
+                self._load_state()
+                self._state_loaded = True
+            for name in sorted(os.listdir(self.directory)):
+                stat = self._stat(name) if self._is_document(name) else None
+                if stat is None:
+                    continue
+                digest = self._digest(name, stat)
+                if not self._is_known(name, digest) and digest not in {d["digest"] for d in documents}:
+                    documents.append({"path": os.path.join(self.directory, name), "digest": digest})
+        self._save_state()
+        return documents
+
+    @staticmethod
+    def _is_document(name: str) -> bool:
+        return not name.startswith(".") and name.lower().endswith(DOCUMENT_EXTENSIONS)
+
+    def _stat(self, name: str) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(os.path.join(self.directory, name))
+            return stat.st_size, stat.st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _baseline(self):
+        """First start: remember what is already there without processing it."""
+        for name in os.listdir(self.directory):
+            stat = self._stat(name) if self._is_document(name) else None
+            if stat:
+                digest = file_digest(os.path.join(self.directory, name))
+                self._files[name] = [stat[0], stat[1], digest]
+                self._digests.add(digest)
+        self._save_state()
+        logger.info(f"Watcher baseline: {len(self._files)} existing documents in {self.directory} will not be reprocessed")
+
+    def _observe(self, name: str):
+        """A file was created, written or moved in; (re)start its debounce window."""
+        if not self._is_document(name):
+            return
+        stat = self._stat(name)
+        if stat is None:
+            self._pending.pop(name, None)
+            return
+        known = self._files.get(name)
+        if known and (known[0], known[1]) == stat:
+            return
+        previous = self._pending.get(name)
+        if previous is None or previous[0] != stat:
+            self._pending[name] = (stat, time.monotonic())
+
+    def _scan(self):
+        """Directory listing diff: O(files) stat calls, hashing only new or changed files."""
+        for name in os.listdir(self.directory):
+            self._observe(name)
+
+    def _settle(self):
+        """Queue pending files whose size and mtime stopped changing."""
+        now = time.monotonic()
+        changed = False
+        for name, (stat, since) in list(self._pending.items()):
+            current = self._stat(name)
+            if current != stat:
+                if current is None:
+                    del self._pending[name]
+                else:
+                    self._pending[name] = (current, now)
+                continue
+            if now - since < self.debounce:
+                continue
+            del self._pending[name]
+            with self._lock:
+                digest = self._digest(name, stat)
+                changed = True
+                if self._is_known(name, digest):
+                    self.stats["duplicates"] += 1
+                    logger.info(f"Watcher: {name} has the same content as an already processed document, skipping")
+                    continue
+                on_done = self.track(digest)
+            self.stats["queued"] += 1
+            self.scheduler.submit_threadsafe(os.path.join(self.directory, name), "watcher", on_done=on_done)
+        if changed:
+            self._save_state()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        if not self._state_loaded:
+            if not self._load_state():
+                self._baseline()
+            self._state_loaded = True
+        # Files whose processing never succeeded are picked up again by the first scan
+        self._files = {name: known for name, known in self._files.items() if known[2] in self._digests}
+        self._thread = threading.Thread(target=self._run, name="invoice-watcher", daemon=True)
+        self._thread.start()
+        logger.info(f"Watching {self.directory} for new invoices ({self.mode})")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        # Files that arrived while the service was down
+        self._scan()
+        if self.mode == "inotify":
+            self._run_inotify()
+        else:
+            self._run_polling()
+
+    def _run_polling(self):
+        while not self._stop.is_set():
+            try:
+                self._scan()
+                self._settle()
+            except Exception as e:
+                logger.error(f"Watcher scan failed: {str(e)}")
+            self._stop.wait(min(self.poll_interval, self.debounce) if self._pending else self.poll_interval)
+
+    def _run_inotify(self):
+        inotify = INotify()
+        inotify.add_watch(self.directory, inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO | inotify_flags.CREATE)
+        try:
+            while not self._stop.is_set():
+                timeout = self.debounce if self._pending else self.poll_interval
+                try:
+                    for event in inotify.read(timeout=int(timeout * 1000)):
+                        self._observe(event.name)
+                    self._settle()
+                except Exception as e:
+                    logger.error(f"Watcher event handling failed: {str(e)}")
+        finally:
+            inotify.close()
+
+    def status(self) -> Dict[str, Any]:
+        return {**self.stats, "pending": len(self._pending), "in_flight": len(self._in_flight),
+                "known_documents": len(self._digests)}